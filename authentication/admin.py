@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser,Block
+from .models import CustomUser, Block, OutboundEmail
 
 
 class CustomUserAdmin(admin.ModelAdmin):
@@ -15,4 +15,12 @@ class BlockAdmin(admin.ModelAdmin):
     readonly_fields = ('timestamp',)
 
 
-admin.site.register(Block, BlockAdmin)
\ No newline at end of file
+admin.site.register(Block, BlockAdmin)
+
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'to', 'state', 'attempts', 'run_after', 'created_at')
+    list_filter = ('state',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
\ No newline at end of file
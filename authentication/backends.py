@@ -0,0 +1,70 @@
+'''
+Pooled Password Backend
+
+Password hashing is deliberately slow. Run on request threads, a burst of logins can take every CPU of a worker
+and stall the feed requests served next to them. This backend runs the hashing in a small per-process thread pool
+(PASSWORD_HASHING_WORKERS threads; the hashers release the GIL), so at most that many hashes run at once.
+Requests that can't get a slot within PASSWORD_HASHING_QUEUE_TIMEOUT seconds are turned away with 429.
+
+Database queries stay on the request thread. Hashes made with an outdated hasher or cost are upgraded after
+a successful login, like ModelBackend does.
+'''
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from rest_framework.exceptions import Throttled
+
+
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix='password-hashing')
+_slots = threading.BoundedSemaphore(settings.PASSWORD_HASHING_WORKERS + settings.PASSWORD_HASHING_QUEUE)
+
+
+def run_hashing(func, *args):
+    '''
+    Run a hashing function in the pool and wait for its result.
+    '''
+    if not _slots.acquire(timeout=settings.PASSWORD_HASHING_QUEUE_TIMEOUT):
+        raise Throttled(wait=1, detail='Too many logins in progress.')
+    try:
+        return _executor.submit(func, *args).result()
+    finally:
+        _slots.release()
+
+
+def must_rehash(encoded):
+    '''
+    Whether a stored hash was made with another hasher than the preferred one, or with other parameters.
+    '''
+    preferred = get_hasher('default')
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+class PooledPasswordBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            # the profile is loaded along, for the login response and token claims
+            user = UserModel._default_manager.select_related('profile').get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # Hash anyway so unknown usernames take as long as wrong passwords
+            run_hashing(make_password, password)
+            return None
+
+        if not run_hashing(check_password, password, user.password) or not self.user_can_authenticate(user):
+            return None
+        if must_rehash(user.password):
+            user.password = run_hashing(make_password, password)
+            user.save(update_fields=['password'])
+        return user
@@ -0,0 +1,44 @@
+'''
+Block Relationship Service
+
+This module centralises the "who can't see whom" logic used by every feed and list view.
+
+Functions:
+    blocked_subquery(user, field): Returns an Exists() expression matching blocks between `user` and the row's user.
+    exclude_blocked(queryset, user, field): Filters a queryset with a single NOT EXISTS subquery against Block.
+
+Usage:
+    Views filter querysets with `exclude_blocked` so the database does the anti-join in one statement:
+
+        queryset = exclude_blocked(Post.objects.all(), request.user, field='user')
+
+    The subquery reads the Block table on every request, so a block or unblock applies to every worker as
+    soon as it commits. Both directions are lookups on the unique (blocker, blocked) index, so users who block
+    nobody pay two index probes per row and no extra query.
+'''
+
+from django.db.models import Exists, OuterRef, Q
+from .models import Block
+
+
+def blocked_subquery(user, field='user'):
+    '''
+    Return an Exists() expression that is true when the row's `field` user and `user` block each other in either direction.
+    '''
+    return Exists(
+        Block.objects.filter(
+            Q(blocker_id=user.pk, blocked=OuterRef(field)) | Q(blocked_id=user.pk, blocker=OuterRef(field))
+        )
+    )
+
+
+def exclude_blocked(queryset, user, field='user'):
+    '''
+    Exclude rows whose `field` user is blocking, or blocked by, `user`.
+
+    Compiles to a single `NOT EXISTS (SELECT ... FROM authentication_block ...)` so the parameter list
+    stays constant no matter how many users are blocked. Anonymous users get the queryset unchanged.
+    '''
+    if not user or not user.is_authenticated:
+        return queryset
+    return queryset.filter(~blocked_subquery(user, field))
@@ -0,0 +1,34 @@
+'''
+Password Hashers
+
+Django's hashers with their cost parameters taken from settings, so the cost can be tuned per deployment
+(see `python manage.py benchmark_login`). They keep Django's algorithm names: hashes made with other
+parameters still verify, and are re-hashed with the current ones on the user's next login.
+
+The preferred hasher is chosen with the PASSWORD_HASHER environment variable (pbkdf2, argon2, scrypt or bcrypt).
+'''
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, BCryptSHA256PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher,
+)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    time_cost = settings.PASSWORD_ARGON2_TIME_COST
+    memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST
+    parallelism = settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    work_factor = settings.PASSWORD_SCRYPT_WORK_FACTOR
+    block_size = settings.PASSWORD_SCRYPT_BLOCK_SIZE
+    parallelism = settings.PASSWORD_SCRYPT_PARALLELISM
+
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    rounds = settings.PASSWORD_BCRYPT_ROUNDS
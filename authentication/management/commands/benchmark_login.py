@@ -0,0 +1,50 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = 'Measure password checks per second (the CPU cost of a login) for each configured hasher, total and per core'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasher', action='append', help='Algorithm to measure, e.g. argon2 (repeatable; default: all usable PASSWORD_HASHERS)')
+        parser.add_argument('--threads', type=int, default=settings.PASSWORD_HASHING_WORKERS, help='Concurrent checks (default: PASSWORD_HASHING_WORKERS)')
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each measurement')
+
+    def handle(self, *args, **options):
+        """
+        Entry point of the management command.
+        """
+        cores = min(options['threads'], os.cpu_count() or 1)
+        algorithms = options['hasher'] or [import_string(path).algorithm for path in settings.PASSWORD_HASHERS]
+        self.stdout.write(f"{options['threads']} thread(s) on {cores} core(s), {options['seconds']}s per hasher")
+
+        for algorithm in algorithms:
+            try:
+                encoded = make_password('benchmark-password', hasher=algorithm)
+            except ValueError as error:
+                self.stdout.write(self.style.WARNING(f'{algorithm}: skipped ({error})'))
+                continue
+            checks = self.measure(encoded, options['threads'], options['seconds'])
+            per_second = max(checks, 1) / options['seconds']
+            self.stdout.write(f'{algorithm}: {per_second:.1f} logins/s, {per_second / cores:.1f} logins/s per core, '
+                              f'{1000 * options["threads"] / per_second:.1f} ms per login')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def measure(self, encoded, threads, seconds):
+        deadline = time.monotonic() + seconds
+
+        def work():
+            checks = 0
+            while time.monotonic() < deadline:
+                check_password('benchmark-password', encoded)
+                checks += 1
+            return checks
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return sum(executor.map(lambda _: work(), range(threads)))
@@ -0,0 +1,71 @@
+import logging
+import smtplib
+import time
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from authentication.models import OutboundEmail
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run the mail worker: send queued emails in batches over a persistent SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit instead of polling forever')
+
+    def handle(self, *args, **options):
+        """
+        Entry point of the management command.
+        """
+        self.stdout.write('Mail worker started.')
+        connection = get_connection(fail_silently=False)
+        idle_since = None
+        try:
+            while True:
+                close_old_connections()
+                batch = OutboundEmail.claim_batch()
+                if not batch:
+                    if options['once']:
+                        break
+                    # Mail servers drop idle clients, so let go of the connection first
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > settings.MAIL_QUEUE_IDLE_DISCONNECT:
+                        connection.close()
+                    time.sleep(settings.MAIL_QUEUE_POLL_INTERVAL)
+                    continue
+
+                idle_since = None
+                sent = self.send_batch(connection, batch)
+                self.stdout.write(f'{sent} of {len(batch)} email(s) sent')
+        finally:
+            connection.close()
+
+        self.stdout.write(self.style.SUCCESS('Mail queue drained.'))
+
+    def send_batch(self, connection, batch):
+        sent = []
+        for email in batch:
+            try:
+                self.send(connection, email)
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning('Sending %s failed (attempt %s)', email, email.attempts + 1, exc_info=True)
+                email.retry_later(e)
+            else:
+                sent.append(email.id)
+        OutboundEmail.objects.filter(id__in=sent).delete()
+        return len(sent)
+
+    def send(self, connection, email):
+        # open() is a no-op while the connection is up; an open connection is not closed by send_messages
+        connection.open()
+        try:
+            connection.send_messages([email.message(connection)])
+        except smtplib.SMTPServerDisconnected:
+            # The server hung up since the last batch; reconnect once
+            connection.close()
+            connection.open()
+            connection.send_messages([email.message(connection)])
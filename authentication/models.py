@@ -28,14 +28,19 @@ Usage:
         AUTH_USER_MODEL = 'authentication.CustomUser'
 '''
 
-import random
+import secrets
+import uuid
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
+from django.core.exceptions import ValidationError
 from django.db import models
-from django.contrib.auth.hashers import make_password
+from django.db.models import F
+from django.contrib.auth.hashers import identify_hasher, is_password_usable, make_password
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from .managers import CustomUserManager
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
+from django.utils.crypto import constant_time_compare, salted_hmac
 
 
 class CustomUser(AbstractBaseUser, PermissionsMixin):
@@ -52,8 +57,6 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     date_joined = models.DateTimeField(auto_now_add=True)
     avatar = models.ImageField(upload_to='images/', default='images/avatar.jpeg', blank=True, null=True)
-    last_otp = models.CharField(max_length=6, blank=True, null=True)
-    otp_expiry = models.DateTimeField(blank=True, null=True)
     created_data = models.DateTimeField(auto_now_add=True)
     updated_data = models.DateTimeField(auto_now=True)
     objects = CustomUserManager()
@@ -73,18 +76,17 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         '''
         Save Method      
         The save method is overridden to incorporate password hashing using Django's make_password function. This is implemented to ensure hashing even in scenarios where it could otherwise fail.
+        Passwords already hashed by any of the PASSWORD_HASHERS are kept as they are.
         '''
-        if self.password and not self.password.startswith('pbkdf2_sha256'):
-            self.password = make_password(self.password)
+        if self.password and is_password_usable(self.password):
+            try:
+                identify_hasher(self.password)
+            except ValueError:
+                self.password = make_password(self.password)
         super().save(*args, **kwargs)
 
     # reset password methods
-    def generate_otp(self):
-        self.last_otp = f'{random.randint(100000, 999999):06}'
-        self.otp_expiry = timezone.now() + timedelta(minutes=10)
-        self.save()
-
-    def send_password_reset_email(self):
+    def send_password_reset_email(self, code):
 
         mail_subject = 'Reset your password'
         # create the message as a string
@@ -93,14 +95,80 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
         We received a request to reset your password. Your OTP code is:
 
-        {self.last_otp}
+        {code}
 
-        This code is valid for 10 minutes. If you didn't request a password reset, you can ignore this email.
+        This code is valid for {settings.OTP_LIFETIME // 60} minutes. If you didn't request a password reset, you can ignore this email.
 
         Thanks,
         Your team
         """
-        send_mail(mail_subject, message, 'admin@mywebsite.com', [self.email])
+        # Sent by the mail worker (python manage.py run_mail_worker), not by the request
+        OutboundEmail.enqueue(mail_subject, message, 'admin@mywebsite.com', [self.email])
+
+
+class PasswordResetCode(models.Model):
+    """
+    The password reset code (OTP) of an email address, stored as an HMAC so a database leak doesn't reveal live codes.
+
+    There is at most one code per email, so verifying is one lookup on the unique `email` index and one update of the
+    attempt counter. A code allows OTP_MAX_ATTEMPTS guesses and lives OTP_LIFETIME seconds; expired codes are purged
+    whenever a new one is issued.
+    """
+    email = models.EmailField(unique=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    code_hash = models.CharField(max_length=64)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"reset code for {self.email}"
+
+    @staticmethod
+    def hash_code(email, code):
+        return salted_hmac('authentication.PasswordResetCode', f'{email}:{code}', algorithm='sha256').hexdigest()
+
+    @classmethod
+    def issue(cls, user):
+        """
+        Replace the user's code with a new one and return it in clear.
+        """
+        code = f'{secrets.randbelow(1000000):06}'
+        now = timezone.now()
+        cls.objects.filter(expires_at__lt=now).delete()
+        cls.objects.update_or_create(email=user.email, defaults={
+            'user': user,
+            'code_hash': cls.hash_code(user.email, code),
+            'attempts': 0,
+            'expires_at': now + timedelta(seconds=settings.OTP_LIFETIME),
+        })
+        return code
+
+    @classmethod
+    def verify(cls, email, code):
+        """
+        Return the code of `email` if `code` matches it; raise ValidationError otherwise.
+
+        Every guess uses up one of OTP_MAX_ATTEMPTS attempts before it is compared, so parallel guesses can't
+        all pass the limit before their increments land.
+        """
+        reset_code = cls.objects.filter(email=email).first()
+        if reset_code is None:
+            raise ValidationError("Wrong code.")
+        if reset_code.expires_at < timezone.now():
+            raise ValidationError("Code expired.")
+        reserved = cls.objects.filter(pk=reset_code.pk, attempts__lt=settings.OTP_MAX_ATTEMPTS).update(attempts=F('attempts') + 1)
+        if not reserved:
+            raise ValidationError("Too many attempts, request a new code.")
+        if not constant_time_compare(reset_code.code_hash, cls.hash_code(email, code)):
+            raise ValidationError("Wrong code.")
+        return reset_code
+
+    def consume(self):
+        """
+        Delete the code; False when a concurrent request already used it.
+        """
+        deleted, _ = PasswordResetCode.objects.filter(pk=self.pk, code_hash=self.code_hash).delete()
+        return bool(deleted)
 
 
 class Block(models.Model):
@@ -126,3 +194,84 @@ class Block(models.Model):
         Follow.objects.filter(follower=self.blocker, following=self.blocked).delete()
         Follow.objects.filter(follower=self.blocked, following=self.blocker).delete()
         super().save(*args, **kwargs)
+
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting for the mail worker (`manage.py run_mail_worker`).
+
+    Requests only insert a row; the worker claims them in batches of MAIL_QUEUE_BATCH_SIZE with a
+    conditional UPDATE, sends them over one SMTP connection it keeps open, and deletes them once sent.
+    Failed emails are retried with exponential backoff until MAIL_QUEUE_MAX_ATTEMPTS is reached.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField()
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=PENDING)
+    claim = models.UUIDField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'run_after']),
+            models.Index(fields=['claim']),
+        ]
+
+    def __str__(self):
+        return f"email to {', '.join(self.to)} ({self.state})"
+
+    @classmethod
+    def enqueue(cls, subject, body, from_email, to):
+        return cls.objects.create(subject=subject, body=body, from_email=from_email, to=list(to))
+
+    @classmethod
+    def claim_batch(cls):
+        """
+        Claim up to MAIL_QUEUE_BATCH_SIZE runnable emails, oldest first, and return them.
+
+        Emails left `sending` by a worker that died are put back in the queue once their lock is
+        older than MAIL_QUEUE_LOCK_TIMEOUT.
+        """
+        now = timezone.now()
+        stale = now - timedelta(seconds=settings.MAIL_QUEUE_LOCK_TIMEOUT)
+        cls.objects.filter(state=cls.SENDING, locked_at__lt=stale).update(state=cls.PENDING, claim=None, locked_at=None)
+
+        claim = uuid.uuid4()
+        candidates = cls.objects.filter(state=cls.PENDING, run_after__lte=now).order_by('run_after', 'id')
+        ids = list(candidates.values_list('id', flat=True)[:settings.MAIL_QUEUE_BATCH_SIZE])
+        # Rows another worker claimed in the meantime are no longer pending and are left out
+        cls.objects.filter(id__in=ids, state=cls.PENDING).update(state=cls.SENDING, claim=claim, locked_at=now)
+        return list(cls.objects.filter(claim=claim, state=cls.SENDING).order_by('run_after', 'id'))
+
+    def message(self, connection):
+        return EmailMessage(self.subject, self.body, self.from_email, self.to, connection=connection)
+
+    def retry_later(self, error):
+        """
+        Record a failed attempt, and give up after MAIL_QUEUE_MAX_ATTEMPTS.
+        """
+        self.attempts += 1
+        self.last_error = repr(error)
+        self.claim = None
+        self.locked_at = None
+        if self.attempts >= settings.MAIL_QUEUE_MAX_ATTEMPTS:
+            self.state = self.FAILED
+        else:
+            self.state = self.PENDING
+            self.run_after = timezone.now() + timedelta(seconds=settings.MAIL_QUEUE_RETRY_DELAY * 2 ** (self.attempts - 1))
+        self.save(update_fields=['state', 'claim', 'attempts', 'last_error', 'run_after', 'locked_at', 'updated_at'])
@@ -14,15 +14,132 @@ Classes:
             max_page_size (int): The maximum number of items allowed on a single page. Default is 2.
             page_query_param (str): The query parameter name for specifying the page number. Default is 'p'.
 
+    CreatedAtCursorPagination(BasePagination):
+        A keyset paginator for time-ordered feeds. Pages are ordered newest first on (created_at, id) and the
+        position is carried by an opaque `cursor` token, so every page is an index range scan of the same cost
+        and no COUNT(*) is issued.
+
+        Attributes:
+            page_size (int): The default number of items to include on each page. Default is 10.
+            page_size_query_param (str): The query parameter name for specifying the page size. Default is 'limit'.
+            max_page_size (int): The maximum number of items allowed on a single page. Default is 10.
+            cursor_query_param (str): The query parameter carrying the cursor token. Default is 'cursor'.
+            cursor_field (str): The timestamp field the keyset is built on. Default is 'created_at'.
+
 Usage:
     To use this custom pagination class in your Django REST Framework views, include it in the view configuration
 '''
 
-from rest_framework.pagination import PageNumberPagination
+import base64
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'limit'
     max_page_size = 10
-    page_query_param = 'p'
\ No newline at end of file
+    page_query_param = 'p'
+
+
+class CreatedAtCursorPagination(BasePagination):
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 10
+    cursor_query_param = 'cursor'
+    cursor_field = 'created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{self.cursor_field}', '-id')
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            created_at, pk = cursor
+            # Equivalent to (created_at, id) < cursor, written so the first condition bounds the index range
+            queryset = queryset.filter(**{f'{self.cursor_field}__lte': created_at}).exclude(
+                **{self.cursor_field: created_at, 'id__gte': pk}
+            )
+
+        # Fetch one extra row to know whether there is a next page without counting
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(getattr(last, self.cursor_field), last.pk))
+
+    def encode_cursor(self, created_at, pk):
+        token = f'{created_at.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(token.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
\ No newline at end of file
@@ -27,13 +27,16 @@ Usage:
 
 '''
 
-from django.utils import timezone
 from rest_framework import serializers
-from profile_app.models import Profile
-from profile_app.serializers import ProfileSerializer
-from .models import CustomUser, Block
+from profile_app.serializers import ProfileSummarySerializer
+from media_app.serializers import RenditionListSerializer
+from .models import CustomUser, Block, PasswordResetCode
 from django.contrib.auth.password_validation import validate_password
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .tokens import add_static_claims
 
 
 class CustomUserRegistrationSerializer(serializers.ModelSerializer):
@@ -112,13 +115,15 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         '''
         data = super().validate(attrs)
         request = self.context.get('request')
-        user = self.user  # get the athenticated user
+        user = self.user  # get the athenticated user, loaded with its profile by PooledPasswordBackend
 
         # Adds additional user-related information to the token response :
         data['user'] = str(user)
         data['id'] = user.id
         if user.avatar:
-            avatar_url = request.build_absolute_uri(user.avatar.url)
+            avatar_url = user.avatar.url  # signed at most once per window by CachedSignatureS3Storage
+            if request is not None:
+                avatar_url = request.build_absolute_uri(avatar_url)
         else:
             avatar_url = None
         data['avatar'] = avatar_url
@@ -126,16 +131,31 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         data['is_active'] = user.is_active
         data['phone_number'] = user.phone_number
 
-        # Retrieve profile_id using the reverse relationship with the profile model
-        if hasattr(user, 'profile'):
-            profile_instance = user.profile
-            if profile_instance:
-                data['profile_id'] = profile_instance.id
-            else:
-                data['profile_id'] = None  # Handle the case where the user has no profile
-        else:
-            data['profile_id'] = None  # Handle the case where the user has no profile attribute
+        # None when the user has no profile
+        profile = getattr(user, 'profile', None)
+        data['profile_id'] = profile.id if profile else None
+
+        return data
+
+    @classmethod
+    def get_token(cls, user):
+        return add_static_claims(super().get_token(user), user)
+
 
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    '''
+    Token Refresh Serializer
+
+    Reloads the user on refresh, so inactive users can't renew their access and the claims of the new access token are current.
+    '''
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        user = CustomUser.objects.select_related('profile').filter(pk=access[api_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        data['access'] = str(add_static_claims(access, user))
         return data
 
 
@@ -148,39 +168,14 @@ class CheckCodeSerializer(serializers.Serializer):
     code = serializers.CharField(max_length=6)
 
     def validate(self, data):
-        try:
-            user = CustomUser.objects.get(email=data['email'])
-        except CustomUser.DoesNotExist:
-            raise serializers.ValidationError("User not found.")
-
-        if user.last_otp != data['code']:
-            raise serializers.ValidationError("Wrong code.")
-        
-        if user.otp_expiry < timezone.now():
-            raise serializers.ValidationError("Code expired.")
-        
+        # One lookup of the stored code; the user row isn't needed
+        data['reset_code'] = PasswordResetCode.verify(data['email'], data['code'])
         return data
 
 
-class ConfirmPasswordSerializer(serializers.Serializer):
-    email = serializers.EmailField()
-    code = serializers.CharField(max_length=6)
+class ConfirmPasswordSerializer(CheckCodeSerializer):
     new_password = serializers.CharField(max_length=128, validators=[validate_password])
 
-    def validate(self, data):
-        try:
-            user = CustomUser.objects.get(email=data['email'])
-        except CustomUser.DoesNotExist:
-            raise serializers.ValidationError("User not found.")
-
-        if user.last_otp != data['code']:
-            raise serializers.ValidationError("Wrong code.")
-        
-        if user.otp_expiry < timezone.now():
-            raise serializers.ValidationError("Code expired.")
-        
-        return data    
-
 
 class BlockSerializer(serializers.ModelSerializer):
     blocked_id = serializers.IntegerField(write_only=True)
@@ -214,12 +209,9 @@ class BlockSerializer(serializers.ModelSerializer):
 
 
 class BlockListSerializer(serializers.ModelSerializer):
-    blocked_profile = serializers.SerializerMethodField()
+    blocked_profile = ProfileSummarySerializer(source='blocked.profile', read_only=True)
 
     class Meta:
         model = Block
         fields = ['blocked_profile']
-
-    def get_blocked_profile(self, obj):
-        profile = Profile.objects.get(user=obj.blocked)
-        return ProfileSerializer(profile, context=self.context).data
\ No newline at end of file
+        list_serializer_class = RenditionListSerializer
\ No newline at end of file
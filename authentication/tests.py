@@ -1,3 +1,316 @@
-from django.test import TestCase
+import io
+import re
+import socketserver
+import threading
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher
+from unittest import mock
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from post.models import Post
+from post.tests import LOCAL_STORAGES
+from profile_app.models import Follow
+from .models import Block, CustomUser, OutboundEmail, PasswordResetCode
+from .throttles import OTPIPRateThrottle
+from .tokens import StatelessJWTAuthentication
 
-# Create your tests here.
+LEGACY_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+CURRENT_HASHERS = ['authentication.hashers.TunedArgon2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, PASSWORD_HASHERS=CURRENT_HASHERS)
+class PasswordRehashTests(TestCase):
+    '''
+    Hashes made by an older hasher still log in, and are upgraded to the preferred hasher when they do.
+    '''
+
+    def setUp(self):
+        with self.settings(PASSWORD_HASHERS=LEGACY_HASHERS):
+            self.user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='alice')
+        self.client = APIClient()
+
+    def test_login_upgrades_the_hash(self):
+        response = self.client.post('/login/', {'username': 'alice', 'password': 'pass1234'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(identify_hasher(self.user.password).algorithm, 'argon2')
+
+        # the upgraded hash is saved as is, not hashed again
+        password = self.user.password
+        self.user.save()
+        self.assertEqual(self.user.password, password)
+
+    def test_failed_login_keeps_the_hash(self):
+        response = self.client.post('/login/', {'username': 'alice', 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.user.refresh_from_db()
+        self.assertEqual(identify_hasher(self.user.password).algorithm, 'md5')
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, PASSWORD_HASHERS=LEGACY_HASHERS)
+class LoginTokenTests(TestCase):
+    '''
+    Login loads the user and profile in one query and puts the static claims in the tokens.
+    '''
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='alice')
+        self.client = APIClient()
+
+    def login(self):
+        return self.client.post('/login/', {'username': 'alice', 'password': 'pass1234'}, format='json')
+
+    def test_login_query_count(self):
+        # the user with its profile, then the outstanding refresh token
+        with self.assertNumQueries(2):
+            response = self.login()
+        self.assertEqual(response.data['profile_id'], self.user.profile.id)
+
+        claims = AccessToken(response.data['access'])
+        self.assertEqual(claims['profile_id'], self.user.profile.id)
+        self.assertFalse(claims['is_staff'])
+
+    def test_stateless_authentication_skips_the_user_query(self):
+        authentication = StatelessJWTAuthentication()
+        token = authentication.get_validated_token(self.login().data['access'])
+        with self.assertNumQueries(0):
+            user = authentication.get_user(token)
+            self.assertEqual(user, self.user)
+            self.assertFalse(user.is_staff)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.username, 'alice')
+
+    def test_refresh_rejects_inactive_users(self):
+        refresh = self.login().data['refresh']
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post('/login/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    '''
+    Just enough SMTP to accept messages; records the connections and messages it received.
+    '''
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stand-in ready')
+        for line in self.rfile:
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 stand-in')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                for data in self.rfile:
+                    if data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data)
+                self.server.messages.append(b''.join(lines))
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                break
+            else:
+                self.reply('250 ok')
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInSMTPHandler)
+        self.connections = 0
+        self.messages = []
+
+
+@override_settings(PASSWORD_HASHERS=LEGACY_HASHERS)
+class MailQueueTests(TestCase):
+    '''
+    Password reset requests only enqueue; the worker sends the queue in batches over one SMTP connection.
+    '''
+
+    def setUp(self):
+        self.server = StandInSMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_reset_request_enqueues_and_worker_sends_batches(self):
+        for i in range(3):
+            CustomUser.objects.create_user(f'user{i}@example.com', 'pass1234', username=f'user{i}')
+            response = APIClient().post('/forget-password/', {'email': f'user{i}@example.com'}, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(OutboundEmail.objects.count(), 3)
+        self.assertEqual(self.server.connections, 0)
+
+        smtp = {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': '127.0.0.1', 'EMAIL_PORT': self.server.server_address[1],
+            'EMAIL_HOST_USER': '', 'EMAIL_USE_SSL': False, 'EMAIL_USE_TLS': False,
+        }
+        # TestCase runs in one transaction, which the worker's close_old_connections() would end
+        with self.settings(MAIL_QUEUE_BATCH_SIZE=2, **smtp), mock.patch('authentication.management.commands.run_mail_worker.close_old_connections'):
+            call_command('run_mail_worker', '--once', stdout=io.StringIO())
+
+        self.assertFalse(OutboundEmail.objects.exists())
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertEqual(self.server.connections, 1)
+        self.assertIn(b'Your OTP code is', self.server.messages[0])
+
+
+@override_settings(PASSWORD_HASHERS=LEGACY_HASHERS)
+class PasswordResetCodeTests(TestCase):
+    '''
+    Reset codes are verified with one lookup, locked after OTP_MAX_ATTEMPTS guesses, and rate limited.
+    '''
+
+    def setUp(self):
+        cache.clear()
+        caches['throttle'].clear()
+        self.user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='alice')
+        self.client = APIClient()
+        self.client.post('/forget-password/', {'email': 'alice@example.com'}, format='json')
+        self.code = re.search(r'\b\d{6}\b', OutboundEmail.objects.get().body).group()
+
+    def check(self, code):
+        return self.client.post('/check-code/', {'email': 'alice@example.com', 'code': code}, format='json')
+
+    def code_queries(self, queries):
+        return [query['sql'] for query in queries if PasswordResetCode._meta.db_table in query['sql']]
+
+    def test_code_is_checked_with_one_lookup(self):
+        self.assertNotIn(self.code, PasswordResetCode.objects.get().code_hash)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.check(self.code).status_code, 200)
+        # the lookup, and the update that uses up an attempt
+        self.assertEqual(len(self.code_queries(queries)), 2)
+
+    def test_wrong_guesses_lock_the_code(self):
+        wrong = f'{(int(self.code) + 1) % 1000000:06}'
+        for _ in range(settings.OTP_MAX_ATTEMPTS):
+            self.assertEqual(self.check(wrong).status_code, 400)
+        self.assertEqual(self.check(self.code).status_code, 400)
+
+    def test_parallel_guesses_share_the_attempt_limit(self):
+        # Other guesses use up the last attempts after this one loaded the code
+        loaded = PasswordResetCode.objects.get()
+        PasswordResetCode.objects.update(attempts=settings.OTP_MAX_ATTEMPTS)
+        with mock.patch.object(QuerySet, 'first', return_value=loaded):
+            with self.assertRaisesMessage(ValidationError, 'Too many attempts'):
+                PasswordResetCode.verify('alice@example.com', self.code)
+
+    def test_confirm_sets_the_password_once(self):
+        data = {'email': 'alice@example.com', 'code': self.code, 'new_password': 'a-new-Passw0rd'}
+        self.assertEqual(self.client.post('/confirm-password/', data, format='json').status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('a-new-Passw0rd'))
+        self.assertEqual(self.client.post('/confirm-password/', data, format='json').status_code, 400)
+
+    def test_requests_per_email_are_rate_limited(self):
+        for _ in range(9):
+            self.check(self.code)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.check(self.code).status_code, 429)
+        self.assertEqual(self.code_queries(queries), [])
+
+    def test_rate_limit_windows_are_kept_in_the_shared_cache(self):
+        self.check(self.code)
+        key = OTPIPRateThrottle.cache_format % {'scope': 'otp_ip', 'ident': '127.0.0.1'}
+        # the reset request of setUp and this check
+        self.assertEqual(len(caches['throttle'].get(key)), 2)
+        self.assertIsNone(cache.get(key))
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, PASSWORD_HASHERS=LEGACY_HASHERS)
+class BlockFilteringTests(TestCase):
+    '''
+    Users who block each other, in either direction, drop out of each other's lists as soon as the block commits.
+    '''
+
+    def setUp(self):
+        cache.clear()
+        self.viewer = CustomUser.objects.create_user('viewer@example.com', 'pass1234', username='viewer')
+        self.author = CustomUser.objects.create_user('author@example.com', 'pass1234', username='author')
+        self.fans = [CustomUser.objects.create_user(f'fan{i}@example.com', 'pass1234', username=f'fan{i}') for i in range(2)]
+        for fan in self.fans:
+            Follow.objects.create(follower=fan, following=self.author)
+            Follow.objects.create(follower=self.author, following=fan)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def usernames(self, path):
+        return {profile['username'] for profile in self.client.get(path, {'limit': 2}).data['results']}
+
+    def block(self, blocker, blocked):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Block.objects.create(blocker=blocker, blocked=blocked)
+
+    def test_follow_lists_leave_out_blocked_users(self):
+        profile = self.author.profile.id
+        self.assertEqual(self.usernames(f'/profile/{profile}/followers/'), {'fan0', 'fan1'})
+        self.block(self.viewer, self.fans[0])
+        self.assertEqual(self.usernames(f'/profile/{profile}/followers/'), {'fan1'})
+        self.assertEqual(self.usernames(f'/profile/{profile}/following/'), {'fan1'})
+
+        # blocked by the other side
+        block = self.block(self.fans[1], self.viewer)
+        self.assertEqual(self.usernames(f'/profile/{profile}/followers/'), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            block.delete()
+        self.assertEqual(self.usernames(f'/profile/{profile}/following/'), {'fan1'})
+
+    def test_feed_leaves_out_blocked_authors(self):
+        Post.objects.create(user=self.author, image='images/post.jpg', content='post')
+        self.assertEqual(len(self.client.get('/post/').data['results']), 1)
+        self.block(self.author, self.viewer)
+        self.assertEqual(self.client.get('/post/').data['results'], [])
+
+    def test_blocks_apply_without_any_cache_invalidation(self):
+        # Another worker's block: no commit callback of this process runs
+        profile = self.author.profile.id
+        block = Block.objects.create(blocker=self.fans[0], blocked=self.viewer)
+        self.assertEqual(self.usernames(f'/profile/{profile}/following/'), {'fan1'})
+        block.delete()
+        self.assertEqual(self.usernames(f'/profile/{profile}/following/'), {'fan0', 'fan1'})
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, PASSWORD_HASHERS=LEGACY_HASHERS)
+class CreatedAtCursorPaginationTests(TestCase):
+    '''
+    Walking a keyset-paginated feed returns every row exactly once, ties on created_at included.
+    '''
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='alice')
+        posts = [Post.objects.create(user=self.user, image='images/post.jpg', content=f'post {i}') for i in range(7)]
+        # five posts share one timestamp, so page boundaries fall inside the tie
+        Post.objects.filter(pk__in=[post.pk for post in posts[1:6]]).update(created_at=posts[0].created_at)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        seen, path, pages = [], '/post/?limit=2', 0
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            seen += [post['id'] for post in response.data['results']]
+            path, pages = response.data['next'], pages + 1
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 4)
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/post/', {'cursor': 'not-a-cursor'}).status_code, 404)
@@ -0,0 +1,37 @@
+'''
+Password Reset Throttles
+
+Sliding-window rate limits for the password reset endpoints, checked before the view runs.
+The request history of each key is kept in the `throttle` cache, which every worker shares, so a client gets
+one window whichever process serves it.
+
+Classes:
+    OTPEmailRateThrottle: Limits the requests naming the same email address (rate `otp_email`).
+    OTPIPRateThrottle: Limits the requests from the same client IP (rate `otp_ip`).
+'''
+
+import hashlib
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SharedRateThrottle(SimpleRateThrottle):
+    cache = caches['throttle']
+
+
+class OTPEmailRateThrottle(SharedRateThrottle):
+    scope = 'otp_email'
+
+    def get_cache_key(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not email:
+            return None
+        ident = hashlib.md5(str(email).strip().lower().encode()).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class OTPIPRateThrottle(SharedRateThrottle):
+    scope = 'otp_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
@@ -0,0 +1,45 @@
+'''
+JWT Claims and Stateless Authentication
+
+Access tokens carry the facts about their user that rarely change (`is_staff`, `profile_id`) next to `user_id`.
+They are set at login and read again from the database on every refresh, so they are at most
+ACCESS_TOKEN_LIFETIME old.
+
+StatelessJWTAuthentication, enabled with JWT_STATELESS_AUTH, builds request.user from these claims instead of
+loading the user on every request. The user it returns is a CustomUser with every other field deferred: it can be
+used in queries and compared like any user, and fields outside the token are loaded when first read. The catch is
+that a deactivated user keeps access until their access token expires.
+'''
+
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .models import CustomUser
+
+
+STATIC_CLAIMS = ('is_staff', 'profile_id')
+
+
+def add_static_claims(token, user):
+    profile = getattr(user, 'profile', None)
+    token['is_staff'] = user.is_staff
+    token['profile_id'] = profile.id if profile else None
+    return token
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in STATIC_CLAIMS):
+            # issued before the claims existed
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        return CustomUser.from_db(
+            DEFAULT_DB_ALIAS,
+            ['id', 'is_staff', 'is_active'],
+            [user_id, validated_token['is_staff'], True],
+        )
@@ -33,7 +33,13 @@ Usage:
 
 '''
 
-from .models import CustomUser, Block
+from .models import CustomUser, Block, PasswordResetCode
+from .backends import run_hashing
+from .throttles import OTPEmailRateThrottle, OTPIPRateThrottle
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Prefetch
+from profile_app.models import Profile
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
 from .permissions import IsBlockerSelf
@@ -127,6 +133,7 @@ class DisplayDetail(generics.RetrieveUpdateDestroyAPIView):
 
 # forgot password views
 class PasswordResetRequestView(APIView):
+    throttle_classes = [OTPIPRateThrottle, OTPEmailRateThrottle]
 
     @swagger_auto_schema(request_body=ResetPasswordEmailSerializer)
     def post(self, request):
@@ -134,9 +141,9 @@ class PasswordResetRequestView(APIView):
         if serializer.is_valid():
             email = serializer.validated_data.get('email')
             try:
-                user = CustomUser.objects.get(email=email)
-                user.generate_otp()
-                user.send_password_reset_email()
+                user = CustomUser.objects.only('id', 'email').get(email=email)
+                code = PasswordResetCode.issue(user)
+                user.send_password_reset_email(code)
                 return Response({"success": True}, status=status.HTTP_200_OK)
             except CustomUser.DoesNotExist:
                 return Response({"success": False, "message": "The account was not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -144,6 +151,8 @@ class PasswordResetRequestView(APIView):
 
 
 class CheckCodeView(APIView):
+    throttle_classes = [OTPIPRateThrottle, OTPEmailRateThrottle]
+
     @swagger_auto_schema(request_body=CheckCodeSerializer)
     def post(self, request):
         serializer = CheckCodeSerializer(data=request.data)
@@ -153,17 +162,20 @@ class CheckCodeView(APIView):
 
 
 class ConfirmPasswordView(APIView):
+    throttle_classes = [OTPIPRateThrottle, OTPEmailRateThrottle]
+
     @swagger_auto_schema(request_body=ConfirmPasswordSerializer)
     def post(self, request):
         serializer = ConfirmPasswordSerializer(data=request.data)
         if serializer.is_valid():
-            email = serializer.validated_data.get('email')
+            reset_code = serializer.validated_data['reset_code']
             new_password = serializer.validated_data.get('new_password')
-            user = CustomUser.objects.get(email=email)
-            user.set_password(new_password)
-            # user.last_otp = None
-            # user.otp_expiry = None
-            user.save()
+            password = run_hashing(make_password, new_password)
+            with transaction.atomic():
+                # A code resets the password once, even when confirmed twice at the same time
+                if not reset_code.consume():
+                    return Response({"success": False, "message": "Wrong code."}, status=status.HTTP_400_BAD_REQUEST)
+                CustomUser.objects.filter(pk=reset_code.user_id).update(password=password)
             return Response({"success": True}, status=status.HTTP_200_OK)
         return Response({"success": False, "message": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -211,7 +223,9 @@ class BlockListView(generics.ListAPIView):
         Returns blocks for the authenticated user.
         """
         user = self.request.user
-        return Block.objects.filter(blocker=user)
+        return Block.objects.filter(blocker=user).select_related('blocked').prefetch_related(
+            Prefetch('blocked__profile', queryset=Profile.objects.with_stats(user))
+        )
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -0,0 +1,25 @@
+from django.contrib import admin
+from .models import Rendition, RenditionJob, UploadSession
+
+
+@admin.register(Rendition)
+class RenditionAdmin(admin.ModelAdmin):
+    list_display = ('source', 'width', 'format', 'file', 'created_at')
+    search_fields = ('source',)
+    list_filter = ('format', 'width')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'filename', 'received_size', 'total_size', 'status', 'updated_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(RenditionJob)
+class RenditionJobAdmin(admin.ModelAdmin):
+    list_display = ('source', 'state', 'attempts', 'run_after', 'last_error', 'updated_at')
+    list_filter = ('state',)
+    search_fields = ('source',)
+    readonly_fields = ('created_at', 'updated_at')
@@ -0,0 +1,38 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from media_app.models import UploadSession
+from media_app.uploads import abort_upload
+
+
+class Command(BaseCommand):
+    help = 'Abort the chunked uploads that received no part for UPLOAD_STALE_AFTER seconds and discard their stored parts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.UPLOAD_STALE_AFTER,
+                            help='Seconds since the last part (default: UPLOAD_STALE_AFTER)')
+
+    def handle(self, *args, **options):
+        """
+        Entry point of the management command.
+        """
+        cutoff = timezone.now() - timedelta(seconds=options['older_than'])
+        # Served by the (status, updated_at) index
+        stale = UploadSession.objects.filter(status=UploadSession.UPLOADING, updated_at__lt=cutoff)
+        aborted, failed = 0, 0
+        for session_id in list(stale.order_by('updated_at').values_list('pk', flat=True)):
+            try:
+                with transaction.atomic():
+                    # Skip uploads that were resumed or completed since the scan
+                    session = stale.select_for_update().filter(pk=session_id).first()
+                    if session is None:
+                        continue
+                    abort_upload(session)
+                aborted += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{session_id}: {e!r}')
+
+        self.stdout.write(self.style.SUCCESS(f'{aborted} stale upload(s) aborted, {failed} failed.'))
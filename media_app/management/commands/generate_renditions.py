@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from authentication.models import CustomUser
+from media_app.renditions import generate_renditions
+from post.models import Post
+from profile_app.models import Profile
+from vlog.models import Video
+
+
+class Command(BaseCommand):
+    help = 'Generate (or regenerate) the image renditions of every avatar, profile picture, post image and video thumbnail'
+
+    SOURCES = (
+        (CustomUser, ('avatar',)),
+        (Profile, ('avatar', 'background_pic')),
+        (Post, ('image',)),
+        (Video, ('thumbnail',)),
+    )
+
+    def handle(self, *args, **kwargs):
+        """
+        Entry point of the management command.
+        """
+        seen, failed = set(), 0
+        for model, field_names in self.SOURCES:
+            for instance in model.objects.only('pk', *field_names).iterator():
+                for field_name in field_names:
+                    fieldfile = getattr(instance, field_name)
+                    if fieldfile and fieldfile.name not in seen:
+                        seen.add(fieldfile.name)
+                        try:
+                            generate_renditions(fieldfile.name)
+                        except Exception as e:
+                            failed += 1
+                            self.stderr.write(f'{fieldfile.name}: {e!r}')
+
+        self.stdout.write(self.style.SUCCESS(f'Renditions generated for {len(seen) - failed} image(s), {failed} failed.'))
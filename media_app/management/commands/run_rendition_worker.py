@@ -0,0 +1,31 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from media_app.models import RenditionJob
+
+
+class Command(BaseCommand):
+    help = 'Run the rendition worker: resize new avatars, profile pictures, post images and video thumbnails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit instead of polling forever')
+
+    def handle(self, *args, **options):
+        """
+        Entry point of the management command.
+        """
+        self.stdout.write('Rendition worker started.')
+        while True:
+            close_old_connections()
+            job = RenditionJob.claim_next()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(settings.RENDITION_QUEUE_POLL_INTERVAL)
+                continue
+
+            job.run()
+            self.stdout.write(f'{job}: attempt {job.attempts}')
+
+        self.stdout.write(self.style.SUCCESS('Rendition queue drained.'))
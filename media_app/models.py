@@ -0,0 +1,233 @@
+import logging
+import uuid
+from django.conf import settings
+from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+
+logger = logging.getLogger(__name__)
+
+
+class Rendition(models.Model):
+    """
+    Rendition Model
+
+    A resized copy of an uploaded image. `source` is the storage name of the original file,
+    so one table serves user avatars, profile pictures, post images and video thumbnails.
+    """
+    WEBP = 'webp'
+    JPEG = 'jpeg'
+    FORMAT_CHOICES = [
+        (WEBP, 'WebP'),
+        (JPEG, 'JPEG'),
+    ]
+
+    source = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES)
+    file = models.ImageField(upload_to='renditions/')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source', 'width', 'format')
+
+    def __str__(self):
+        return f"{self.source} @{self.width}px ({self.format})"
+
+
+class UploadSession(models.Model):
+    """
+    UploadSession Model
+
+    A resumable, chunked upload. Parts are sent in order and streamed straight to storage (see media_app.uploads);
+    once complete, the file at `key` is handed to a Video or Post through the `upload_id` field of their serializers.
+
+    `checksum` chains the SHA-256 of every part: sha256(previous checksum + sha256(part)), starting from an empty string.
+    """
+    VIDEO = 'video'
+    IMAGE = 'image'
+    KIND_CHOICES = [
+        (VIDEO, 'Video'),
+        (IMAGE, 'Image'),
+    ]
+
+    UPLOADING = 'uploading'
+    COMPLETE = 'complete'
+    ATTACHED = 'attached'
+    ABORTED = 'aborted'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (COMPLETE, 'Complete'),
+        (ATTACHED, 'Attached'),
+        (ABORTED, 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    key = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    parts = models.JSONField(default=list)
+    multipart_id = models.CharField(max_length=1024, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default=UPLOADING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'updated_at'])]
+
+    def __str__(self):
+        return f"{self.kind} upload {self.id} ({self.status})"
+
+    @property
+    def next_part(self):
+        return len(self.parts) + 1
+
+    def attach(self):
+        """
+        Mark a complete upload as used, returning False when it was already attached by another request.
+        """
+        attached = UploadSession.objects.filter(pk=self.pk, status=self.COMPLETE).update(status=self.ATTACHED)
+        if attached:
+            self.status = self.ATTACHED
+        return bool(attached)
+
+
+class RenditionJob(models.Model):
+    """
+    A unit of work for the rendition worker (`manage.py run_rendition_worker`).
+
+    There is one job per source file, written in the transaction that saved the file, so renditions are
+    never rendered in a request and never lost. Like VideoIngestJob, workers claim jobs with a conditional
+    UPDATE and retry failures with exponential backoff until RENDITION_QUEUE_MAX_ATTEMPTS is reached.
+    A job is done once the file is rendered, including images narrower than every width, which have no
+    renditions; `manage.py generate_renditions` renders files again.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    source = models.CharField(max_length=255, unique=True)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"render {self.source} ({self.state})"
+
+    @classmethod
+    def claim_next(cls):
+        """
+        Claim the oldest runnable job and return it, or None when the queue is empty.
+
+        Jobs left `running` by a worker that died are put back in the queue once their lock is
+        older than RENDITION_QUEUE_LOCK_TIMEOUT.
+        """
+        now = timezone.now()
+        stale = now - timezone.timedelta(seconds=settings.RENDITION_QUEUE_LOCK_TIMEOUT)
+        cls.objects.filter(state=cls.RUNNING, locked_at__lt=stale).update(state=cls.PENDING, locked_at=None)
+
+        candidates = cls.objects.filter(state=cls.PENDING, run_after__lte=now).order_by('run_after', 'id')
+        for job_id in candidates.values_list('id', flat=True)[:10]:
+            # Only one worker can move a given row from pending to running
+            if cls.objects.filter(id=job_id, state=cls.PENDING).update(state=cls.RUNNING, locked_at=now):
+                return cls.objects.get(id=job_id)
+        return None
+
+    def run(self):
+        """
+        Render the file and record the outcome of this attempt.
+        """
+        from .renditions import generate_renditions, renditions_for
+
+        self.attempts += 1
+        try:
+            # Files rendered before they were queued (generate_renditions command) are not rendered twice
+            if not renditions_for([self.source])[self.source]:
+                generate_renditions(self.source)
+        except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+            # Not an image we can read, retrying can't help
+            self.fail(repr(e))
+        except Exception as e:
+            logger.exception('Renditions of %s failed (attempt %s)', self.source, self.attempts)
+            if self.attempts >= settings.RENDITION_QUEUE_MAX_ATTEMPTS:
+                self.fail(repr(e))
+            else:
+                self.state = self.PENDING
+                self.last_error = repr(e)
+                self.run_after = timezone.now() + timezone.timedelta(
+                    seconds=settings.RENDITION_QUEUE_RETRY_DELAY * 2 ** (self.attempts - 1)
+                )
+                self.locked_at = None
+                self.save(update_fields=['state', 'attempts', 'last_error', 'run_after', 'locked_at', 'updated_at'])
+        else:
+            self.state = self.DONE
+            self.locked_at = None
+            self.save(update_fields=['state', 'attempts', 'locked_at', 'updated_at'])
+
+    def fail(self, error):
+        self.state = self.FAILED
+        self.last_error = error
+        self.locked_at = None
+        self.save(update_fields=['state', 'attempts', 'last_error', 'locked_at', 'updated_at'])
+
+
+def queue_renditions(*files):
+    """
+    Queue the given image files for the rendition worker, in the current transaction.
+    A file is only ever queued once; saving it again is a no-op insert.
+    """
+    sources = {f.name for f in files if f and f.name}
+    if sources:
+        RenditionJob.objects.bulk_create([RenditionJob(source=source) for source in sources], ignore_conflicts=True)
+
+
+def _saved(update_fields, *field_names):
+    # Saves limited to other fields (last_login, counters, ...) can't have changed the image
+    return update_fields is None or not set(field_names).isdisjoint(update_fields)
+
+
+@receiver(post_save, sender='authentication.CustomUser')
+def render_user_avatar(sender, instance, update_fields=None, **kwargs):
+    if _saved(update_fields, 'avatar'):
+        queue_renditions(instance.avatar)
+
+
+@receiver(post_save, sender='profile_app.Profile')
+def render_profile_pictures(sender, instance, update_fields=None, **kwargs):
+    if _saved(update_fields, 'avatar', 'background_pic'):
+        queue_renditions(instance.avatar, instance.background_pic)
+
+
+@receiver(post_save, sender='post.Post')
+def render_post_image(sender, instance, update_fields=None, **kwargs):
+    if _saved(update_fields, 'image'):
+        queue_renditions(instance.image)
+
+
+@receiver(post_save, sender='vlog.Video')
+def render_video_thumbnail(sender, instance, update_fields=None, **kwargs):
+    if _saved(update_fields, 'thumbnail'):
+        queue_renditions(instance.thumbnail)
@@ -0,0 +1,195 @@
+'''
+Image Renditions
+
+Resizes uploaded images to the fixed widths in RENDITION_WIDTHS, in WebP and JPEG, and records them in the
+Rendition table so serializers can hand out the smallest file that fits instead of the original upload.
+
+Functions:
+    generate_renditions(source): Renders and stores every rendition of a stored image file.
+    renditions_for(sources): Returns the known renditions of several files with at most one query.
+    pick_rendition(available, width, format): Chooses the rendition to serve for a display width.
+
+Uploads are rendered by the rendition worker (`manage.py run_rendition_worker`, see RenditionJob), never in
+a request. Originals are read through `source_cache`, a size-bounded LRU cache on local disk, so regenerating
+renditions (new widths, `manage.py generate_renditions`) doesn't download every original from storage again.
+'''
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from PIL import Image, ImageOps
+from .models import Rendition
+
+
+RENDITION_CACHE_TIMEOUT = 24 * 60 * 60  # seconds
+# Files without renditions yet are looked up again soon: the worker that renders them can't clear the caches of other processes
+MISSING_RENDITION_CACHE_TIMEOUT = 60  # seconds
+
+SAVE_OPTIONS = {
+    Rendition.WEBP: {'format': 'WEBP', 'quality': 80, 'method': 4},
+    Rendition.JPEG: {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+
+class DiskLRUCache:
+    '''
+    A directory of files capped at `max_bytes`, evicting the least recently used entries first.
+
+    Reads refresh the file's mtime, which is what eviction orders on (atime is unreliable on noatime mounts).
+    Writes go through a temporary file and an atomic rename, so concurrent workers never see partial files.
+    '''
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, fileobj):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as temp_file:
+            for chunk in iter(lambda: fileobj.read(1024 * 1024), b''):
+                temp_file.write(chunk)
+        os.replace(temp_file.name, path)
+        self.evict()
+        return path
+
+    def fetch(self, name, storage=default_storage):
+        '''
+        Return a local path holding the content of a stored file, downloading it on a miss.
+        '''
+        path = self.get(name)
+        if path is None:
+            with storage.open(name, 'rb') as source:
+                path = self.put(name, source)
+        return path
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _mtime, size, _path in entries)
+            for _mtime, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+source_cache = DiskLRUCache(settings.RENDITION_CACHE_DIR, settings.RENDITION_CACHE_MAX_BYTES)
+
+
+def _cache_key(source):
+    # storage names may contain characters memcached doesn't accept in keys
+    return 'renditions:' + hashlib.md5(source.encode()).hexdigest()
+
+
+def renditions_for(sources):
+    '''
+    Return {source: {(width, format): rendition file name}} for the given storage names.
+
+    Answers come from the cache; all misses are loaded together with a single query and cached,
+    including sources that have no renditions at all.
+    '''
+    keys = {_cache_key(source): source for source in set(sources)}
+    found = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = set(keys.values()) - found.keys()
+    if missing:
+        loaded = {source: {} for source in missing}
+        rows = Rendition.objects.filter(source__in=missing).values_list('source', 'width', 'format', 'file')
+        for source, width, image_format, name in rows:
+            loaded[source][(width, image_format)] = name
+        cache.set_many({_cache_key(source): value for source, value in loaded.items() if value}, RENDITION_CACHE_TIMEOUT)
+        cache.set_many({_cache_key(source): value for source, value in loaded.items() if not value}, MISSING_RENDITION_CACHE_TIMEOUT)
+        found.update(loaded)
+    return found
+
+
+def pick_rendition(available, width, image_format):
+    '''
+    Return the name of the narrowest rendition at least `width` pixels wide, or None.
+
+    Renditions are only made at widths below the original's, so when none is wide enough
+    the original itself is the best file to serve.
+    '''
+    widths = sorted(w for (w, f) in available if f == image_format and w >= width)
+    if not widths:
+        return None
+    return available[(widths[0], image_format)]
+
+
+def _render(image, width, image_format):
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.LANCZOS)
+    if image_format == Rendition.JPEG and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    buffer = io.BytesIO()
+    resized.save(buffer, **SAVE_OPTIONS[image_format])
+    return buffer.getvalue()
+
+
+def _store(source, width, image_format, content):
+    stem = os.path.splitext(source)[0].replace('/', '_')
+    extension = 'jpg' if image_format == Rendition.JPEG else image_format
+    rendition = Rendition.objects.filter(source=source, width=width, format=image_format).first()
+    if rendition is None:
+        rendition = Rendition(source=source, width=width, format=image_format)
+    elif rendition.file:
+        rendition.file.delete(save=False)
+    rendition.file.save(f'{stem}_{width}.{extension}', ContentFile(content), save=False)
+    try:
+        with transaction.atomic():
+            rendition.save()
+    except IntegrityError:
+        # A concurrent worker rendered the same size first
+        rendition.file.delete(save=False)
+
+
+def generate_renditions(source):
+    '''
+    Render every configured width narrower than the original, in every format, and record them.
+    Returns the number of renditions stored; images narrower than every width have none, and are served as they are.
+
+    Errors are raised to the caller, the rendition worker retries them (see RenditionJob).
+    '''
+    stored = 0
+    try:
+        with Image.open(source_cache.fetch(source)) as original:
+            image = ImageOps.exif_transpose(original)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            for width in settings.RENDITION_WIDTHS:
+                if width >= image.width:
+                    continue
+                for image_format in SAVE_OPTIONS:
+                    _store(source, width, image_format, _render(image, width, image_format))
+                    stored += 1
+    finally:
+        cache.delete(_cache_key(source))
+    return stored
@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from .models import Rendition, UploadSession
+from .renditions import pick_rendition, renditions_for
+from .uploads import PART_SIZE
+
+
+def preferred_format(request):
+    '''
+    WebP for clients that advertise it, JPEG for everyone else.
+    '''
+    if request is not None and 'image/webp' in request.META.get('HTTP_ACCEPT', ''):
+        return Rendition.WEBP
+    return Rendition.JPEG
+
+
+class RenditionField(serializers.ImageField):
+    '''
+    Image field whose output is the URL of the smallest rendition at least `width` pixels wide,
+    falling back to the original file when there is none. Input is handled like any ImageField.
+
+    Rendition lookups are memoised in the serializer context; RenditionListSerializer loads
+    them for a whole page up front. With RENDITION_CDN_URL set, renditions are served unsigned from the CDN.
+    '''
+
+    def __init__(self, width, **kwargs):
+        self.width = width
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        known = self.context.setdefault('renditions', {})
+        if value.name not in known:
+            known.update(renditions_for([value.name]))
+
+        request = self.context.get('request')
+        name = pick_rendition(known[value.name], self.width, preferred_format(request))
+        if name and settings.RENDITION_CDN_URL:
+            url = settings.RENDITION_CDN_URL.rstrip('/') + '/' + filepath_to_uri(name)
+        elif name:
+            url = value.storage.url(name)
+        else:
+            url = value.url
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+def _rendition_names(serializer, instances, names):
+    for field in serializer.fields.values():
+        if not isinstance(field, (RenditionField, serializers.Serializer)):
+            continue
+        values = []
+        for instance in instances:
+            try:
+                value = field.get_attribute(instance)
+            except (serializers.SkipField, ObjectDoesNotExist):
+                continue
+            if value:
+                values.append(value)
+        if isinstance(field, RenditionField):
+            names.update(value.name for value in values)
+        else:
+            _rendition_names(field, values, names)
+
+
+def prime_renditions(serializer, instances):
+    '''
+    Load the renditions of every RenditionField of `serializer`, including those of nested serializers,
+    for all `instances` in one lookup.
+    '''
+    names = set()
+    _rendition_names(serializer, instances, names)
+    if names:
+        serializer.context.setdefault('renditions', {}).update(renditions_for(names))
+
+
+class RenditionListSerializer(serializers.ListSerializer):
+    '''
+    List serializer that resolves the renditions of a whole page before serializing its items.
+    Use it as `Meta.list_serializer_class` on serializers with RenditionFields.
+    '''
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        prime_renditions(self.child, items)
+        return super().to_representation(items)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    next_part = serializers.IntegerField(read_only=True)
+    part_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'kind', 'filename', 'total_size', 'received_size', 'next_part', 'part_size', 'checksum', 'status', 'created_at')
+        read_only_fields = ('id', 'received_size', 'checksum', 'status', 'created_at')
+
+    def get_part_size(self, obj):
+        return PART_SIZE
+
+
+class UploadSessionField(serializers.UUIDField):
+    '''
+    Accepts the id of a complete UploadSession of the given kind owned by the requesting user,
+    and returns the session. The caller attaches it with `session.attach()` when saving.
+    '''
+
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        kwargs.setdefault('write_only', True)
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        upload_id = super().to_internal_value(data)
+        request = self.context.get('request')
+        try:
+            return UploadSession.objects.get(
+                pk=upload_id, user_id=request.user.pk, kind=self.kind, status=UploadSession.COMPLETE,
+            )
+        except UploadSession.DoesNotExist:
+            raise serializers.ValidationError('No complete upload with this id.')
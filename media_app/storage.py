@@ -0,0 +1,94 @@
+'''
+Media Storage
+
+With AWS_QUERYSTRING_AUTH every storage.url() call computes a new SigV4 signature, and a feed page asks for
+dozens of them. CachedSignatureS3Storage reuses signed URLs instead: time is cut into windows of half the URL
+lifetime (AWS_QUERYSTRING_EXPIRE), and a file is signed at most once per window, per process. A URL is never
+handed out with less than half its lifetime left, and clients see the same URL for a file within a window, so
+their HTTP caches can reuse the download.
+
+Signed URLs are kept in a per-process LRU of SIGNED_URL_CACHE_SIZE entries; entries of past windows are never
+asked for again and age out first.
+
+Storage calls are timed into the request's storage time (trend.instrumentation).
+
+Usage:
+    DEFAULT_FILE_STORAGE = 'media_app.storage.CachedSignatureS3Storage'
+'''
+
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from storages.backends.s3boto3 import S3Boto3Storage
+from trend.instrumentation import timed
+
+
+class LRUCache:
+    '''
+    A thread-safe, in-memory mapping that drops its least recently used entries beyond `max_entries`.
+    '''
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+signed_urls = LRUCache(settings.SIGNED_URL_CACHE_SIZE)
+
+
+class CachedSignatureS3Storage(S3Boto3Storage):
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        # Only plain GET URLs are shared; anything else is signed for its caller
+        if not self.querystring_auth or parameters or http_method:
+            with timed('storage'):
+                return super().url(name, parameters, expire, http_method)
+        if expire is None:
+            expire = self.querystring_expire
+        window = max(expire // 2, 1)
+        key = (self.bucket_name, name, expire, int(time.time()) // window)
+        url = signed_urls.get(key)
+        if url is None:
+            with timed('storage'):
+                url = super().url(name, expire=expire)
+            signed_urls.set(key, url)
+        return url
+
+    def _save(self, name, content):
+        with timed('storage'):
+            return super()._save(name, content)
+
+    def _open(self, name, mode='rb'):
+        with timed('storage'):
+            return super()._open(name, mode)
+
+    def exists(self, name):
+        with timed('storage'):
+            return super().exists(name)
+
+    def delete(self, name):
+        with timed('storage'):
+            return super().delete(name)
+
+    def size(self, name):
+        with timed('storage'):
+            return super().size(name)
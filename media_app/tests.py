@@ -0,0 +1,233 @@
+import hashlib
+import io
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory
+from authentication.models import CustomUser
+from post.models import Post
+from post.tests import LOCAL_STORAGES
+from .models import Rendition, RenditionJob, UploadSession
+from .renditions import DiskLRUCache, generate_renditions, source_cache
+from .serializers import RenditionField, RenditionListSerializer
+from .storage import CachedSignatureS3Storage
+from .uploads import MIN_PART_SIZE, chain_checksum
+
+
+def _image(width, height, image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (30, 120, 200)).save(buffer, image_format)
+    return ContentFile(buffer.getvalue(), name=f'image.{image_format.lower()}')
+
+
+class ImageSerializer(serializers.Serializer):
+    image = RenditionField(width=96)
+
+    class Meta:
+        list_serializer_class = RenditionListSerializer
+
+
+class StorageSettingsTests(TestCase):
+    def test_media_is_stored_with_cached_signatures_by_default(self):
+        self.assertIsInstance(storages['default'], CachedSignatureS3Storage)
+
+
+class DiskLRUCacheTests(TestCase):
+    '''
+    The cache stays under its byte budget by dropping the least recently read files.
+    '''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = DiskLRUCache(directory.name, max_bytes=25)
+
+    def test_least_recently_used_files_are_evicted(self):
+        for age, key in enumerate(('old', 'read', 'new')):
+            path = self.cache.put(key, io.BytesIO(b'x' * 10))
+            os.utime(path, (1000 + age, 1000 + age))
+        # 30 bytes were written, so the oldest file went; reading 'read' makes it the newest
+        self.assertIsNone(self.cache.get('old'))
+        self.assertIsNotNone(self.cache.get('read'))
+        self.cache.put('newest', io.BytesIO(b'x' * 10))
+        self.assertIsNone(self.cache.get('new'))
+        with open(self.cache.get('read'), 'rb') as cached:
+            self.assertEqual(cached.read(), b'x' * 10)
+
+    def test_fetch_downloads_once(self):
+        storage = mock.Mock()
+        storage.open.return_value = io.BytesIO(b'original')
+        path = self.cache.fetch('images/a.png', storage)
+        self.assertEqual(self.cache.fetch('images/a.png', storage), path)
+        storage.open.assert_called_once_with('images/a.png', 'rb')
+
+
+class RenditionTests(TestCase):
+    '''
+    Saved images are queued, rendered by the worker and served at the smallest fitting width.
+    '''
+
+    def setUp(self):
+        cache.clear()
+        media, originals = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(originals.cleanup)
+        settings = override_settings(STORAGES=LOCAL_STORAGES, MEDIA_ROOT=media.name, RENDITION_WIDTHS=[48, 96, 320])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patch = mock.patch.object(source_cache, 'directory', originals.name)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='alice')
+        RenditionJob.objects.all().delete()  # the default avatar is not in this MEDIA_ROOT
+
+    def post(self, width, height):
+        return Post.objects.create(user=self.user, image=_image(width, height), content='post')
+
+    def render(self):
+        # TestCase runs in one transaction, which the worker's close_old_connections() would end
+        with mock.patch('media_app.management.commands.run_rendition_worker.close_old_connections'):
+            call_command('run_rendition_worker', '--once', stdout=io.StringIO())
+
+    def test_saving_an_image_queues_it_once(self):
+        post = self.post(200, 100)
+        post.content = 'edited'
+        post.save()
+        post.save(update_fields=['content'])
+        self.assertEqual(RenditionJob.objects.filter(source=post.image.name).count(), 1)
+        self.assertFalse(Rendition.objects.exists())
+
+    def test_worker_renders_every_narrower_width(self):
+        post = self.post(200, 100)
+        self.render()
+        renditions = Rendition.objects.filter(source=post.image.name)
+        self.assertEqual(sorted(renditions.values_list('width', 'format')), [
+            (48, 'jpeg'), (48, 'webp'), (96, 'jpeg'), (96, 'webp'),
+        ])
+        with default_storage.open(renditions.get(width=96, format='webp').file.name) as rendered:
+            self.assertEqual(Image.open(rendered).size, (96, 48))
+        self.assertEqual(RenditionJob.objects.get(source=post.image.name).state, RenditionJob.DONE)
+
+    def test_narrow_images_are_done_without_renditions(self):
+        post = self.post(40, 40)
+        self.render()
+        self.assertEqual(generate_renditions(post.image.name), 0)
+        self.assertEqual(RenditionJob.objects.get(source=post.image.name).state, RenditionJob.DONE)
+        self.assertIsNone(RenditionJob.claim_next())
+
+    def test_unreadable_images_fail_without_retry(self):
+        post = Post.objects.create(user=self.user, image=ContentFile(b'not an image', name='broken.png'), content='post')
+        self.render()
+        job = RenditionJob.objects.get(source=post.image.name)
+        self.assertEqual((job.state, job.attempts), (RenditionJob.FAILED, 1))
+
+    def test_field_serves_the_smallest_fitting_rendition(self):
+        posts = [self.post(200, 100), self.post(60, 60)]
+        self.render()
+        request = APIRequestFactory().get('/', HTTP_ACCEPT='image/webp,*/*')
+
+        # one lookup for the renditions of the whole page
+        with self.assertNumQueries(1):
+            data = ImageSerializer(posts, many=True, context={'request': request}).data
+        self.assertRegex(data[0]['image'], r'^http://testserver/media/renditions/.+_96\.webp$')
+        # no rendition of the narrow image is wide enough, so its original is served
+        self.assertEqual(data[1]['image'], request.build_absolute_uri(posts[1].image.url))
+
+        data = ImageSerializer(posts[0], context={'request': APIRequestFactory().get('/')}).data
+        self.assertTrue(data['image'].endswith('_96.jpg'))
+        with self.settings(RENDITION_CDN_URL='https://cdn.example.com/'):
+            self.assertRegex(ImageSerializer(posts[0]).data['image'], r'^https://cdn\.example\.com/renditions/.+_96\.jpg$')
+
+
+class ChunkedUploadTests(TestCase):
+    '''
+    The upload state machine: parts in order, checksummed completion, and aborts.
+    '''
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(STORAGES=LOCAL_STORAGES, MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.parts = [b'\x89PNG\r\n\x1a\n'.ljust(MIN_PART_SIZE, b'\0'), b'\1' * 1024]
+
+    def start(self):
+        response = self.client.post(reverse('upload-create'), {
+            'kind': 'image', 'filename': 'photo.png', 'total_size': sum(map(len, self.parts)),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put_part(self, upload_id, number):
+        part = self.parts[number - 1]
+        return self.client.put(
+            reverse('upload-part', args=[upload_id, number]), part, content_type='application/octet-stream',
+            HTTP_X_CONTENT_SHA256=hashlib.sha256(part).hexdigest(),
+        )
+
+    def complete(self, upload_id, checksum=None):
+        return self.client.post(reverse('upload-complete', args=[upload_id]), {'checksum': checksum}, format='json')
+
+    def test_parts_must_arrive_in_order(self):
+        upload_id = self.start()
+        response = self.put_part(upload_id, 2)
+        self.assertEqual((response.status_code, response.data['detail']), (409, 'Expected part 1.'))
+        self.assertEqual(self.put_part(upload_id, 1).status_code, 200)
+        # re-sending the last stored part is a no-op, skipping ahead is not
+        self.assertEqual(self.put_part(upload_id, 1).data['next_part'], 2)
+        self.assertEqual(self.client.put(reverse('upload-part', args=[upload_id, 3]), b'x', content_type='application/octet-stream').status_code, 409)
+
+    def test_complete_checks_the_chained_checksum_once(self):
+        upload_id = self.start()
+        for number in (1, 2):
+            self.put_part(upload_id, number)
+        checksum = ''
+        for part in self.parts:
+            checksum = chain_checksum(checksum, hashlib.sha256(part).hexdigest())
+
+        self.assertEqual(self.complete(upload_id, '0' * 64).status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).status, UploadSession.UPLOADING)
+        response = self.complete(upload_id, checksum)
+        self.assertEqual((response.status_code, response.data['status']), (200, UploadSession.COMPLETE))
+        with default_storage.open(UploadSession.objects.get(pk=upload_id).key) as assembled:
+            self.assertEqual(assembled.read(), b''.join(self.parts))
+
+        self.assertEqual(self.complete(upload_id, checksum).status_code, 409)
+        self.assertEqual(self.client.delete(reverse('upload-detail', args=[upload_id])).status_code, 409)
+
+    def test_aborted_uploads_take_no_more_parts(self):
+        upload_id = self.start()
+        self.put_part(upload_id, 1)
+        key = UploadSession.objects.get(pk=upload_id).key
+        self.assertTrue(default_storage.exists(f'{key}.part1'))
+
+        self.assertEqual(self.client.delete(reverse('upload-detail', args=[upload_id])).status_code, 204)
+        self.assertFalse(default_storage.exists(f'{key}.part1'))
+        self.assertEqual(self.put_part(upload_id, 2).status_code, 409)
+        self.assertEqual(self.complete(upload_id).status_code, 409)
+
+    def test_stale_uploads_are_aborted(self):
+        stale_id, fresh_id = self.start(), self.start()
+        for upload_id in (stale_id, fresh_id):
+            self.put_part(upload_id, 1)
+        UploadSession.objects.filter(pk=stale_id).update(updated_at=timezone.now() - timedelta(days=2))
+
+        call_command('abort_stale_uploads', stdout=io.StringIO())
+        stale, fresh = UploadSession.objects.get(pk=stale_id), UploadSession.objects.get(pk=fresh_id)
+        self.assertEqual((stale.status, fresh.status), (UploadSession.ABORTED, UploadSession.UPLOADING))
+        self.assertFalse(default_storage.exists(f'{stale.key}.part1'))
+        self.assertTrue(default_storage.exists(f'{fresh.key}.part1'))
@@ -0,0 +1,293 @@
+'''
+Chunked Uploads
+
+Backends that stream the parts of a resumable upload (see UploadSession) straight into storage, so no request
+ever holds more than one part and no part is held in memory.
+
+Functions:
+    start_upload(user, kind, filename, total_size): Checks the declared file and opens an UploadSession.
+    upload_part(session_id, number, stream, size, sha256): Streams one part of the file into storage.
+    complete_upload(session, checksum): Assembles the parts into the final file.
+    abort_upload(session): Discards the parts of an unfinished upload.
+
+Oversized files and wrong extensions are refused by start_upload, and content that doesn't match its extension
+is refused as soon as the first chunk of part 1 is read. Every part is hashed while it is read.
+
+Classes:
+    LocalMultipartBackend: For storages on local disk. Parts are written to `<name>.part<n>` files and
+        concatenated on completion.
+    S3MultipartBackend: For S3 storages. Parts are sent as an S3 multipart upload, which S3 assembles itself.
+
+Constants:
+    UPLOAD_KINDS: The size limit, allowed extensions, storage folder and file signatures of each upload kind.
+'''
+
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import transaction
+from .models import UploadSession
+
+
+def _is_video(head):
+    return head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip') or (head[:4] == b'RIFF' and head[8:12] == b'AVI ')
+
+
+def _is_image(head):
+    return (
+        head[:3] == b'\xff\xd8\xff'  # JPEG
+        or head[:8] == b'\x89PNG\r\n\x1a\n'
+        or head[:6] in (b'GIF87a', b'GIF89a')
+        or (head[:4] == b'RIFF' and head[8:12] == b'WEBP')
+    )
+
+
+UPLOAD_KINDS = {
+    'video': {
+        'max_size': 200 * 1024 * 1024,  # same limit as vlog.models.validate_video_size
+        'extensions': ['mp4', 'mov', 'avi'],
+        'upload_to': 'vlogs/',
+        'signature': _is_video,
+    },
+    'image': {
+        'max_size': 20 * 1024 * 1024,
+        'extensions': ['jpg', 'jpeg', 'png', 'gif', 'webp'],
+        'upload_to': 'images/',
+        'signature': _is_image,
+    },
+}
+
+PART_SIZE = 8 * 1024 * 1024  # suggested to clients
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects smaller parts, except the last one
+MAX_PART_SIZE = 64 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class UploadRejected(Exception):
+    pass
+
+
+def spool_part(stream, expected_size, check_signature=None):
+    '''
+    Copy one part from the request stream into a temporary file, in READ_CHUNK_SIZE reads.
+
+    Returns (file, sha256 hex digest). The part must be exactly `expected_size` bytes long. When given,
+    `check_signature` is called with the first bytes so a wrong file type is rejected before the rest is read.
+    '''
+    part = tempfile.SpooledTemporaryFile(max_size=READ_CHUNK_SIZE)
+    digest = hashlib.sha256()
+    received = 0
+    try:
+        while received < expected_size:
+            chunk = stream.read(min(READ_CHUNK_SIZE, expected_size - received))
+            if not chunk:
+                break
+            if check_signature is not None:
+                if not check_signature(chunk[:16]):
+                    raise UploadRejected('The file content does not match its extension.')
+                check_signature = None
+            digest.update(chunk)
+            part.write(chunk)
+            received += len(chunk)
+        if received != expected_size or stream.read(1):
+            raise UploadRejected('The part size does not match its Content-Length.')
+    except Exception:
+        part.close()
+        raise
+    part.seek(0)
+    return part, digest.hexdigest()
+
+
+class LocalMultipartBackend:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def _part_path(self, session, number):
+        return self.storage.path(f'{session.key}.part{number}')
+
+    def start(self, session):
+        os.makedirs(os.path.dirname(self.storage.path(session.key)), exist_ok=True)
+        return ''
+
+    def upload_part(self, session, number, part):
+        with open(self._part_path(session, number), 'wb') as destination:
+            shutil.copyfileobj(part, destination, READ_CHUNK_SIZE)
+        return ''
+
+    def complete(self, session):
+        final_path = self.storage.path(session.key)
+        with open(final_path + '.assembling', 'wb') as destination:
+            for number in range(1, len(session.parts) + 1):
+                with open(self._part_path(session, number), 'rb') as source:
+                    shutil.copyfileobj(source, destination, READ_CHUNK_SIZE)
+        os.replace(final_path + '.assembling', final_path)
+        self.abort(session)
+
+    def abort(self, session):
+        for number in range(1, len(session.parts) + 2):
+            try:
+                os.remove(self._part_path(session, number))
+            except FileNotFoundError:
+                pass
+
+
+class S3MultipartBackend:
+    def __init__(self, storage):
+        from storages.utils import clean_name
+        self.storage = storage
+        self._key = lambda name: storage._normalize_name(clean_name(name))
+
+    @property
+    def client(self):
+        return self.storage.connection.meta.client
+
+    def start(self, session):
+        response = self.client.create_multipart_upload(
+            Bucket=self.storage.bucket_name,
+            Key=self._key(session.key),
+            ContentType=mimetypes.guess_type(session.key)[0] or 'application/octet-stream',
+            **self.storage.get_object_parameters(session.key),
+        )
+        return response['UploadId']
+
+    def upload_part(self, session, number, part):
+        response = self.client.upload_part(
+            Bucket=self.storage.bucket_name,
+            Key=self._key(session.key),
+            UploadId=session.multipart_id,
+            PartNumber=number,
+            Body=part,
+        )
+        return response['ETag']
+
+    def complete(self, session):
+        self.client.complete_multipart_upload(
+            Bucket=self.storage.bucket_name,
+            Key=self._key(session.key),
+            UploadId=session.multipart_id,
+            MultipartUpload={'Parts': [
+                {'ETag': part['etag'], 'PartNumber': number}
+                for number, part in enumerate(session.parts, start=1)
+            ]},
+        )
+
+    def abort(self, session):
+        self.client.abort_multipart_upload(
+            Bucket=self.storage.bucket_name,
+            Key=self._key(session.key),
+            UploadId=session.multipart_id,
+        )
+
+
+def get_backend(storage=default_storage):
+    try:
+        storage.path('')
+        return LocalMultipartBackend(storage)
+    except NotImplementedError:
+        pass
+    if hasattr(storage, 'bucket_name') and hasattr(storage, 'connection'):
+        return S3MultipartBackend(storage)
+    raise ImproperlyConfigured(f'Chunked uploads are not supported by {storage.__class__.__name__}.')
+
+
+class UploadConflict(Exception):
+    pass
+
+
+def chain_checksum(previous, part_digest):
+    return hashlib.sha256((previous + part_digest).encode()).hexdigest()
+
+
+def start_upload(user, kind, filename, total_size):
+    '''
+    Validate the declared file and open an UploadSession and its multipart upload in storage.
+    '''
+    limits = UPLOAD_KINDS[kind]
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension not in limits['extensions']:
+        raise UploadRejected(f"File extension '{extension}' is not allowed. Allowed extensions are: {', '.join(limits['extensions'])}.")
+    if total_size > limits['max_size']:
+        raise UploadRejected(f"File size exceeds the maximum allowed size of {limits['max_size'] // (1024 * 1024)} MB.")
+
+    session = UploadSession(user=user, kind=kind, filename=filename, total_size=total_size)
+    session.key = f"{limits['upload_to']}{session.id.hex}.{extension}"
+    session.multipart_id = get_backend().start(session)
+    session.save()
+    return session
+
+
+def upload_part(session_id, number, stream, size, sha256=None):
+    '''
+    Stream part `number` of an upload into storage and record it.
+
+    The request body is spooled to a temporary file before the session row is locked, so slow clients never hold
+    the lock. Re-sending the last stored part with the same content is accepted, so clients can retry blindly.
+    '''
+    session = UploadSession.objects.get(pk=session_id)
+    if session.status != UploadSession.UPLOADING:
+        raise UploadConflict(f'The upload is {session.status}.')
+    if session.parts and number == len(session.parts) and session.parts[-1]['sha256'] == sha256:
+        return session
+    if number != session.next_part:
+        raise UploadConflict(f'Expected part {session.next_part}.')
+    if size > MAX_PART_SIZE:
+        raise UploadRejected(f'Parts can be at most {MAX_PART_SIZE // (1024 * 1024)} MB.')
+    remaining = session.total_size - session.received_size
+    if size > remaining:
+        raise UploadRejected('The part exceeds the declared file size.')
+    if size < min(MIN_PART_SIZE, remaining):
+        raise UploadRejected(f'Every part but the last must be at least {MIN_PART_SIZE // (1024 * 1024)} MB.')
+
+    check_signature = UPLOAD_KINDS[session.kind]['signature'] if number == 1 else None
+    part, digest = spool_part(stream, size, check_signature)
+    with part:
+        if sha256 is not None and sha256.lower() != digest:
+            raise UploadRejected('The part does not match its X-Content-SHA256 header.')
+
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session_id)
+            if session.status != UploadSession.UPLOADING or number != session.next_part:
+                raise UploadConflict(f'Expected part {session.next_part}.')
+            etag = get_backend().upload_part(session, number, part)
+            session.parts.append({'size': size, 'sha256': digest, 'etag': etag})
+            session.received_size += size
+            session.checksum = chain_checksum(session.checksum, digest)
+            session.save(update_fields=['parts', 'received_size', 'checksum', 'updated_at'])
+    return session
+
+
+def complete_upload(session, checksum=None):
+    '''
+    Assemble the uploaded parts into the final file at `session.key`.
+    '''
+    if session.status != UploadSession.UPLOADING:
+        raise UploadConflict(f'The upload is {session.status}.')
+    if session.received_size != session.total_size:
+        raise UploadRejected(f'Received {session.received_size} of {session.total_size} bytes.')
+    if checksum is not None and checksum.lower() != session.checksum:
+        raise UploadRejected('The checksum does not match the uploaded parts.')
+    if not UploadSession.objects.filter(pk=session.pk, status=UploadSession.UPLOADING).update(status=UploadSession.COMPLETE):
+        raise UploadConflict('The upload is no longer in progress.')
+    try:
+        get_backend().complete(session)
+    except Exception:
+        UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.UPLOADING)
+        raise
+    session.status = UploadSession.COMPLETE
+    return session
+
+
+def abort_upload(session):
+    '''
+    Discard the stored parts of an unfinished upload.
+    '''
+    if session.status != UploadSession.UPLOADING:
+        raise UploadConflict(f'The upload is {session.status}.')
+    get_backend().abort(session)
+    session.status = UploadSession.ABORTED
+    session.save(update_fields=['status', 'updated_at'])
+    return session
@@ -0,0 +1,10 @@
+from django.urls import path
+from .views import UploadCompleteView, UploadCreateView, UploadDetailView, UploadPartView
+
+urlpatterns = [
+    # Chunked upload endpoints
+    path('uploads/', UploadCreateView.as_view(), name='upload-create'),
+    path('uploads/<uuid:pk>/', UploadDetailView.as_view(), name='upload-detail'),
+    path('uploads/<uuid:pk>/parts/<int:number>/', UploadPartView.as_view(), name='upload-part'),
+    path('uploads/<uuid:pk>/complete/', UploadCompleteView.as_view(), name='upload-complete'),
+]
@@ -0,0 +1,102 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import UploadSession
+from .serializers import UploadSessionSerializer
+from .uploads import UploadConflict, UploadRejected, abort_upload, complete_upload, start_upload, upload_part
+
+
+def _error_response(error):
+    code = status.HTTP_409_CONFLICT if isinstance(error, UploadConflict) else status.HTTP_400_BAD_REQUEST
+    return Response({'detail': str(error)}, status=code)
+
+
+class UploadCreateView(generics.CreateAPIView):
+    """
+    API view to start a chunked upload.
+    method : " POST "
+    body : {
+        "kind": "video",
+        "filename": "holiday.mp4",
+        "total_size": 73400320
+    }
+    The response carries the upload `id` and the suggested `part_size`.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = start_upload(request.user, **serializer.validated_data)
+        except UploadRejected as e:
+            return _error_response(e)
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class UploadDetailView(APIView):
+    """
+    API view to check the progress of an upload (GET), e.g. to resume it from `next_part`, or abort it (DELETE).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self, pk):
+        return get_object_or_404(UploadSession, pk=pk, user_id=self.request.user.pk)
+
+    def get(self, request, pk):
+        return Response(UploadSessionSerializer(self.get_object(pk)).data)
+
+    def delete(self, request, pk):
+        try:
+            abort_upload(self.get_object(pk))
+        except UploadConflict as e:
+            return _error_response(e)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadPartView(APIView):
+    """
+    API view to upload one part of a file.
+    method : " PUT "
+    body : the raw bytes of the part, with a Content-Length header
+    Parts are numbered from 1 and must be sent in order; an optional X-Content-SHA256 header is checked against the part.
+    The body is streamed to storage as it is read, it is never parsed or buffered in memory.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, pk, number):
+        get_object_or_404(UploadSession, pk=pk, user_id=request.user.pk)
+        try:
+            size = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            size = 0
+        if size <= 0:
+            return Response({'detail': 'A Content-Length header is required.'}, status=status.HTTP_411_LENGTH_REQUIRED)
+        try:
+            session = upload_part(pk, number, request._request, size, request.META.get('HTTP_X_CONTENT_SHA256'))
+        except (UploadConflict, UploadRejected) as e:
+            return _error_response(e)
+        return Response(UploadSessionSerializer(session).data)
+
+
+class UploadCompleteView(APIView):
+    """
+    API view to finish an upload once every part is sent.
+    method : " POST "
+    body : {
+        "checksum": "<optional chained SHA-256 of the parts>"
+    }
+    The upload `id` can then be passed as `upload_id` when creating a video or post.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, user_id=request.user.pk)
+        try:
+            complete_upload(session, request.data.get('checksum'))
+        except (UploadConflict, UploadRejected) as e:
+            return _error_response(e)
+        return Response(UploadSessionSerializer(session).data)
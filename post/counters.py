@@ -0,0 +1,119 @@
+'''
+Write-behind Counters
+
+With LIKE_COUNTER_WRITE_BEHIND on, likes and unlikes no longer update their counter row in the request: the
+change is added to an in-process buffer once the like is committed, and a background thread applies the buffer
+every LIKE_COUNTER_FLUSH_INTERVAL seconds with one `UPDATE ... SET count = count + n` per object. A viral post
+then costs its counter row one short update per process and interval instead of a row lock queue of every liker.
+Reads (Post.like_count, Video.like_count) add the delta still pending in their process, so a user sees their own
+like at once; likes made through other processes show up within one interval.
+
+The buffer is split into LIKE_COUNTER_BUFFER_SHARDS shards, each with its own lock, so concurrent requests of a
+process rarely wait on each other.
+
+Crash safety: the like rows themselves are written synchronously and stay the source of truth; only counter
+deltas are buffered. The buffer is flushed when the process exits normally, and a failed flush keeps its deltas
+for the next one. A process that is killed loses at most one interval of deltas, which
+`python manage.py reconcile_counters` recomputes from the like rows; run it after a crash, or periodically.
+It also repairs the rare counter that a flush creates (see PostCounter.adjust) while newer deltas are pending.
+
+Usage:
+    counter_buffer.add(LikeCounter, post.pk, 1)  # after commit
+    counter_buffer.pending(LikeCounter, post.pk)
+'''
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._shards = []
+
+    def _ensure_started(self):
+        # A forked child must not flush the deltas of its parent again, and needs its own flusher thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._shards = [(threading.Lock(), Counter()) for _ in range(settings.LIKE_COUNTER_BUFFER_SHARDS)]
+            self._start_flusher()
+            self._pid = os.getpid()
+
+    def _start_flusher(self):
+        threading.Thread(target=self._run, name='counter-buffer-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(settings.LIKE_COUNTER_FLUSH_INTERVAL)
+            close_old_connections()
+            self.flush()
+
+    def _shard(self, object_id):
+        return self._shards[hash(object_id) % len(self._shards)]
+
+    def add(self, counter_model, object_id, delta):
+        '''
+        Buffer `delta` for the counter of `counter_model` of the given object. Call it once the change is committed.
+        '''
+        self._ensure_started()
+        lock, deltas = self._shard(object_id)
+        with lock:
+            deltas[counter_model, object_id] += delta
+
+    def pending(self, counter_model, object_id):
+        '''
+        The delta of this counter that this process has not flushed yet.
+        '''
+        if self._pid != os.getpid():
+            return 0
+        lock, deltas = self._shard(object_id)
+        with lock:
+            return deltas.get((counter_model, object_id), 0)
+
+    def flush(self):
+        '''
+        Apply every buffered delta; deltas that fail to apply stay buffered. Returns the counters updated.
+
+        A delta leaves the buffer only once its counter is updated, so `pending()` never misses a like that
+        the counter row doesn't show yet. One flush runs at a time, so no delta is applied twice.
+        '''
+        if self._pid != os.getpid():
+            return 0
+        flushed = 0
+        with self._flush_lock:
+            for lock, deltas in self._shards:
+                with lock:
+                    batch = {key: delta for key, delta in deltas.items() if delta}
+                for (counter_model, object_id), delta in batch.items():
+                    # adjust() only needs the primary key of the counted object (a Post or Video)
+                    owner_model = next(field.related_model for field in counter_model._meta.fields if field.one_to_one)
+                    try:
+                        counter_model.adjust(owner_model(pk=object_id), delta)
+                    except Exception:
+                        logger.exception('Could not flush %s of %s; kept for the next flush', counter_model.__name__, object_id)
+                        continue
+                    with lock:
+                        # Deltas added since the batch was taken stay buffered
+                        deltas[counter_model, object_id] -= delta
+                        if not deltas[counter_model, object_id]:
+                            del deltas[counter_model, object_id]
+                    flushed += 1
+        return flushed
+
+
+counter_buffer = CounterBuffer()
+atexit.register(counter_buffer.flush)
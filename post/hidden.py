@@ -0,0 +1,30 @@
+'''
+Hidden Posts
+
+Filters the posts a user has hidden out of the feeds (post list, profile posts, home timeline).
+
+Functions:
+    exclude_hidden(queryset, user, field): Filters a queryset with a single NOT EXISTS subquery against HiddenPost.
+
+The anti-join probes the unique (user, post) index once per row, so its cost does not grow with the number of
+posts a user has hidden, unlike `exclude(id__in=...)`. It is applied for every authenticated user rather than
+skipped for users with a cached empty hidden list: a per-process cache would keep showing a post hidden through
+another process until it expired.
+
+Usage:
+    queryset = exclude_hidden(Post.objects.all(), request.user)
+'''
+
+from django.db.models import Exists, OuterRef
+from .models import HiddenPost
+
+
+def exclude_hidden(queryset, user, field='pk'):
+    '''
+    Exclude rows whose `field` post `user` has hidden, with `NOT EXISTS (SELECT ... FROM post_hiddenpost ...)`.
+
+    Anonymous users have hidden nothing and get the queryset unchanged.
+    '''
+    if not user or not user.is_authenticated:
+        return queryset
+    return queryset.filter(~Exists(HiddenPost.objects.filter(user_id=user.pk, post=OuterRef(field))))
@@ -0,0 +1,129 @@
+'''
+Liked State
+
+Answers "which of these objects has the viewer liked?" for a whole page at once, with a single
+`WHERE user_id = ... AND <object>_id IN (...)` query on the unique (object, user) index. The answer is not cached:
+likes are written by other processes, and by other code than the views below, which a per-process cache can't see.
+
+The likers of an object are read straight from the like table, newest first, with their user and profile
+joined in (see `likers`); paginated on (created_at, id), a page costs one index range scan however many likes
+the object has.
+
+Likes are written with one statement each: `INSERT ... ON CONFLICT DO NOTHING` to like and a plain `DELETE` to
+unlike, whose row counts tell whether anything changed. The like counter is adjusted only then, in the same
+transaction, so repeated or concurrent requests of one user can neither fail on the unique constraint nor
+count a like twice. With LIKE_COUNTER_WRITE_BEHIND the counter is adjusted later instead (see post.counters).
+
+Usage:
+    liked = post_likes.liked_ids(request.user, page)  # frozenset of the liked post IDs
+    likes = post_likes.likers(post_id, request.user)  # for post.serializers.LikerSerializer
+    post_likes.like(request.user, post)  # True when the like was added, False when it already existed
+'''
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.utils import timezone
+from authentication.blocking import exclude_blocked
+from profile_app.models import Follow
+from .counters import counter_buffer
+from .models import LikeCounter, LikePost
+
+
+class LikedIds:
+    def __init__(self, name, like_model, field, counter_model):
+        self.name = name
+        self.like_model = like_model
+        self.field = field
+        self.counter_model = counter_model
+
+    def liked_ids(self, user, objects):
+        '''
+        Return the IDs of the `objects` (model instances) that `user` has liked.
+        '''
+        if not user or not user.is_authenticated or not objects:
+            return frozenset()
+        return frozenset(
+            self.like_model.objects.filter(user_id=user.pk, **{f'{self.field}_id__in': [obj.pk for obj in objects]})
+            .values_list(f'{self.field}_id', flat=True)
+        )
+
+    def likers(self, object_id, viewer):
+        '''
+        Return the likes of an object with their user and profile selected and whether `viewer` follows each
+        liker annotated, without the likers blocking or blocked by `viewer`.
+        '''
+        likes = (
+            self.like_model.objects.filter(**{f'{self.field}_id': object_id})
+            .select_related('user__profile')
+            .only('id', 'created_at', 'user__id', 'user__username', 'user__profile__id',
+                  'user__profile__avatar', 'user__profile__hide_avatar')
+        )
+        if viewer.is_authenticated:
+            is_following = Exists(Follow.objects.filter(follower_id=viewer.pk, following_id=OuterRef('user_id')))
+        else:
+            is_following = Value(False, output_field=BooleanField())
+        return exclude_blocked(likes.annotate(is_following=is_following), viewer, field='user')
+
+    def _insert(self, connection, user_id, object_id):
+        meta = self.like_model._meta
+        quote = connection.ops.quote_name
+        created_at = meta.get_field('created_at').get_db_prep_value(timezone.now(), connection)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(meta.db_table)} ({quote(meta.get_field(self.field).column)}, {quote("user_id")}, {quote("created_at")}) '
+                'VALUES (%s, %s, %s) ON CONFLICT DO NOTHING',
+                [object_id, user_id, created_at],
+            )
+            return cursor.rowcount == 1
+
+    def _delete(self, connection, user_id, object_id):
+        meta = self.like_model._meta
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(meta.db_table)} WHERE {quote(meta.get_field(self.field).column)} = %s AND {quote("user_id")} = %s',
+                [object_id, user_id],
+            )
+            return cursor.rowcount == 1
+
+    def _write(self, user, obj, liked):
+        # liked is None to toggle: unlike when a like was removed, like otherwise
+        alias = router.db_for_write(self.like_model)
+        connection = connections[alias]
+        with transaction.atomic(using=alias):
+            if liked is None:
+                liked = not self._delete(connection, user.pk, obj.pk)
+                changed = not liked or self._insert(connection, user.pk, obj.pk)
+            elif liked:
+                changed = self._insert(connection, user.pk, obj.pk)
+            else:
+                changed = self._delete(connection, user.pk, obj.pk)
+            if changed:
+                delta = 1 if liked else -1
+                if settings.LIKE_COUNTER_WRITE_BEHIND:
+                    transaction.on_commit(lambda: counter_buffer.add(self.counter_model, obj.pk, delta), using=alias)
+                else:
+                    self.counter_model.adjust(obj, delta)
+        return liked, changed
+
+    def like(self, user, obj):
+        '''
+        Like `obj` as `user`. Returns whether a like was added; liking twice is a no-op.
+        '''
+        return self._write(user, obj, True)[1]
+
+    def unlike(self, user, obj):
+        '''
+        Remove the like of `user` on `obj`. Returns whether a like was removed; unliking twice is a no-op.
+        '''
+        return self._write(user, obj, False)[1]
+
+    def toggle(self, user, obj):
+        '''
+        Like `obj`, or remove the like when there is one. Returns whether `obj` is now liked.
+        '''
+        return self._write(user, obj, None)[0]
+
+
+post_likes = LikedIds('post', LikePost, 'post', LikeCounter)
@@ -0,0 +1,253 @@
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from authentication.serializers import MyTokenObtainPairSerializer
+from post.models import Post
+from post.seeding import SEED_PASSWORD, SEED_USERNAME_PREFIX
+from vlog.models import Video
+
+# The endpoints of trend/urls.py that leave the data as they found it, formatted with the ids of seeded objects.
+# Uploads, creates, toggles and follows are left out so that repeated runs measure the same dataset.
+ENDPOINTS = [
+    ('login', 'POST', '/login/', {'username': '{username}', 'password': SEED_PASSWORD}),
+    ('token-refresh', 'POST', '/login/refresh/', {'refresh': '{refresh}'}),
+    ('post-list', 'GET', '/post/', None),
+    ('post-detail', 'GET', '/post/{post}/', None),
+    ('post-comments', 'GET', '/post/{post}/comments/', None),
+    ('post-likers', 'GET', '/post/{post}/likers/', None),
+    ('comment-list', 'GET', '/post/comments/', None),
+    ('video-list', 'GET', '/videos/', None),
+    ('video-detail', 'GET', '/videos/{video}/', None),
+    ('video-comments', 'GET', '/videos/{video}/comments/', None),
+    ('video-likers', 'GET', '/videos/{video}/likers/', None),
+    ('profile-list', 'GET', '/profile/', None),
+    ('profile-detail', 'GET', '/profile/{profile}/', None),
+    ('profile-followers', 'GET', '/profile/{profile}/followers/', None),
+    ('profile-following', 'GET', '/profile/{profile}/following/', None),
+    ('profile-vlogs', 'GET', '/profile/{profile}/vlogs/', None),
+    ('follow-list', 'GET', '/follow/', None),
+    ('block-list', 'GET', '/block-list/', None),
+    ('timeline', 'GET', '/timeline/', None),
+]
+
+
+class Command(BaseCommand):
+    help = ('Measure p50/p95/p99 latency, queries per request and throughput of every read endpoint on seeded data '
+            '(python manage.py seed_data), and compare the results with a JSON baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per endpoint first')
+        parser.add_argument('--endpoint', action='append', help='Name of an endpoint to measure (repeatable; default: all)')
+        parser.add_argument('--gunicorn', action='store_true', help='Start a local gunicorn and measure over HTTP instead of with the test client')
+        parser.add_argument('--url', help='Measure an already running server at this URL over HTTP')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (with --gunicorn)')
+        parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker (with --gunicorn)')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent HTTP clients (with --gunicorn or --url)')
+        parser.add_argument('--output', help='Write the results to this JSON file, as a baseline for later runs')
+        parser.add_argument('--compare', help='Fail when an endpoint is slower or runs more queries than in this baseline')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown against the baseline (default: 0.2, i.e. 20%%)')
+
+    def handle(self, *args, **options):
+        """
+        Entry point of the management command.
+        """
+        if options['requests'] < 2:
+            raise CommandError('--requests must be at least 2.')
+        endpoints = [endpoint for endpoint in ENDPOINTS if not options['endpoint'] or endpoint[0] in options['endpoint']]
+        if not endpoints:
+            raise CommandError(f"Unknown endpoint; choose from {', '.join(endpoint[0] for endpoint in ENDPOINTS)}.")
+        ids = self.fixture_ids()
+
+        if options['gunicorn']:
+            port = self.free_port()
+            server = self.start_gunicorn(port, options['workers'], options['threads'])
+            try:
+                results = self.run_http(f'http://127.0.0.1:{port}', endpoints, ids, options)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            mode = f"gunicorn, {options['workers']} worker(s) x {options['threads']} thread(s)"
+        elif options['url']:
+            results = self.run_http(options['url'].rstrip('/'), endpoints, ids, options)
+            mode = options['url']
+        else:
+            results = self.run_test_client(endpoints, ids, options)
+            mode = 'test client'
+
+        self.report(results)
+        baseline = {
+            'created_at': timezone.now().isoformat(),
+            'mode': mode,
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(baseline, output, indent=2)
+            self.stdout.write(f"Baseline written to {options['output']}")
+        if options['compare']:
+            self.compare(baseline, options['compare'], options['tolerance'])
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def fixture_ids(self):
+        '''
+        Pick the busiest seeded objects: the viewer follows the most accounts, the post and video have the most likes.
+        '''
+        seeded = CustomUser.objects.filter(username__startswith=SEED_USERNAME_PREFIX)
+        viewer = seeded.annotate(follows=Count('following')).order_by('-follows', 'id').first()
+        if viewer is None:
+            raise CommandError('No seeded users; run python manage.py seed_data first.')
+        author = seeded.annotate(fans=Count('followers')).order_by('-fans', 'id').select_related('profile').first()
+        post = Post.objects.filter(user__in=seeded).annotate(likers=Count('likes')).order_by('-likers', 'id').first()
+        video = Video.objects.filter(author__in=seeded, status=Video.READY).annotate(likers=Count('likes')).order_by('-likers', 'id').first()
+        if post is None or video is None:
+            raise CommandError('The seeded users have no posts or videos; seed more data.')
+        return {'user': viewer, 'username': viewer.username, 'profile': author.profile.pk, 'post': post.pk, 'video': video.pk}
+
+    def request_body(self, body, ids):
+        if body is None:
+            return None
+        if '{refresh}' in body.values():
+            # Refresh tokens are blacklisted once rotated, so every refresh needs a new one
+            ids = {**ids, 'refresh': str(MyTokenObtainPairSerializer.get_token(ids['user']))}
+        return {key: value.format(**ids) for key, value in body.items()}
+
+    def summarize(self, latencies, queries, errors, elapsed):
+        p50, p95, p99 = (statistics.quantiles(latencies, n=100, method='inclusive')[i] for i in (49, 94, 98))
+        return {
+            'p50_ms': round(p50 * 1000, 2),
+            'p95_ms': round(p95 * 1000, 2),
+            'p99_ms': round(p99 * 1000, 2),
+            'throughput': round(len(latencies) / elapsed, 1),
+            'queries': statistics.mean(queries) if queries else None,
+            'errors': errors,
+        }
+
+    def run_test_client(self, endpoints, ids, options):
+        results = {}
+        # The test client sends Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            client = APIClient()
+            tokens = self.login(lambda path, body: client.post(path, body, format='json').json(), ids)
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+            for name, method, path, body in endpoints:
+                path, send = path.format(**ids), getattr(client, method.lower())
+                for _ in range(options['warmup']):
+                    send(path, self.request_body(body, ids), format='json')
+
+                latencies, queries, errors = [], [], 0
+                started = time.perf_counter()
+                for _ in range(options['requests']):
+                    data = self.request_body(body, ids)
+                    with CaptureQueriesContext(connection) as captured:
+                        begin = time.perf_counter()
+                        response = send(path, data, format='json')
+                        latencies.append(time.perf_counter() - begin)
+                    queries.append(len(captured))
+                    errors += response.status_code >= 400
+                results[name] = self.summarize(latencies, queries, errors, time.perf_counter() - started)
+        return results
+
+    def run_http(self, base_url, endpoints, ids, options):
+        import requests
+
+        session = requests.Session()
+        tokens = self.login(lambda path, body: session.post(base_url + path, json=body, timeout=60).json(), ids)
+        session.headers['Authorization'] = f"Bearer {tokens['access']}"
+        results = {}
+        for name, method, path, body in endpoints:
+            url = base_url + path.format(**ids)
+
+            def send(_):
+                data = self.request_body(body, ids)
+                begin = time.perf_counter()
+                response = session.request(method, url, json=data, timeout=60)
+                return time.perf_counter() - begin, response.status_code >= 400
+
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                list(executor.map(send, range(options['warmup'])))
+                started = time.perf_counter()
+                samples = list(executor.map(send, range(options['requests'])))
+            # Queries run in the server processes and are not counted over HTTP
+            results[name] = self.summarize(
+                [latency for latency, _ in samples], [], sum(error for _, error in samples), time.perf_counter() - started,
+            )
+        return results
+
+    def login(self, post, ids):
+        tokens = post('/login/', {'username': ids['username'], 'password': SEED_PASSWORD})
+        if 'access' not in tokens:
+            raise CommandError(f"Could not log in as {ids['username']}: {tokens}")
+        return tokens
+
+    def free_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def start_gunicorn(self, port, workers, threads):
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'trend.wsgi', '--bind', f'127.0.0.1:{port}',
+             '--workers', str(workers), '--threads', str(threads), '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env={**os.environ, 'ALLOWED_HOSTS': '127.0.0.1'},
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn exited with status {server.returncode}.')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('gunicorn did not start within 30 seconds.')
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'queries':>10}{'errors':>8}")
+        for name, result in results.items():
+            queries = '-' if result['queries'] is None else f"{result['queries']:.1f}"
+            self.stdout.write(
+                f"{name:<20}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+                f"{result['throughput']:>10}{queries:>10}{result['errors']:>8}"
+            )
+
+    def compare(self, current, path, tolerance):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['mode'] != current['mode'] or baseline['database'] != current['database']:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was measured with {baseline['mode']} on {baseline['database']}; latencies may not be comparable."
+            ))
+
+        regressions = []
+        for name, result in current['endpoints'].items():
+            before = baseline['endpoints'].get(name)
+            if before is None:
+                continue
+            if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {result['p95_ms']} ms")
+            if None not in (result['queries'], before['queries']) and result['queries'] > before['queries']:
+                regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries per request")
+            if result['errors'] > before['errors']:
+                regressions.append(f"{name}: {before['errors']} -> {result['errors']} errors")
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(f'No regressions against {path}.')
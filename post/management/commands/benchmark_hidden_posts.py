@@ -0,0 +1,99 @@
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from post.models import HiddenPost, Post
+from timeline.models import TimelineEntry
+from .check_query_plans import LOCAL_STORAGES
+
+# The feeds that filter out hidden posts, formatted with the ids of the generated objects
+FEEDS = [
+    ('post-list', '/post/'),
+    ('profile-detail', '/profile/{profile}/'),
+    ('timeline', '/timeline/'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure the feeds that filter out hidden posts as the hidden list of the viewer grows, and fail when their cost grows with it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[0, 10, 100, 1000, 5000], help='Hidden list sizes to measure')
+        parser.add_argument('--requests', type=int, default=20, help='Measured requests per feed and size')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed p50 growth from the smallest to the largest non-empty hidden list (default: 0.5, i.e. 50%%)')
+
+    def handle(self, *args, **options):
+        """
+        Entry point of the management command.
+        """
+        sizes = sorted(set(options['sizes']))
+        if sizes[0] < 0 or options['requests'] < 1:
+            raise CommandError('--sizes must not be negative and --requests must be at least 1.')
+
+        results = {}
+        # The generated rows never leave this transaction, and no file is read or signed
+        with transaction.atomic(), override_settings(STORAGES=LOCAL_STORAGES, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            viewer, profile, posts = self.generate(2 * sizes[-1] + 50)
+            client = APIClient()
+            client.force_authenticate(viewer)
+            for size in sizes:
+                HiddenPost.objects.filter(user=viewer).delete()
+                # Every other post from the newest, so the hidden posts are in the pages being read
+                HiddenPost.objects.bulk_create(HiddenPost(user=viewer, post=post) for post in posts[::2][:size])
+                for name, path in FEEDS:
+                    results[name, size] = self.measure(client, path.format(profile=profile), options['requests'])
+            transaction.set_rollback(True)
+
+        self.report(sizes, results)
+        growth = [size for size in sizes if size]
+        if len(growth) > 1:
+            regressions = [
+                f"{name}: p50 {results[name, growth[0]][0]:.2f} ms with {growth[0]} hidden posts, "
+                f"{results[name, growth[-1]][0]:.2f} ms with {growth[-1]}"
+                for name, _ in FEEDS
+                if results[name, growth[-1]][0] > results[name, growth[0]][0] * (1 + options['tolerance'])
+                or results[name, growth[-1]][1] > results[name, growth[0]][1]
+            ]
+            if regressions:
+                raise CommandError('Feeds slow down as the hidden list grows:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Hidden post filtering cost does not grow with the hidden list.'))
+
+    def generate(self, count):
+        '''
+        Create a viewer and an author with `count` posts, all of them in the viewer's timeline; returns them newest first.
+        '''
+        viewer = CustomUser.objects.create(username='hidden-benchmark-viewer', email='hidden-benchmark-viewer@example.com', password='!')
+        author = CustomUser.objects.create(username='hidden-benchmark-author', email='hidden-benchmark-author@example.com', password='!')
+        posts = Post.objects.bulk_create(
+            Post(user=author, image='images/hidden-benchmark.jpg', content=f'post {i}') for i in range(count)
+        )
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(owner=viewer, author=author, post=post, created_at=post.created_at) for post in posts
+        )
+        return viewer, author.profile.pk, sorted(posts, key=lambda post: (post.created_at, post.pk), reverse=True)
+
+    def measure(self, client, path, requests):
+        client.get(path)  # warm up
+        latencies, queries = [], 0
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                begin = time.perf_counter()
+                response = client.get(path)
+                latencies.append(time.perf_counter() - begin)
+            if response.status_code != 200:
+                raise CommandError(f'{path}: status {response.status_code}')
+            queries = len(captured)
+        return statistics.median(latencies) * 1000, queries
+
+    def report(self, sizes, results):
+        self.stdout.write(f"{'feed':<16}{'hidden':>8}{'p50 ms':>10}{'queries':>10}")
+        for name, _ in FEEDS:
+            for size in sizes:
+                p50, queries = results[name, size]
+                self.stdout.write(f'{name:<16}{size:>8}{p50:>10.2f}{queries:>10}')
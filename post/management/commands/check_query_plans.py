@@ -0,0 +1,143 @@
+import json
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from authentication.models import Block, CustomUser
+from post.models import Comment, HiddenPost, LikePost, Post
+from profile_app.models import Follow
+from timeline.models import TimelineEntry
+from vlog.models import Video, VlogComment, VlogLike
+
+# Tables that grow with usage; a list view must never read one of them in full
+LARGE_TABLES = {
+    model._meta.db_table for model in (
+        CustomUser, Block, Post, Comment, LikePost, HiddenPost, Follow, TimelineEntry, Video, VlogComment, VlogLike,
+    )
+}
+
+# The list endpoints, formatted with the ids of the seeded objects
+LIST_VIEWS = [
+    '/post/',
+    '/post/comments/',
+    '/post/{post}/comments/',
+    '/post/{post}/likers/',
+    '/videos/',
+    '/videos/{video}/comments/',
+    '/videos/{video}/likers/',
+    '/profile/',
+    '/profile/{profile}/',
+    '/profile/{profile}/followers/',
+    '/profile/{profile}/following/',
+    '/profile/{profile}/vlogs/',
+    '/timeline/',
+    '/block-list/',
+]
+
+LOCAL_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the queries of every list view on a seeded dataset and fail when one reads a large table in full or sorts without an index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plan of every query')
+
+    def handle(self, *args, **options):
+        """
+        Entry point of the management command.
+        """
+        problems = []
+        # The seeded rows never leave this transaction, and no file is read or signed
+        with transaction.atomic(), override_settings(STORAGES=LOCAL_STORAGES):
+            ids = self.seed()
+            client = APIClient()
+            client.force_authenticate(CustomUser.objects.get(pk=ids['viewer']))
+            for path in LIST_VIEWS:
+                path = path.format(**ids)
+                queries = []
+                with connection.execute_wrapper(self.recorder(queries)):
+                    response = client.get(path)
+                if response.status_code != 200:
+                    problems.append(f'{path}: status {response.status_code}')
+                    continue
+
+                for sql, params in queries:
+                    plan, scans, sorts = self.explain(sql, params)
+                    if options['verbose_plans']:
+                        self.stdout.write(f'{path}\n  {sql}\n  ' + '\n  '.join(plan))
+                    problems += [f'{path}: full scan of {table} in {sql}' for table in scans]
+                    if sorts:
+                        problems.append(f'{path}: ORDER BY without an index in {sql}')
+                self.stdout.write(f'{path}: {len(queries)} queries checked')
+            transaction.set_rollback(True)
+
+        if problems:
+            raise CommandError('Queries without a usable index:\n' + '\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Every list view query uses an index.'))
+
+    def recorder(self, queries):
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+        return record
+
+    def seed(self):
+        users = [
+            CustomUser.objects.create(username=f'plan-check-{i}', email=f'plan-check-{i}@example.com', password='!')
+            for i in range(6)
+        ]
+        viewer, author = users[0], users[1]
+        posts, videos = [], []
+        for user in users[1:]:
+            Follow.objects.create(follower=viewer, following=user)
+            Follow.objects.create(follower=user, following=viewer)
+            for i in range(3):
+                posts.append(Post.objects.create(user=user, image='images/plan-check.jpg', content=f'post {i}'))
+                videos.append(Video.objects.create(author=user, title=f'video {i}', status=Video.READY))
+        for user in users:
+            for post, video in zip(posts, videos):
+                Comment.objects.create(post=post, user=user, content='comment')
+                VlogComment.objects.create(video=video, user=user, content='comment')
+                LikePost.objects.create(post=post, user=user)
+                VlogLike.objects.create(video=video, user=user)
+        HiddenPost.objects.create(user=viewer, post=posts[-1])
+        Block.objects.create(blocker=viewer, blocked=users[-1])
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(owner=viewer, author=post.user, post=post, created_at=timezone.now()) for post in posts
+        )
+        return {'viewer': viewer.pk, 'post': posts[0].pk, 'video': videos[0].pk, 'profile': author.profile.pk}
+
+    def explain(self, sql, params):
+        '''
+        Return the plan of a query, the large tables it reads in full and whether it sorts rows an index could have ordered.
+        '''
+        sorts = False
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny seeded tables are cheapest to read in full; make the planner pick any usable index instead
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                nodes = list(self.plan_nodes(json.loads(cursor.fetchone()[0])[0]['Plan']))
+                plan = [f"{node['Node Type']} {node.get('Relation Name', '')}".strip() for node in nodes]
+                scans = {node['Relation Name'] for node in nodes if node['Node Type'] == 'Seq Scan'}
+            elif connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+                # "SCAN table" without "USING INDEX" reads every row of the table
+                scans = {match.group(1) for line in plan if (match := re.fullmatch(r'SCAN (\w+)', line))}
+                sorts = any(line.startswith('USE TEMP B-TREE FOR ORDER BY') for line in plan)
+            else:
+                raise CommandError(f'Query plans of {connection.vendor} are not supported.')
+        return plan, scans & LARGE_TABLES, sorts
+
+    def plan_nodes(self, node):
+        yield node
+        for child in node.get('Plans', []):
+            yield from self.plan_nodes(child)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from post.models import LikeCounter, CommentCounter
+from vlog.models import VlogLikeCounter, VlogCommentCounter
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized like/comment counters of posts and videos and repair any drift'
+
+    def handle(self, *args, **kwargs):
+        """
+        Entry point of the management command.
+        """
+        for counter_model in (LikeCounter, CommentCounter, VlogLikeCounter, VlogCommentCounter):
+            with transaction.atomic():
+                repaired = counter_model.reconcile()
+            self.stdout.write(f'{counter_model.__name__}: {repaired} counter(s) repaired')
+
+        self.stdout.write(self.style.SUCCESS('Counters reconciled successfully.'))
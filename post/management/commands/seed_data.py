@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from post.seeding import SEED_PASSWORD, seed
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic social graph (users, power-law follows, posts, videos, likes, comments, blocks, hidden posts) into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users to create')
+        parser.add_argument('--posts', type=float, default=5, help='Average posts per user')
+        parser.add_argument('--videos', type=float, default=1, help='Average videos per user')
+        parser.add_argument('--likes', type=float, default=10, help='Average likes per post and video')
+        parser.add_argument('--comments', type=float, default=3, help='Average comments per post and video')
+        parser.add_argument('--days', type=int, default=30, help='Spread creation times over this many days')
+        parser.add_argument('--seed', type=int, help='Random seed, for a reproducible dataset')
+        parser.add_argument('--force', action='store_true', help='Seed even when DEBUG is off')
+
+    def handle(self, *args, **options):
+        """
+        Entry point of the management command.
+        """
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Refusing to seed synthetic data with DEBUG off; pass --force if this database is disposable.')
+
+        with transaction.atomic():
+            seed(
+                users=options['users'], posts=options['posts'], videos=options['videos'], likes=options['likes'],
+                comments=options['comments'], days=options['days'], random_seed=options['seed'], log=self.stdout.write,
+            )
+        self.stdout.write(self.style.SUCCESS(f'Synthetic data seeded; every seeded user logs in with the password "{SEED_PASSWORD}".'))
@@ -0,0 +1,20 @@
+from django.db import models
+from django.db.models import Exists, OuterRef, Value
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self, user):
+        '''
+        Feed Queryset
+
+        Loads everything PostSerializer reads in the same query: the author and their profile, the
+        denormalized like/comment counters and whether `user` liked each post (as the `liked` annotation).
+        '''
+        from .models import LikePost
+
+        queryset = self.select_related('user__profile', 'like_counter', 'comment_counter')
+        if user and user.is_authenticated:
+            liked = Exists(LikePost.objects.filter(post=OuterRef('pk'), user_id=user.pk))
+        else:
+            liked = Value(False)
+        return queryset.annotate(liked=liked)
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0003_alter_commentcounter_post_alter_likecounter_post'),
+        ('profile_app', '0003_profile_hide_avatar'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='post_commen_post_id_c7f00c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['created_at', 'id'], name='post_post_created_0f6fd8_idx'),
+        ),
+    ]
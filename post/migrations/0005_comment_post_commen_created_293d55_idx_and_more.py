@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0004_comment_post_commen_post_id_c7f00c_idx_and_more'),
+        ('profile_app', '0004_profile_created_at_index_unique_follow'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created_at', 'id'], name='post_commen_created_293d55_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='likepost',
+            index=models.Index(fields=['post', 'created_at'], name='post_likepo_post_id_9f325f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='likepost',
+            index=models.Index(fields=['user', 'created_at'], name='post_likepo_user_id_63f175_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', 'created_at'], name='post_post_user_id_b2741b_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 01:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0005_comment_post_commen_created_293d55_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='likepost',
+            name='post_likepo_post_id_9f325f_idx',
+        ),
+        migrations.AddIndex(
+            model_name='likepost',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='post_likepo_post_id_bff520_idx'),
+        ),
+    ]
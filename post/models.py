@@ -1,6 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from authentication.models import CustomUser
 from profile_app.models import Profile
+from trend.response_cache import invalidate_scopes
+from .counters import counter_buffer
+from .managers import PostQuerySet
 
 
 class Post(models.Model):
@@ -10,17 +16,32 @@ class Post(models.Model):
     content = models.CharField(max_length=1000, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),  # keyset pagination of the feed
+            models.Index(fields=['user', 'created_at']),  # a user's posts, newest first
+        ]
 
     def __str__(self) -> str:
         return f"{self.content} "
 
     def like_count(self):
-        # Count the number of likes related to this post
-        return self.likes.count()
+        # Read the denormalized like counter (select_related('like_counter') avoids a query per post)
+        # plus the likes still buffered by this process (LIKE_COUNTER_WRITE_BEHIND, see post.counters)
+        pending = counter_buffer.pending(LikeCounter, self.pk)
+        try:
+            return self.like_counter.count + pending
+        except LikeCounter.DoesNotExist:
+            return pending
 
     def comment_count(self):
-        # Count the number of comments related to this post
-        return self.comments.all().count()
+        # Read the denormalized comment counter (select_related('comment_counter') avoids a query per post)
+        try:
+            return self.comment_counter.count
+        except CommentCounter.DoesNotExist:
+            return 0
 
     like_count.short_description = 'Like Count'
     comment_count.short_description = 'Comment Count'
@@ -33,6 +54,12 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id']),  # keyset pagination of a post's comments
+            models.Index(fields=['created_at', 'id']),  # all comments, newest first
+        ]
+
     def __str__(self) -> str:
         return f"{self.user.username}: {self.content[:20]}..."
 
@@ -44,29 +71,73 @@ class LikePost(models.Model):
 
     class Meta:
         unique_together = ('post', 'user')
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id']),  # keyset pagination of a post's likers
+            models.Index(fields=['user', 'created_at']),  # a user's latest likes (post.likes)
+        ]
     
     def __str__(self):
         return f"{self.user.username} liked post {self.post.id}"
 
-    @classmethod
-    def toggle_like(cls, post, user):
-        try:
-            like = cls.objects.get(post=post, user=user)
-            like.delete()
-            return False
-        except cls.DoesNotExist:
-            cls.objects.create(post=post, user=user)
-            return True
 
+class PostCounter(models.Model):
+    '''
+    Base class for the one-to-one counter tables of a post.
 
-class LikeCounter(models.Model):
-    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    `source` names the related manager on Post whose rows are being counted. Counters are only ever
+    changed with `adjust`, inside the same transaction as the row that was added or removed.
+    '''
+    source = None
+    related_name = None
     count = models.IntegerField(default=0)
 
+    class Meta:
+        abstract = True
 
-class CommentCounter(models.Model):
-    post = models.ForeignKey(Post, on_delete=models.CASCADE)
-    count = models.IntegerField(default=0)
+    @classmethod
+    def adjust(cls, post, delta):
+        '''
+        Apply `delta` with a single `UPDATE ... SET count = count + delta`.
+
+        The counter row is created on first use, seeded from an exact count of the already written rows.
+        '''
+        if cls.objects.filter(post=post).update(count=F('count') + delta):
+            return
+        counter, created = cls.objects.get_or_create(
+            post=post, defaults={'count': getattr(post, cls.source).count()}
+        )
+        if not created:
+            # Another request created the row between our UPDATE and INSERT
+            cls.objects.filter(pk=counter.pk).update(count=F('count') + delta)
+
+    @classmethod
+    def reconcile(cls):
+        '''
+        Rewrite every counter of this type from the source rows. Returns the number of counters repaired.
+        '''
+        repaired = 0
+        posts = Post.objects.annotate(actual=models.Count(cls.source)).select_related(cls.related_name)
+        for post in posts.iterator():
+            counter = getattr(post, cls.related_name, None)
+            if counter is None:
+                cls.objects.create(post=post, count=post.actual)
+                repaired += 1
+            elif counter.count != post.actual:
+                cls.objects.filter(pk=counter.pk).update(count=post.actual)
+                repaired += 1
+        return repaired
+
+
+class LikeCounter(PostCounter):
+    source = 'likes'
+    related_name = 'like_counter'
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name=related_name)
+
+
+class CommentCounter(PostCounter):
+    source = 'comments'
+    related_name = 'comment_counter'
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name=related_name)
 
 
 class HiddenPost(models.Model):
@@ -74,7 +145,12 @@ class HiddenPost(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='hidden_by')
 
     class Meta:
-        unique_together = ('user', 'post')
+        unique_together = ('user', 'post')  # also the (user, post) index the feeds' NOT EXISTS probes
 
     def __str__(self):
-        return f"{self.user.username} hidden post {self.post.id}"
\ No newline at end of file
+        return f"{self.user.username} hidden post {self.post.id}"
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_cached_post_responses(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_scopes('posts'))
\ No newline at end of file
@@ -0,0 +1,160 @@
+'''
+Synthetic Data
+
+Seeds a social graph shaped like real usage into the database, for benchmarks and query plan checks on
+realistic volumes (python manage.py seed_data).
+
+Popularity follows a power law: a few accounts get most of the follows, and the likes and comments of their posts,
+while most accounts have a handful. Every seeded user has the username `seed-<n>` and the password SEED_PASSWORD.
+Rows are written with bulk_create, so no signal runs: profiles are created here, and the counters and
+home timelines are rebuilt at the end.
+
+All posts share one tiny generated JPEG, and all videos one generated one-second clip, so seeding needs no fixtures
+and uploads two files at most.
+'''
+
+import io
+import os
+import random
+import subprocess
+import tempfile
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.utils import timezone
+from imageio_ffmpeg import get_ffmpeg_exe
+from PIL import Image
+from authentication.models import Block, CustomUser
+from profile_app.models import Follow, Profile
+from vlog.models import Video, VlogComment, VlogLike
+from .models import Comment, HiddenPost, LikePost, Post
+
+SEED_USERNAME_PREFIX = 'seed-'
+SEED_PASSWORD = 'seed-password'
+SEED_IMAGE = 'images/seed.jpg'
+SEED_CLIP = 'vlogs/seed.mp4'
+BATCH_SIZE = 1000
+
+
+def _fixture_image():
+    if not default_storage.exists(SEED_IMAGE):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), (200, 80, 40)).save(buffer, 'JPEG')
+        default_storage.save(SEED_IMAGE, ContentFile(buffer.getvalue()))
+    return SEED_IMAGE
+
+
+def _fixture_clip():
+    if not default_storage.exists(SEED_CLIP):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'seed.mp4')
+            subprocess.run(
+                [get_ffmpeg_exe(), '-v', 'error', '-y', '-f', 'lavfi', '-i', 'testsrc=duration=1:size=64x64:rate=10',
+                 '-pix_fmt', 'yuv420p', path],
+                check=True, capture_output=True, timeout=60,
+            )
+            with open(path, 'rb') as clip:
+                default_storage.save(SEED_CLIP, ContentFile(clip.read()))
+    return SEED_CLIP
+
+
+def _heavy_tailed(rng, mean, cap):
+    # Pareto with shape 1.5 has mean 3 * scale
+    return min(int(rng.paretovariate(1.5) * mean / 3), cap)
+
+
+def _create(rng, model, rows, days, field='created_at'):
+    # bulk_create stamps auto_now_add fields with the current time; spread the rows over the last `days` days
+    rows = model.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    now = timezone.now()
+    for row in rows:
+        setattr(row, field, now - timedelta(seconds=rng.uniform(0, days * 86400)))
+    model.objects.bulk_update(rows, [field], batch_size=BATCH_SIZE)
+    return rows
+
+
+def seed(users=1000, posts=5, videos=1, likes=10, comments=3, block_rate=0.02, hide_rate=0.05, days=30, random_seed=None, log=print):
+    '''
+    Create `users` users and their follows, posts, videos, likes, comments, blocks and hidden posts.
+
+    `posts`, `videos`, `likes` and `comments` are averages per user (likes and comments per item); the actual
+    numbers are heavy-tailed. Returns the ids of the created users.
+    '''
+    rng = random.Random(random_seed)
+    first = CustomUser.objects.filter(username__startswith=SEED_USERNAME_PREFIX).count()
+    password = make_password(SEED_PASSWORD)
+    created = CustomUser.objects.bulk_create(
+        [CustomUser(username=f'{SEED_USERNAME_PREFIX}{n}', email=f'{SEED_USERNAME_PREFIX}{n}@example.com', password=password)
+         for n in range(first, first + users)],
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = [user.pk for user in created]
+    Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in user_ids], batch_size=BATCH_SIZE)
+    log(f'{len(user_ids)} users')
+
+    # Zipf popularity: the account at rank r is followed, liked and commented in proportion to 1 / r
+    popularity = [1 / rank for rank in range(1, len(user_ids) + 1)]
+    ranked = user_ids[:]
+    rng.shuffle(ranked)
+
+    follows = set()
+    for follower in user_ids:
+        for following in rng.choices(ranked, popularity, k=_heavy_tailed(rng, 20, len(user_ids) - 1)):
+            if following != follower:
+                follows.add((follower, following))
+    _create(rng, Follow, [Follow(follower_id=a, following_id=b) for a, b in follows], days)
+    log(f'{len(follows)} follows')
+
+    image = _fixture_image()
+    post_rows = [
+        Post(user_id=user_id, image=image, content=f'Seeded post {i}')
+        for user_id in user_ids for i in range(_heavy_tailed(rng, posts, 500))
+    ]
+    post_ids = [(post.pk, post.user_id) for post in _create(rng, Post, post_rows, days)]
+    log(f'{len(post_ids)} posts')
+
+    clip = _fixture_clip()
+    video_rows = [
+        Video(author_id=user_id, title=f'Seeded video {i}', video=clip, thumbnail=image, status=Video.READY,
+              duration=timedelta(seconds=1), width=64, height=64, codec='h264')
+        for user_id in user_ids for i in range(_heavy_tailed(rng, videos, 100))
+    ]
+    video_ids = [(video.pk, video.author_id) for video in _create(rng, Video, video_rows, days)]
+    log(f'{len(video_ids)} videos')
+
+    rank_of = {user_id: rank for rank, user_id in enumerate(ranked, start=1)}
+    for like_model, comment_model, field, items in (
+        (LikePost, Comment, 'post_id', post_ids),
+        (VlogLike, VlogComment, 'video_id', video_ids),
+    ):
+        like_rows, comment_rows = [], []
+        for item_id, author_id in items:
+            # Popular authors get more engagement
+            boost = len(user_ids) / (rank_of[author_id] * 10) + 0.2
+            for liker in set(rng.choices(user_ids, k=_heavy_tailed(rng, likes * boost, len(user_ids)))):
+                like_rows.append(like_model(user_id=liker, **{field: item_id}))
+            for commenter in rng.choices(user_ids, k=_heavy_tailed(rng, comments * boost, 200)):
+                comment_rows.append(comment_model(user_id=commenter, content='Seeded comment', **{field: item_id}))
+        _create(rng, like_model, like_rows, days)
+        _create(rng, comment_model, comment_rows, days)
+        log(f'{len(like_rows)} {like_model.__name__} and {len(comment_rows)} {comment_model.__name__} rows')
+
+    blocks = {
+        (blocker, blocked) for blocker in user_ids if rng.random() < block_rate
+        for blocked in [rng.choice(user_ids)] if blocked != blocker
+    }
+    Block.objects.bulk_create([Block(blocker_id=a, blocked_id=b) for a, b in blocks], batch_size=BATCH_SIZE)
+    hidden = {
+        (user_id, post_id) for user_id in user_ids if rng.random() < hide_rate
+        for post_id, _ in rng.sample(post_ids, min(5, len(post_ids)))
+    }
+    HiddenPost.objects.bulk_create([HiddenPost(user_id=a, post_id=b) for a, b in hidden], batch_size=BATCH_SIZE)
+    log(f'{len(blocks)} blocks and {len(hidden)} hidden posts')
+
+    # Rows written by bulk_create skipped the signals that keep these up to date
+    call_command('reconcile_counters', stdout=io.StringIO())
+    call_command('backfill_timelines', stdout=io.StringIO())
+    log('Counters reconciled and timelines backfilled')
+    return user_ids
@@ -1,26 +1,44 @@
+from django.db import models, transaction
 from rest_framework import serializers
-from authentication.models import CustomUser
+from .likes import post_likes
 from .models import Post, Comment, HiddenPost
-from profile_app.serializers import ProfileSerializer
+from media_app.models import UploadSession
+from media_app.serializers import RenditionField, RenditionListSerializer, UploadSessionField
 
 
 class CommentSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     custom_user_id = serializers.ReadOnlyField(source='user.id')
     profile_id = serializers.ReadOnlyField(source='user.profile.id')
-    avatar = serializers.ImageField(source='user.avatar')
+    avatar = RenditionField(source='user.avatar', width=96)
 
     class Meta:
         model = Comment
         fields = ('id', 'custom_user_id', 'profile_id', 'username', 'avatar', 'content', 'created_at', 'updated_at')
         read_only_fields = ('id', 'custom_user_id', 'created_at', 'updated_at')
+        list_serializer_class = RenditionListSerializer
+
+
+class PostListSerializer(RenditionListSerializer):
+    '''
+    Resolves the viewer's liked state for the whole page with one lookup (see post.likes),
+    unless the queryset already annotates it.
+    '''
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if not all(hasattr(item, 'liked') for item in items):
+            request = self.context.get('request')
+            self.context['liked_posts'] = post_likes.liked_ids(getattr(request, 'user', None), items)
+        return super().to_representation(items)
 
 
 class PostSerializer(serializers.ModelSerializer):
     custom_user_id = serializers.ReadOnlyField(source='user.id')
     username = serializers.CharField(source='user.username', read_only=True)
     profile_id = serializers.ReadOnlyField(source='user.profile.id')
-    avatar = serializers.ImageField(source='user.avatar', read_only=True)
+    avatar = RenditionField(source='user.avatar', width=96, read_only=True)
+    image = RenditionField(width=1080)
     like_counter = serializers.SerializerMethodField()
     comment_counter = serializers.SerializerMethodField()
     liked = serializers.SerializerMethodField()
@@ -28,6 +46,7 @@ class PostSerializer(serializers.ModelSerializer):
     class Meta:
         model = Post
         fields = ('id', 'custom_user_id', 'profile_id', 'username', 'avatar', 'image', 'content', 'created_at', 'updated_at', 'like_counter', 'comment_counter', 'liked')
+        list_serializer_class = PostListSerializer
 
     def get_username(self, obj):
         return obj.user.username if obj.user else None
@@ -39,26 +58,45 @@ class PostSerializer(serializers.ModelSerializer):
         return obj.comment_count()
 
     def get_liked(self, obj):
-        request = self.context.get('request')
+        # Querysets built with Post.objects.for_feed() already carry the answer
+        if hasattr(obj, 'liked'):
+            return obj.liked
+        if 'liked_posts' in self.context:
+            return obj.pk in self.context['liked_posts']
 
-        if request and hasattr(request, 'user') and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
+        request = self.context.get('request')
+        return obj.pk in post_likes.liked_ids(getattr(request, 'user', None), [obj])
 
 
 class LikeToggleSerializer(serializers.Serializer):
     post_id = serializers.PrimaryKeyRelatedField(queryset=Post.objects.all())
-    user_id = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all())
 
 
 class CreatePostSerializer(serializers.ModelSerializer):
+    upload_id = UploadSessionField(kind=UploadSession.IMAGE)
 
     class Meta:
         model = Post
-        fields = ('id', 'image', 'content', 'created_at', 'updated_at')
-
+        fields = ('id', 'image', 'upload_id', 'content', 'created_at', 'updated_at')
+        extra_kwargs = {'image': {'required': False}}
+
+    def validate(self, attrs):
+        # The image is either uploaded with the request or referenced by a complete chunked upload
+        upload = attrs.pop('upload_id', None)
+        if upload is not None:
+            if attrs.get('image'):
+                raise serializers.ValidationError("Send either an image or an upload_id, not both.")
+            self.upload = upload
+            attrs['image'] = upload.key
+        elif self.instance is None and not attrs.get('image'):
+            raise serializers.ValidationError({'image': "Either an image or an upload_id is required."})
+        return attrs
+
+    @transaction.atomic
     def create(self, validated_data):
-
+        upload = getattr(self, 'upload', None)
+        if upload is not None and not upload.attach():
+            raise serializers.ValidationError({'upload_id': "This upload is already attached."})
         request = self.context.get('request')
         validated_data['user'] = request.user
         return super().create(validated_data)
@@ -70,12 +108,21 @@ class CreateCommentSerializer(serializers.ModelSerializer):
         fields = ('post', 'user', 'content')
 
 
-class LikerSerializer(serializers.ModelSerializer):
-    profile = ProfileSerializer(read_only=True)
+class LikerSerializer(serializers.Serializer):
+    '''
+    A compact liker row, read from a like (LikePost or VlogLike) with its user and profile selected and
+    `is_following` annotated, so a page of likers is a single query.
+    '''
+    user_id = serializers.IntegerField(read_only=True)
+    profile_id = serializers.IntegerField(source='user.profile.id', read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+    avatar = RenditionField(source='user.profile.avatar', width=96, read_only=True)
+    hide_avatar = serializers.BooleanField(source='user.profile.hide_avatar', read_only=True)
+    is_following = serializers.BooleanField(read_only=True)
+    liked_at = serializers.DateTimeField(source='created_at', read_only=True)
 
     class Meta:
-        model = CustomUser
-        fields = ('profile',)
+        list_serializer_class = RenditionListSerializer
 
 
 class HiddenPostSerializer(serializers.ModelSerializer):
@@ -1,3 +1,392 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection, models
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from authentication.models import Block, CustomUser
+from profile_app.models import Follow
+from timeline.models import TimelineEntry
+from vlog.models import Video, VlogComment
+from .counters import CounterBuffer, counter_buffer
+from .models import Comment, HiddenPost, Post, LikePost, LikeCounter
+from .seeding import seed
 
-# Create your tests here.
+LOCAL_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class PostFeedQueryCountTests(TestCase):
+    '''
+    A feed page must cost the same number of queries whatever its size.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user('viewer@example.com', 'pass1234', username='viewer')
+        for i in range(10):
+            author = CustomUser.objects.create_user(f'author{i}@example.com', 'pass1234', username=f'author{i}')
+            post = Post.objects.create(user=author, image='images/post.jpg', content=f'post {i}')
+            LikePost.objects.create(post=post, user=cls.viewer)
+            LikeCounter.adjust(post, 1)
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_feed_query_count_is_constant(self):
+        # one query for the page (the keyset paginator issues no COUNT(*)) and one for the image renditions of the whole page
+        for limit in (1, 5, 10):
+            cache.clear()
+            with self.assertNumQueries(2):
+                response = self.client.get('/post/', {'limit': limit})
+            self.assertEqual(len(response.data['results']), limit)
+
+        post = response.data['results'][0]
+        self.assertTrue(post['liked'])
+        self.assertEqual(post['like_counter'], 1)
+        self.assertIsNotNone(post['profile_id'])
+
+    def test_anonymous_feed_query_count_is_constant(self):
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(2):
+            response = self.client.get('/post/', {'limit': 10})
+        self.assertFalse(any(post['liked'] for post in response.data['results']))
+
+    def test_anonymous_feed_is_cached_with_etag(self):
+        self.client.force_authenticate(None)
+        etag = self.client.get('/post/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/post/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_detail_query_count(self):
+        # the post with its author, profile, counters and liked flag, then one rendition lookup per image field
+        post = Post.objects.first()
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/post/{post.id}/')
+        self.assertTrue(response.data['liked'])
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class PostLikersQueryCountTests(TestCase):
+    '''
+    A likers page is read from the like table in one query, latest like first, whatever the page size.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user('viewer@example.com', 'pass1234', username='viewer')
+        cls.post = Post.objects.create(user=cls.viewer, image='images/post.jpg', content='post')
+        for i in range(12):
+            liker = CustomUser.objects.create_user(f'liker{i}@example.com', 'pass1234', username=f'liker{i}')
+            LikePost.objects.create(post=cls.post, user=liker)
+            if i % 2:
+                Follow.objects.create(follower=cls.viewer, following=liker)
+        Block.objects.create(blocker=cls.viewer, blocked=CustomUser.objects.get(username='liker0'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_likers_query_count_is_constant(self):
+        # the likes with their users and profiles, follow state and block filter included
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/post/{self.post.id}/likers/')
+        likers = response.data['results']
+        self.assertEqual([liker['username'] for liker in likers], [f'liker{i}' for i in range(11, 1, -1)])
+        self.assertEqual([liker['is_following'] for liker in likers], [bool(i % 2) for i in range(11, 1, -1)])
+        self.assertEqual(likers[0]['profile_id'], CustomUser.objects.get(username='liker11').profile.id)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(response.data['next'])
+        self.assertEqual([liker['username'] for liker in response.data['results']], ['liker1'])
+        self.assertIsNone(response.data['next'])
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class CommentQueryCountTests(TestCase):
+    '''
+    A comment page selects the authors and their profiles with the comments, whatever its size.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user('viewer@example.com', 'pass1234', username='viewer')
+        cls.post = Post.objects.create(user=cls.viewer, image='images/post.jpg', content='post')
+        cls.video = Video.objects.create(author=cls.viewer, title='video', status=Video.READY)
+        for i in range(6):
+            author = CustomUser.objects.create_user(f'author{i}@example.com', 'pass1234', username=f'author{i}')
+            Comment.objects.create(post=cls.post, user=author, content=f'comment {i}')
+            VlogComment.objects.create(video=cls.video, user=author, content=f'comment {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_comment_pages_query_count_is_constant(self):
+        for path in (f'/post/{self.post.id}/comments/', f'/videos/{self.video.id}/comments/', '/post/comments/'):
+            counts = []
+            for limit in (1, 6):
+                cache.clear()  # rendition lookups
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(path, {'limit': limit})
+                counts.append(len(queries))
+                self.assertEqual(len(response.data['results']), limit, path)
+            self.assertEqual(counts[0], counts[1], path)
+        self.assertIsNotNone(response.data['results'][0]['profile_id'])
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class LikeWriteTests(TestCase):
+    '''
+    Likes are written as the authenticated user, and repeating a like or unlike changes nothing.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='alice')
+        cls.other = CustomUser.objects.create_user('bob@example.com', 'pass1234', username='bob')
+        cls.post = Post.objects.create(user=cls.other, image='images/post.jpg', content='post')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def like_count(self):
+        return LikeCounter.objects.get(post=self.post).count
+
+    def test_put_and_delete_are_idempotent(self):
+        for _ in range(2):
+            response = self.client.put(f'/post/{self.post.id}/like/')
+            self.assertEqual(response.data, {'liked': True})
+        self.assertEqual(LikePost.objects.filter(post=self.post, user=self.user).count(), 1)
+        self.assertEqual(self.like_count(), 1)
+
+        for _ in range(2):
+            response = self.client.delete(f'/post/{self.post.id}/like/')
+            self.assertEqual(response.data, {'liked': False})
+        self.assertFalse(LikePost.objects.filter(post=self.post).exists())
+        self.assertEqual(self.like_count(), 0)
+
+    def test_toggle_likes_as_the_authenticated_user(self):
+        response = self.client.post('/post/toggle-like/', {'post_id': self.post.id, 'user_id': self.other.id}, format='json')
+        self.assertTrue(response.data['liked'])
+        self.assertEqual(LikePost.objects.get(post=self.post).user, self.user)
+
+        response = self.client.post('/post/toggle-like/', {'post_id': self.post.id}, format='json')
+        self.assertFalse(response.data['liked'])
+        self.assertEqual(self.like_count(), 0)
+
+    def test_anonymous_users_cannot_like(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.put(f'/post/{self.post.id}/like/').status_code, 401)
+        self.assertEqual(self.client.post('/post/toggle-like/', {'post_id': self.post.id}, format='json').status_code, 401)
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, LIKE_COUNTER_WRITE_BEHIND=True)
+@mock.patch.object(CounterBuffer, '_start_flusher')
+class WriteBehindCounterTests(TestCase):
+    '''
+    Buffered like counts are visible to reads at once, and a flush applies each counter with one UPDATE.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [CustomUser.objects.create_user(f'user{i}@example.com', 'pass1234', username=f'user{i}') for i in range(3)]
+        cls.post = Post.objects.create(user=cls.users[0], image='images/post.jpg', content='post')
+        LikeCounter.objects.create(post=cls.post, count=0)
+
+    def setUp(self):
+        cache.clear()
+        counter_buffer._pid = None
+        self.addCleanup(setattr, counter_buffer, '_pid', None)
+
+    def like(self, user, method='put'):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            getattr(client, method)(f'/post/{self.post.id}/like/')
+        return client
+
+    def test_likes_are_buffered_until_flushed(self, start_flusher):
+        for user in self.users:
+            client = self.like(user)
+        self.like(self.users[0], 'delete')
+        start_flusher.assert_called_once()
+        self.assertEqual(LikeCounter.objects.get(post=self.post).count, 0)
+        self.assertEqual(client.get(f'/post/{self.post.id}/').data['like_counter'], 2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(counter_buffer.flush(), 1)
+        self.assertEqual(LikeCounter.objects.get(post=self.post).count, 2)
+        self.assertEqual(counter_buffer.pending(LikeCounter, self.post.id), 0)
+        self.assertEqual(client.get(f'/post/{self.post.id}/').data['like_counter'], 2)
+
+    def test_deltas_stay_pending_until_applied(self, start_flusher):
+        counter_buffer.add(LikeCounter, self.post.id, 2)
+        adjust = LikeCounter.adjust
+
+        def adjust_during_a_like(post, delta):
+            # Not applied yet, so still counted by reads; a like arrives meanwhile
+            self.assertEqual(counter_buffer.pending(LikeCounter, post.pk), 2)
+            counter_buffer.add(LikeCounter, post.pk, 1)
+            adjust(post, delta)
+
+        with mock.patch.object(LikeCounter, 'adjust', side_effect=adjust_during_a_like):
+            self.assertEqual(counter_buffer.flush(), 1)
+        self.assertEqual(counter_buffer.pending(LikeCounter, self.post.id), 1)
+
+        with mock.patch.object(LikeCounter, 'adjust', side_effect=OSError('database unavailable')):
+            with self.assertLogs('post.counters', 'ERROR'):
+                self.assertEqual(counter_buffer.flush(), 0)
+        self.assertEqual(counter_buffer.pending(LikeCounter, self.post.id), 1)
+        self.assertEqual(counter_buffer.flush(), 1)
+        self.assertEqual(LikeCounter.objects.get(post=self.post).count, 3)
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class LikeConcurrencyTests(TransactionTestCase):
+    '''
+    Many threads liking and unliking one post concurrently never fail, and leave the counter equal to the likes.
+    With SQLite this needs the file-backed test database of the settings: threads sharing an in-memory database
+    fail on a locked table at once instead of waiting.
+    '''
+
+    def test_concurrent_likes_keep_the_counter_exact(self):
+        users = [CustomUser.objects.create_user(f'user{i}@example.com', 'pass1234', username=f'user{i}') for i in range(8)]
+        post = Post.objects.create(user=users[0], image='images/post.jpg', content='post')
+        start = threading.Barrier(16)
+
+        def hammer(n):
+            # two threads per user, so every like and unlike also races with the same user's own requests
+            client = APIClient()
+            client.force_authenticate(users[n % len(users)])
+            start.wait()
+            try:
+                statuses = [
+                    (client.put if (i + n) % 3 else client.delete)(f'/post/{post.id}/like/').status_code for i in range(20)
+                ]
+                statuses.append(client.put(f'/post/{post.id}/like/').status_code)
+                return statuses
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            statuses = {status for result in executor.map(hammer, range(16)) for status in result}
+        self.assertEqual(statuses, {200})
+        self.assertEqual(LikePost.objects.filter(post=post).count(), len(users))
+        self.assertEqual(LikeCounter.objects.get(post=post).count, len(users))
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class HiddenPostTests(TestCase):
+    '''
+    Hidden posts leave the feeds of the user who hid them at once, at a cost that does not grow with the number
+    of hidden posts.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user('viewer@example.com', 'pass1234', username='viewer')
+        author = CustomUser.objects.create_user('author@example.com', 'pass1234', username='author')
+        cls.posts = [Post.objects.create(user=author, image='images/post.jpg', content=f'post {i}') for i in range(60)]
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(owner=cls.viewer, author=author, post=post, created_at=post.created_at) for post in cls.posts
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def post_ids(self, path):
+        results = self.client.get(path, {'limit': 100}).data['results']
+        return {item['post']['id'] if 'post' in item else item['id'] for item in results}
+
+    def test_hide_and_unhide_apply_at_once(self):
+        post = self.posts[-1]
+        self.assertIn(post.id, self.post_ids('/post/'))
+        self.client.post('/post/hide-or-unhide-post/', {'post_id': post.id}, format='json')
+        self.assertNotIn(post.id, self.post_ids('/post/'))
+        self.assertNotIn(post.id, self.post_ids('/timeline/'))
+
+        self.client.delete('/post/hide-or-unhide-post/', {'post_id': post.id}, format='json')
+        self.assertIn(post.id, self.post_ids('/post/'))
+        self.assertIn(post.id, self.post_ids('/timeline/'))
+
+    def test_query_count_does_not_grow_with_hidden_posts(self):
+        counts = []
+        for hidden in (self.posts[:1], self.posts[:50]):
+            HiddenPost.objects.filter(user=self.viewer).delete()
+            HiddenPost.objects.bulk_create(HiddenPost(user=self.viewer, post=post) for post in hidden)
+            self.client.get('/post/')
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get('/post/')
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_benchmark_runs(self):
+        output = io.StringIO()
+        call_command('benchmark_hidden_posts', '--sizes', '0', '5', '20', '--requests', '2', '--tolerance', '100', stdout=output)
+        self.assertIn('timeline', output.getvalue())
+
+
+class QueryPlanTests(TestCase):
+    '''
+    Every list view query must use an index (see `manage.py check_query_plans`).
+    '''
+
+    def test_list_views_use_indexes(self):
+        call_command('check_query_plans', stdout=io.StringIO())
+
+
+class SeedAndBenchmarkTests(TestCase):
+    '''
+    Seeded data is consistent, and the benchmark runs on it and fails against a faster baseline.
+    '''
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.directory = media.name
+        settings = override_settings(
+            STORAGES=LOCAL_STORAGES, MEDIA_ROOT=media.name, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        seed(users=30, random_seed=1, log=lambda message: None)
+
+    def test_seed_reconciles_counters(self):
+        self.assertEqual(CustomUser.objects.filter(profile__isnull=True).count(), 0)
+        for post in Post.objects.select_related('like_counter').annotate(actual=models.Count('likes')):
+            self.assertEqual(post.like_counter.count, post.actual)
+
+    def test_benchmark_compares_with_baseline(self):
+        baseline = os.path.join(self.directory, 'baseline.json')
+        options = ['--requests', '3', '--warmup', '0', '--endpoint', 'login', '--endpoint', 'post-list']
+        call_command('benchmark_endpoints', *options, '--output', baseline, stdout=io.StringIO())
+        with open(baseline) as baseline_file:
+            results = json.load(baseline_file)['endpoints']
+        self.assertEqual(results['post-list']['errors'], 0)
+
+        results['post-list']['queries'] -= 1
+        with open(baseline, 'w') as baseline_file:
+            json.dump({'mode': 'test client', 'database': 'sqlite', 'endpoints': results}, baseline_file)
+        with self.assertRaisesMessage(CommandError, 'post-list'):
+            call_command('benchmark_endpoints', *options, '--compare', baseline, stdout=io.StringIO())
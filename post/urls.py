@@ -3,7 +3,7 @@ from django.urls import path
 from .views import (
     PostList, PostDetail,
     CommentList, CommentDetail,
-    LikeToggleView,
+    LikeToggleView, PostLikeView,
     PostComments, CreatePost, CreateComment, HideorUnhidePostView,
     PostLikersList)
 
@@ -22,6 +22,7 @@ urlpatterns = [
 
     # likes endpoints
     path('post/<int:pk>/likers/', PostLikersList.as_view(), name='post-likers-list'),
+    path('post/<int:pk>/like/', PostLikeView.as_view(), name='post-like'),
     path('post/toggle-like/', LikeToggleView.as_view(), name='toggle-like'),
 
     path('post/hide-or-unhide-post/', HideorUnhidePostView.as_view(), name='hide-post'),
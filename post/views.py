@@ -1,9 +1,10 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from .models import Post, Comment, LikePost, LikeCounter, HiddenPost, CommentCounter
+from .models import Post, Comment, HiddenPost, CommentCounter
 from rest_framework import generics, status
 from rest_framework.response import Response
-from authentication.pagination import CustomPageNumberPagination
+from authentication.pagination import CreatedAtCursorPagination
 from .serializers import (CreateCommentSerializer,
                           CreatePostSerializer,
                           PostSerializer,
@@ -12,7 +13,11 @@ from .serializers import (CreateCommentSerializer,
                           HiddenPostSerializer,
                           LikerSerializer)
 from rest_framework.permissions import IsAuthenticated
-from authentication.models import Block, CustomUser
+from authentication.blocking import exclude_blocked
+from trend.instrumentation import TimedSerializationMixin
+from trend.response_cache import AnonymousResponseCacheMixin
+from .hidden import exclude_hidden
+from .likes import post_likes
 
 
 # Create Poset view
@@ -48,23 +53,21 @@ class CreateComment(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-
-        # Update CommentCounter
-        post = serializer.validated_data['post']
-        comment_counter, created = CommentCounter.objects.get_or_create(post=post)
-        comment_counter.count = post.comment_count()
-        comment_counter.save()
+        with transaction.atomic():
+            self.perform_create(serializer)
+            # Update CommentCounter
+            CommentCounter.adjust(serializer.validated_data['post'], 1)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
 # Post views
-class PostList(generics.ListCreateAPIView):
+class PostList(AnonymousResponseCacheMixin, TimedSerializationMixin, generics.ListCreateAPIView):
     queryset = Post.objects.all().order_by('-created_at')
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
+    cache_scopes = ('posts', 'profiles')
 
     def get_queryset(self):
         '''
@@ -74,44 +77,46 @@ class PostList(generics.ListCreateAPIView):
         those hidden posts themselves. However, other users will not be able to access posts
         that are hidden by other users.
         '''
-        queryset = super().get_queryset()
         user = self.request.user
+        queryset = Post.objects.for_feed(user)
         if user.is_authenticated:
-            blocked_users = Block.objects.filter(blocker=user).values_list('blocked', flat=True)
-            blocked_by_users = Block.objects.filter(blocked=user).values_list('blocker', flat=True)
-            users_to_exclude = list(set(blocked_users).union(set(blocked_by_users)))
-            # Retrieve IDs of posts hidden by any user
-            # hidden_post_ids = HiddenPost.objects.values_list('post_id', flat=True)
-            hidden_post_ids = HiddenPost.objects.filter(user=user).values_list('post_id', flat=True)
-            queryset = Post.objects.exclude(user__in=users_to_exclude).exclude(id__in=hidden_post_ids)
+            queryset = exclude_hidden(exclude_blocked(queryset, user), user)
 
         return queryset.order_by('-created_at')
 
 
-class PostDetail(generics.RetrieveUpdateDestroyAPIView):
+class PostDetail(TimedSerializationMixin, generics.RetrieveUpdateDestroyAPIView):
     '''
     creating,updating or deleting a specific post
     '''
     queryset = Post.objects.all()
     serializer_class = PostSerializer
 
+    def get_queryset(self):
+        return Post.objects.for_feed(self.request.user)
+
 
 # Comment views
-class CommentList(generics.ListCreateAPIView):
-    queryset = Comment.objects.all()
+class CommentList(TimedSerializationMixin, generics.ListCreateAPIView):
+    queryset = Comment.objects.select_related('user__profile').order_by('-created_at', '-id')
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class CommentDetail(generics.RetrieveUpdateDestroyAPIView):
+class CommentDetail(TimedSerializationMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            CommentCounter.adjust(instance.post, -1)
+
 
 # Post comments view
-class PostComments(generics.ListAPIView):
+class PostComments(TimedSerializationMixin, generics.ListAPIView):
     serializer_class = CommentSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
 
 
     def get_queryset(self):
@@ -122,64 +127,58 @@ class PostComments(generics.ListAPIView):
         if not request_user.is_authenticated:
             # Handle case when user is not authenticated
             return Comment.objects.none()
-        # Get list of blocked user IDs
-        blocked_users = Block.objects.filter(blocker=request_user).values_list('blocked', flat=True)
-        blocked_by_users = Block.objects.filter(blocked=request_user).values_list('blocker', flat=True)
-        users_to_exclude = list(set(blocked_users).union(set(blocked_by_users)))
 
         # Exclude comments from blocked users
-        return Comment.objects.filter(post=post).exclude(user__in=users_to_exclude).order_by('-created_at')
+        return exclude_blocked(Comment.objects.filter(post=post).select_related('user__profile'), request_user).order_by('-created_at')
 
 
 class LikeToggleView(generics.GenericAPIView):
+    """
+        Like a post, or remove the like when there is one, as the authenticated user.
+        Prefer PUT / DELETE on post/<pk>/like/, which are idempotent.
+    """
     serializer_class = LikeToggleSerializer
+    permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        validated_data = serializer.validated_data
-
-        post = validated_data['post_id']
-        user = validated_data['user_id']
-
-
-        try:
-            # Check if the user has already liked the post
-            like = LikePost.objects.get(post=post, user=user)
-            # If the user has already liked the post, unlike it
-            like.delete()
-            message = "Post unliked successfully."
-            liked = False
-        except LikePost.DoesNotExist:
-            # If the user has not liked the post, like it
-            LikePost.objects.create(post=post, user=user)
-            message = "Post liked successfully."
-            liked = True
-        # Update like counter (increase / decrease)
-        like_counter, created = LikeCounter.objects.get_or_create(post=post)
-        like_counter.count = post.like_count()
-        like_counter.save()
-
+        liked = post_likes.toggle(request.user, serializer.validated_data['post_id'])
         return Response({"liked": liked}, status=status.HTTP_200_OK)
 
 
-class PostLikersList(generics.ListAPIView):
+class PostLikeView(generics.GenericAPIView):
     """
-        List all post Likers.
+        PUT likes the post and DELETE removes the like, as the authenticated user.
+        Both are idempotent: repeating one changes nothing and returns the same response.
+
+        Endpoint: post/<pk>/like/
+        Example response: {"liked": true}
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self):
+        return get_object_or_404(Post.objects.only('id', 'created_at'), pk=self.kwargs['pk'])
+
+    def put(self, request, *args, **kwargs):
+        post_likes.like(request.user, self.get_object())
+        return Response({"liked": True}, status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        post_likes.unlike(request.user, self.get_object())
+        return Response({"liked": False}, status=status.HTTP_200_OK)
+
+
+class PostLikersList(TimedSerializationMixin, generics.ListAPIView):
+    """
+        List the likers of a post, latest like first.
     """
     serializer_class = LikerSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        post_id = self.kwargs.get('pk')
-        request_user = self.request.user
-        # Get list of blocked user IDs
-        blocked_users = Block.objects.filter(blocker=request_user).values_list('blocked', flat=True)
-        blocked_by_users = Block.objects.filter(blocked=request_user).values_list('blocker', flat=True)
-        users_to_exclude = list(set(blocked_users).union(set(blocked_by_users)))
-        likers_ids = LikePost.objects.filter(post_id=post_id).values_list('user_id', flat=True).order_by('-created_at')
-        return CustomUser.objects.filter(id__in=likers_ids).exclude(id__in=users_to_exclude)
+        return post_likes.likers(self.kwargs.get('pk'), self.request.user)
 
         
 class HideorUnhidePostView(generics.GenericAPIView):
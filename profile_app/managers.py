@@ -0,0 +1,38 @@
+from django.db import models
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count_by_user(queryset, field):
+    '''
+    Correlated COUNT(*) of `queryset` rows whose `field` is the profile's user.
+    '''
+    counts = queryset.filter(**{field: OuterRef('user')}).order_by().values(field).annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class ProfileQuerySet(models.QuerySet):
+    def with_stats(self, viewer):
+        '''
+        Profile Stats Queryset
+
+        Annotates everything ProfileSerializer counts, for every profile of the page in the same query:
+        `posts_count`, `followers_count`, `following_count`, `vlogs_count` (published videos only) and whether
+        `viewer` follows the profile (`is_following`). Each count is a correlated subquery, so the counts don't multiply
+        each other the way joins with Count() would.
+        '''
+        from post.models import Post
+        from vlog.models import Video
+        from .models import Follow
+
+        if viewer and viewer.is_authenticated:
+            is_following = Exists(Follow.objects.filter(follower_id=viewer.pk, following=OuterRef('user')))
+        else:
+            is_following = Value(False)
+        return self.select_related('user').annotate(
+            posts_count=_count_by_user(Post.objects.all(), 'user'),
+            followers_count=_count_by_user(Follow.objects.all(), 'following'),
+            following_count=_count_by_user(Follow.objects.all(), 'follower'),
+            vlogs_count=_count_by_user(Video.objects.filter(status=Video.READY), 'author'),
+            is_following=is_following,
+        )
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:51
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def delete_duplicate_follows(apps, schema_editor):
+    # Keep the oldest row of every (follower, following) pair so the unique constraint can be created
+    Follow = apps.get_model('profile_app', 'Follow')
+    keep = Follow.objects.values('follower', 'following').annotate(first_id=Min('id')).values('first_id')
+    Follow.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profile_app', '0003_profile_hide_avatar'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['created_at'], name='profile_app_created_a2fa98_idx'),
+        ),
+        migrations.RunPython(delete_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('follower', 'following'), name='unique_follow'),
+        ),
+    ]
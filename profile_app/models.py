@@ -1,11 +1,13 @@
 import os
-from django.db import models
+from django.db import models, transaction
 from authentication.models import CustomUser
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from django.core.files import File
 from django.core.files.storage import default_storage
+from trend.response_cache import invalidate_scopes
+from .managers import ProfileQuerySet
 
 
 class Profile(models.Model):
@@ -17,6 +19,13 @@ class Profile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProfileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),  # profile list, newest first
+        ]
+
     def save(self, *args, **kwargs):
         if not self.avatar and self.user and self.user.avatar.name != 'images/avatar.jpeg':
             
@@ -36,7 +45,9 @@ class Profile(models.Model):
         return self.user.followers.count()
     
     def vlog_count(self):
-        return self.user.video_set.count()
+        # Videos still being processed (or that failed) are not shown on the profile
+        from vlog.models import Video
+        return self.user.video_set.filter(status=Video.READY).count()
 
 
 class Follow(models.Model):
@@ -44,6 +55,16 @@ class Follow(models.Model):
     following = models.ForeignKey(CustomUser, related_name='followers', on_delete=models.CASCADE,null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # also the index of "does A follow B" and of everyone A follows
+            models.UniqueConstraint(fields=['follower', 'following'], name='unique_follow'),
+        ]
+        indexes = [
+            models.Index(fields=['following', '-created_at']),  # followers list, most recent first
+            models.Index(fields=['follower', '-created_at']),  # following list, most recent first
+        ]
+
     def __str__(self):
         return f'{self.follower.username} follows {self.following.username}'
     
@@ -73,4 +94,10 @@ def update_user_from_profile(sender, instance, created, **kwargs):
 
     if instance.user and instance.user.avatar != instance.avatar:
         instance.user.avatar = instance.avatar
-        instance.user.save()
\ No newline at end of file
+        instance.user.save()
+
+
+@receiver([post_save, post_delete], sender=Profile)
+@receiver([post_save, post_delete], sender=Follow)
+def invalidate_cached_profile_responses(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_scopes('profiles'))
\ No newline at end of file
@@ -3,7 +3,8 @@ from .models import Profile, Follow
 from post.models import Post
 from rest_framework.pagination import PageNumberPagination
 from authentication.pagination import CustomPageNumberPagination
-from post.models import HiddenPost
+from post.hidden import exclude_hidden
+from media_app.serializers import RenditionField, RenditionListSerializer
 
 
 class SmallPageNumberPagination(PageNumberPagination):
@@ -16,49 +17,70 @@ class PostSerializer(serializers.ModelSerializer):
         fields = ('id', 'content', 'created_at', 'updated_at', 'image')
 
 
-class ProfileSerializer(serializers.ModelSerializer):
-    user_posts = serializers.SerializerMethodField()
+class ProfileSummarySerializer(serializers.ModelSerializer):
+    """
+    Profile fields for list contexts (likers, blocked users): the counts and follow state without `user_posts`.
+    Querysets built with Profile.objects.with_stats() serve all of them from the page query; other profiles
+    fall back to one query per count.
+    """
     posts_count = serializers.SerializerMethodField()
     is_following = serializers.SerializerMethodField()
     followers_count = serializers.SerializerMethodField()
     following_count = serializers.SerializerMethodField()
     vlogs_count = serializers.SerializerMethodField()
     username = serializers.CharField(source='user.username', read_only=True)
-    avatar = serializers.ImageField(max_length=None, use_url=True, allow_null=True, required=False)
-
-    def get_user_posts(self, profile):
-        user = self.context['request'].user
-        posts = Post.objects.filter(user=profile.user).order_by('-created_at')
-        if user.is_authenticated:
-            hidden_post_ids = HiddenPost.objects.filter(user=user).values_list('post_id', flat=True)
-            posts = posts.exclude(id__in=hidden_post_ids)
-        paginator = CustomPageNumberPagination()
-        page = paginator.paginate_queryset(posts, self.context['request'])
-        post_serializer = PostSerializer(page, many=True, context=self.context)
-        return paginator.get_paginated_response(post_serializer.data).data
+    avatar = RenditionField(width=320, max_length=None, use_url=True, allow_null=True, required=False)
 
     def get_posts_count(self, profile):
+        if hasattr(profile, 'posts_count'):
+            return profile.posts_count
         return Post.objects.filter(user=profile.user).count()
 
     def get_followers_count(self, profile):
+        if hasattr(profile, 'followers_count'):
+            return profile.followers_count
         if profile.user:
             return profile.user.followers.count()
         return 0
 
     def get_following_count(self, profile):
+        if hasattr(profile, 'following_count'):
+            return profile.following_count
         if profile.user:
             return profile.user.following.count()
         return 0
     
     def get_vlogs_count(self, profile):
+        if hasattr(profile, 'vlogs_count'):
+            return profile.vlogs_count
         if profile.user:
             return profile.vlog_count()
 
     def get_is_following(self, profile):
+        if hasattr(profile, 'is_following'):
+            return profile.is_following
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Follow.objects.filter(follower=request.user, following=profile.user).exists()
         return False
+
+    class Meta:
+        model = Profile
+        fields = ('id', 'username', 'bio', 'avatar', 'background_pic', 'created_at', 'updated_at', 'posts_count', 'following_count', 'followers_count', 'is_following', 'hide_avatar', 'vlogs_count')
+        list_serializer_class = RenditionListSerializer
+
+
+class ProfileSerializer(ProfileSummarySerializer):
+    user_posts = serializers.SerializerMethodField()
+
+    def get_user_posts(self, profile):
+        user = self.context['request'].user
+        posts = Post.objects.filter(user=profile.user).order_by('-created_at')
+        posts = exclude_hidden(posts, user)
+        paginator = CustomPageNumberPagination()
+        page = paginator.paginate_queryset(posts, self.context['request'])
+        post_serializer = PostSerializer(page, many=True, context=self.context)
+        return paginator.get_paginated_response(post_serializer.data).data
   
     def update(self, instance, validated_data):
         avatar_data = None
@@ -78,8 +100,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-    class Meta:
-        model = Profile
+    class Meta(ProfileSummarySerializer.Meta):
         fields = ('id', 'username', 'bio', 'avatar', 'background_pic', 'created_at', 'updated_at', 'posts_count', 'following_count', 'followers_count', 'is_following', 'user_posts', 'hide_avatar', 'vlogs_count')
 
 
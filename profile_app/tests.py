@@ -1,3 +1,63 @@
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from post.models import Post
+from post.tests import LOCAL_STORAGES
+from vlog.models import Video
+from .models import Follow
 
-# Create your tests here.
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class ProfileListTests(TestCase):
+    '''
+    Profile lists serve every count from the page query, whatever the page size.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user('viewer@example.com', 'pass1234', username='viewer')
+        for i in range(6):
+            user = CustomUser.objects.create_user(f'user{i}@example.com', 'pass1234', username=f'user{i}')
+            Follow.objects.create(follower=user, following=cls.viewer)
+            Follow.objects.create(follower=cls.viewer, following=user)
+            Post.objects.create(user=user, image='images/post.jpg', content='post')
+            Video.objects.create(author=user, title='ready', status=Video.READY)
+            Video.objects.create(author=user, title='processing')
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        profile = self.viewer.profile.pk
+        for path in ('/profile/', f'/profile/{profile}/followers/', f'/profile/{profile}/following/'):
+            counts = []
+            for page_size in (1, 6):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(path, {'limit': page_size})
+                counts.append(len(queries))
+                self.assertEqual(len(response.data['results']), page_size)
+                self.assertNotIn('user_posts', response.data['results'][0])
+            self.assertEqual(counts[0], counts[1], path)
+
+    def test_vlogs_count_skips_unpublished_videos(self):
+        profile = CustomUser.objects.get(username='user0').profile
+        self.assertEqual(profile.vlog_count(), 1)
+        results = self.client.get(f'/profile/{self.viewer.profile.pk}/followers/', {'limit': 10}).data['results']
+        self.assertEqual({item['vlogs_count'] for item in results}, {1})
+
+    def test_follow_lists_page_most_recent_first(self):
+        profile = self.viewer.profile.pk
+        followed = list(CustomUser.objects.filter(username__startswith='user').order_by('-id').values_list('username', flat=True))
+        for path in (f'/profile/{profile}/followers/', f'/profile/{profile}/following/'):
+            pages = [
+                [item['username'] for item in self.client.get(path, {'limit': 4, 'p': page}).data['results']]
+                for page in (1, 2)
+            ]
+            self.assertEqual((len(pages[0]), len(pages[1])), (4, 2), path)
+            self.assertEqual(pages[0] + pages[1], followed, path)
@@ -1,50 +1,56 @@
 from rest_framework import generics, status
-from .serializers import ProfileSerializer, FollowSerializer
+from .serializers import ProfileSerializer, ProfileSummarySerializer, FollowSerializer
 from rest_framework.permissions import IsAuthenticated
 from .models import Profile, Follow
+from django.db import IntegrityError, transaction
 from django.db.models import Exists, OuterRef
 from authentication.models import Block, CustomUser
+from authentication.blocking import exclude_blocked
 from rest_framework.response import Response
-from authentication.pagination import CustomPageNumberPagination
+from authentication.pagination import CustomPageNumberPagination, CreatedAtCursorPagination
 from vlog.models import Video
 from vlog.serializers import VideoSerializer
+from trend.instrumentation import TimedSerializationMixin
+from trend.response_cache import AnonymousResponseCacheMixin
 
 
-class ProfileViewList(generics.ListCreateAPIView):
+class ProfileViewList(AnonymousResponseCacheMixin, TimedSerializationMixin, generics.ListCreateAPIView):
     """
         List all profiles or create a new profile.
     """
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     pagination_class = CustomPageNumberPagination
+    cache_scopes = ('profiles', 'posts', 'videos')
+
+    def get_serializer_class(self):
+        # The list shows the counts of each profile; their posts are paginated by the detail view
+        if self.request.method == 'GET':
+            return ProfileSummarySerializer
+        return ProfileSerializer
 
     def get_queryset(self):
         """
         Filter out blocked profiles for authenticated users.
         """
-        queryset = Profile.objects.all().order_by('-created_at')
-        user = self.request.user
-        if user.is_authenticated:
-            blocked_users = Block.objects.filter(blocker=user).values_list('blocked', flat=True)
-            blocked_by_users = Block.objects.filter(blocked=user).values_list('blocker', flat=True)
-            users_to_exclude = list(set(blocked_users).union(set(blocked_by_users)))
-            queryset = Profile.objects.exclude(user__in=users_to_exclude)
+        queryset = exclude_blocked(Profile.objects.with_stats(self.request.user), self.request.user)
         return queryset.order_by('-created_at')
 
 
-class ProfileDetails(generics.RetrieveUpdateDestroyAPIView):
+class ProfileDetails(AnonymousResponseCacheMixin, TimedSerializationMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a profile instance.
     """
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
+    cache_scopes = ('profiles', 'posts', 'videos')
 
     def get_queryset(self):
         """
         Filter out blocked profiles for authenticated users.
         """
-        queryset = super().get_queryset()
         user = self.request.user
+        queryset = super().get_queryset().with_stats(user)
         if user.is_authenticated:
             blocked_subquery = Block.objects.filter(blocker=OuterRef('user'), blocked=user)
             queryset = queryset.annotate(is_blocked=Exists(blocked_subquery)).exclude(is_blocked=True)
@@ -60,7 +66,7 @@ class UpdateProfileView(generics.UpdateAPIView):
         return self.request.user.profile
 
 
-class FollowViewList(generics.ListAPIView):
+class FollowViewList(TimedSerializationMixin, generics.ListAPIView):
     queryset = Follow.objects.all()
     serializer_class = FollowSerializer
 
@@ -84,11 +90,12 @@ class FollowUserView(generics.CreateAPIView):
         if follower == following:
             return Response({'error': 'Cannot follow yourself.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if already following
-        if Follow.objects.filter(follower=follower, following=following).exists():
+        # Create a new follow relationship; the unique constraint rejects a concurrent duplicate
+        try:
+            with transaction.atomic():
+                follow = Follow.objects.create(follower=follower, following=following)
+        except IntegrityError:
             return Response({'error': 'You are already following this user.'}, status=status.HTTP_400_BAD_REQUEST)
-        # Create a new follow relationship
-        follow = Follow.objects.create(follower=follower, following=following)
         serializer = FollowSerializer(follow)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -117,53 +124,40 @@ class UnfollowUserView(generics.DestroyAPIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class FollowersListAPIView(generics.ListAPIView):
+class FollowersListAPIView(TimedSerializationMixin, generics.ListAPIView):
     """
     List all followers of a user.
     """
-    serializer_class = ProfileSerializer
+    serializer_class = ProfileSummarySerializer
     pagination_class = CustomPageNumberPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):  
         user_id = self.kwargs.get('pk')
         request_user = self.request.user
-        try:
-            user = CustomUser.objects.get(pk=user_id)
-            # Get list of followers' user IDs
-            followers = user.followers.all().values_list('follower', flat=True)
-            blocked_users = Block.objects.filter(blocker=request_user).values_list('blocked', flat=True)
-            # Filter out blocked users from followers list
-            followers = [follower for follower in followers if follower not in blocked_users]
-            # Return profiles of all followers
-            return Profile.objects.filter(user__in=followers)
-        except CustomUser.DoesNotExist:
-            return Profile.objects.none()
+        # Profiles of all followers, most recent first, without the users blocking or blocked by the requester
+        followers = Profile.objects.with_stats(request_user).filter(user__following__following_id=user_id).order_by(
+            '-user__following__created_at', '-user__following__id'
+        )
+        return exclude_blocked(followers, request_user)
      
 
-class FollowingListAPIView(generics.ListAPIView):
+class FollowingListAPIView(TimedSerializationMixin, generics.ListAPIView):
     """
     List all users a user is following.
     """
-    serializer_class = ProfileSerializer
+    serializer_class = ProfileSummarySerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPageNumberPagination
 
     def get_queryset(self):  
         user_id = self.kwargs.get('pk')
         request_user = self.request.user
-        try:
-            user = CustomUser.objects.get(pk=user_id)
-            # Get list of following user IDs
-            followings = user.following.all().values_list('following', flat=True)
-            # Get list of blocked user IDs
-            blocked_users = Block.objects.filter(blocker=request_user).values_list('blocked', flat=True)
-            # Filter out blocked users from followings list
-            followings = [following for following in followings if following not in blocked_users]
-            # Return profiles of all users being followed
-            return Profile.objects.filter(user__in=followings)
-        except CustomUser.DoesNotExist:
-            return Profile.objects.none()
+        # Profiles of all users being followed, most recent first, without the users blocking or blocked by the requester
+        followings = Profile.objects.with_stats(request_user).filter(user__followers__follower_id=user_id).order_by(
+            '-user__followers__created_at', '-user__followers__id'
+        )
+        return exclude_blocked(followings, request_user)
         
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -171,12 +165,16 @@ class FollowingListAPIView(generics.ListAPIView):
         return context    
 
 
-class UserVlogsListView(generics.ListAPIView):
+class UserVlogsListView(TimedSerializationMixin, generics.ListAPIView):
     serializer_class = VideoSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         profile_id = self.kwargs['profile_id']
         profile = Profile.objects.get(id=profile_id)
-        return Video.objects.filter(author=profile.user).order_by('-created_at')
\ No newline at end of file
+        queryset = Video.objects.filter(author=profile.user).select_related('author__profile', 'like_counter', 'comment_counter')
+        if profile.user_id != self.request.user.pk:
+            # Owners also see their uploads that are still processing or failed
+            queryset = queryset.filter(status=Video.READY)
+        return queryset.order_by('-created_at')
\ No newline at end of file
@@ -0,0 +1,22 @@
+from django.contrib import admin
+from .models import HighFollowerAccount, TimelineEntry, TimelineFanoutJob
+
+
+@admin.register(TimelineEntry)
+class TimelineEntryAdmin(admin.ModelAdmin):
+    list_display = ('owner', 'author', 'post', 'video', 'created_at')
+    raw_id_fields = ('owner', 'author', 'post', 'video')
+
+
+@admin.register(TimelineFanoutJob)
+class TimelineFanoutJobAdmin(admin.ModelAdmin):
+    list_display = ('post', 'video', 'state', 'attempts', 'run_after', 'last_error', 'updated_at')
+    list_filter = ('state',)
+    raw_id_fields = ('post', 'video')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(HighFollowerAccount)
+class HighFollowerAccountAdmin(admin.ModelAdmin):
+    list_display = ('user', 'updated_at')
+    raw_id_fields = ('user',)
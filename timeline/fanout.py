@@ -0,0 +1,163 @@
+'''
+Timeline Fan-out
+
+Home timelines are materialised in TimelineEntry. Publishing a post or video inserts one row per follower
+(fan-out on write), so reading a timeline never scans the global post table.
+
+Fan-out runs in the fan-out worker (`manage.py run_fanout_worker`, see TimelineFanoutJob), never in a request.
+
+Accounts with more than TIMELINE_FANOUT_MAX_FOLLOWERS followers are not fanned out: a single post would
+insert that many rows. They are recorded in HighFollowerAccount, and their items are pulled into a reader's
+timeline when the reader opens it instead (fan-out on read, see `pull_high_follower_items`), so they still
+page like every other entry. Following any account, high-follower or not, copies its latest items at once.
+
+The fan-out worker also trims every timeline to TIMELINE_MAX_ENTRIES every TIMELINE_TRIM_INTERVAL seconds.
+
+Functions:
+    fan_out(item): Inserts a published Post or Video into its author's and followers' timelines.
+    refresh_high_follower_accounts(): Rebuilds HighFollowerAccount from the whole Follow table.
+    backfill(follower_id, following_id): Copies the latest items of a newly followed account.
+    pull_high_follower_items(user): Brings items of followed high-follower accounts into `user`'s timeline.
+    trim(owner_ids): Deletes entries past TIMELINE_MAX_ENTRIES.
+'''
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Window
+from django.db.models.functions import RowNumber
+from post.models import Post
+from profile_app.models import Follow
+from vlog.models import Video
+from .models import HighFollowerAccount, TimelineEntry
+
+
+BATCH_SIZE = 1000
+
+
+def _update_high_follower(author_id):
+    '''
+    Record whether `author_id` has more than TIMELINE_FANOUT_MAX_FOLLOWERS followers and return it.
+
+    The count stops at the limit, so it reads at most that many rows of the Follow index on `following`.
+    '''
+    limit = settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+    is_high = Follow.objects.filter(following_id=author_id, follower__isnull=False)[:limit + 1].count() > limit
+    if is_high:
+        HighFollowerAccount.objects.bulk_create([HighFollowerAccount(user_id=author_id)], ignore_conflicts=True)
+    else:
+        HighFollowerAccount.objects.filter(user_id=author_id).delete()
+    return is_high
+
+
+def refresh_high_follower_accounts():
+    '''
+    Rebuild HighFollowerAccount with one aggregate over Follow; for offline use (`manage.py backfill_timelines`).
+    '''
+    user_ids = (
+        Follow.objects.filter(follower__isnull=False).values('following')
+        .annotate(followers=Count('id'))
+        .filter(followers__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS)
+        .values_list('following', flat=True)
+    )
+    with transaction.atomic():
+        HighFollowerAccount.objects.all().delete()
+        HighFollowerAccount.objects.bulk_create([HighFollowerAccount(user_id=user_id) for user_id in user_ids])
+
+
+def _entry(owner_id, item):
+    if isinstance(item, Video):
+        return TimelineEntry(owner_id=owner_id, author_id=item.author_id, video=item, created_at=item.created_at)
+    return TimelineEntry(owner_id=owner_id, author_id=item.user_id, post=item, created_at=item.created_at)
+
+
+def _author_id(item):
+    return item.author_id if isinstance(item, Video) else item.user_id
+
+
+def fan_out(item):
+    '''
+    Insert a Post or Video into the timeline of its author and, unless the author is a high-follower account,
+    of every follower. Entries are bulk inserted in batches and duplicates are ignored, so it is safe to rerun.
+    '''
+    author_id = _author_id(item)
+    TimelineEntry.objects.bulk_create([_entry(author_id, item)], ignore_conflicts=True)
+    if _update_high_follower(author_id):
+        return
+
+    follower_ids = Follow.objects.filter(following_id=author_id, follower__isnull=False).values_list('follower_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.append(_entry(follower_id, item))
+        if len(batch) == BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _latest_items(author_ids, since=None, limit=None):
+    '''
+    The newest posts and ready videos of `author_ids`, newest first. `since` maps author IDs to the time
+    after which their items are wanted; authors missing from it get their latest items.
+    '''
+    limit = limit or settings.TIMELINE_MAX_ENTRIES
+    since = since or {}
+    post_filter, video_filter = Q(), Q()
+    for author_id in author_ids:
+        after = {'created_at__gt': since[author_id]} if since.get(author_id) else {}
+        post_filter |= Q(user_id=author_id, **after)
+        video_filter |= Q(author_id=author_id, **after)
+    posts = Post.objects.filter(post_filter)
+    videos = Video.objects.filter(video_filter, status=Video.READY)
+    items = list(posts.order_by('-created_at')[:limit]) + list(videos.order_by('-created_at')[:limit])
+    items.sort(key=lambda item: item.created_at, reverse=True)
+    return items[:limit]
+
+
+def backfill(follower_id, following_id):
+    '''
+    Copy the latest items of a newly followed account into the follower's timeline.
+
+    High-follower accounts are copied too: their older items are never pulled, since a pull only brings
+    what is newer than the latest entry of that account (see `pull_high_follower_items`).
+    '''
+    items = _latest_items([following_id], limit=settings.TIMELINE_BACKFILL_ENTRIES)
+    TimelineEntry.objects.bulk_create([_entry(follower_id, item) for item in items], ignore_conflicts=True)
+
+
+def pull_high_follower_items(user):
+    '''
+    Insert the items that high-follower accounts followed by `user` published since their latest entry.
+
+    The watermark of each account is the newest entry it already has in `user`'s timeline, read from the
+    database with one grouped query, so every process agrees on it and only new items are written.
+    Accounts without any entry get their latest items; the unique constraints drop duplicates of racing pulls.
+    '''
+    followed = list(
+        Follow.objects.filter(follower_id=user.pk, following__high_follower_account__isnull=False).values_list('following_id', flat=True)
+    )
+    if not followed:
+        return
+    since = dict(
+        TimelineEntry.objects.filter(owner_id=user.pk, author_id__in=followed)
+        .values('author_id').annotate(latest=Max('created_at')).values_list('author_id', 'latest')
+    )
+    items = _latest_items(followed, since=since)
+    if items:
+        TimelineEntry.objects.bulk_create([_entry(user.pk, item) for item in items], ignore_conflicts=True)
+
+
+def trim(owner_ids=None):
+    '''
+    Delete the entries past the newest TIMELINE_MAX_ENTRIES of each owner, returning how many were deleted.
+
+    One DELETE for all owners: entries are numbered per owner, newest first, with ROW_NUMBER() over the
+    (owner, created_at, id) index.
+    '''
+    ranked = TimelineEntry.objects.annotate(position=Window(
+        RowNumber(), partition_by=F('owner'), order_by=[F('created_at').desc(), F('id').desc()],
+    ))
+    if owner_ids is not None:
+        ranked = ranked.filter(owner_id__in=owner_ids)
+    expired = ranked.filter(position__gt=settings.TIMELINE_MAX_ENTRIES).values('id')
+    return TimelineEntry.objects.filter(id__in=expired).delete()[0]
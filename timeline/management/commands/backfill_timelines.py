@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from authentication.models import CustomUser
+from profile_app.models import Follow
+from timeline.fanout import backfill, refresh_high_follower_accounts, trim
+
+
+class Command(BaseCommand):
+    help = 'Fill the home timelines of existing users from their own items and the accounts they follow'
+
+    def handle(self, *args, **kwargs):
+        """
+        Entry point of the management command.
+        """
+        refresh_high_follower_accounts()
+        for user_id in CustomUser.objects.values_list('id', flat=True).iterator():
+            backfill(user_id, user_id)
+        # Followers of high-follower accounts pull their items on their next read
+        follows = Follow.objects.filter(
+            follower__isnull=False, following__isnull=False, following__high_follower_account__isnull=True,
+        ).values_list('follower_id', 'following_id')
+        for follower_id, following_id in follows.iterator():
+            backfill(follower_id, following_id)
+        trim()
+        self.stdout.write(self.style.SUCCESS('Timelines backfilled successfully.'))
@@ -0,0 +1,40 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from timeline.fanout import trim
+from timeline.models import TimelineFanoutJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the timeline fan-out worker: insert new posts and videos into the home timelines of their followers, '
+        'and trim the timelines every TIMELINE_TRIM_INTERVAL seconds'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit instead of polling forever')
+
+    def handle(self, *args, **options):
+        """
+        Entry point of the management command.
+        """
+        self.stdout.write('Timeline fan-out worker started.')
+        trimmed_at = None
+        while True:
+            close_old_connections()
+            job = TimelineFanoutJob.claim_next()
+            if job is None:
+                # Trim while idle, so fan-outs never wait on it
+                if trimmed_at is None or time.monotonic() - trimmed_at >= settings.TIMELINE_TRIM_INTERVAL:
+                    self.stdout.write(f'{trim()} timeline entries trimmed')
+                    trimmed_at = time.monotonic()
+                if options['once']:
+                    break
+                time.sleep(settings.TIMELINE_FANOUT_POLL_INTERVAL)
+                continue
+
+            job.run()
+            self.stdout.write(f'{job}: attempt {job.attempts}')
+
+        self.stdout.write(self.style.SUCCESS('Timeline fan-out queue drained.'))
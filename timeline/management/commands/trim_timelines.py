@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from timeline.fanout import trim
+
+
+class Command(BaseCommand):
+    help = 'Delete home timeline entries past TIMELINE_MAX_ENTRIES per user (the fan-out worker also trims periodically)'
+
+    def handle(self, *args, **kwargs):
+        """
+        Entry point of the management command.
+        """
+        deleted = trim()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} timeline entries trimmed.'))
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.6 on 2026-10-17 01:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0008_passwordresetcode'),
+        ('post', '0006_remove_likepost_post_likepo_post_id_9f325f_idx_and_more'),
+        ('timeline', '0001_initial'),
+        ('vlog', '0010_remove_vloglike_vlog_vlogli_video_i_21e0f2_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HighFollowerAccount',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='high_follower_account', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TimelineFanoutJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='post.post')),
+                ('video', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='vlog.video')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'run_after'], name='timeline_ti_state_e85a41_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelinefanoutjob',
+            constraint=models.UniqueConstraint(fields=('post',), name='unique_fanout_post'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelinefanoutjob',
+            constraint=models.UniqueConstraint(fields=('video',), name='unique_fanout_video'),
+        ),
+    ]
@@ -0,0 +1,176 @@
+import logging
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from authentication.models import CustomUser
+from post.models import Post
+from profile_app.models import Follow
+from vlog.models import Video
+
+logger = logging.getLogger(__name__)
+
+
+class TimelineEntry(models.Model):
+    """
+    TimelineEntry Model
+
+    One row of a user's home timeline: a post or a video by an account `owner` follows (or by `owner` themselves).
+    Rows are written when the item is published (fan-out on write, see timeline.fanout) and copy the item's
+    `created_at`, so a timeline page is a single index range scan on (owner, created_at, id).
+    """
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['owner', 'created_at', 'id'])]
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_timeline_post'),
+            models.UniqueConstraint(fields=['owner', 'video'], name='unique_timeline_video'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id}: {'post' if self.post_id else 'video'} {self.post_id or self.video_id}"
+
+
+class HighFollowerAccount(models.Model):
+    """
+    HighFollowerAccount Model
+
+    An account with more than TIMELINE_FANOUT_MAX_FOLLOWERS followers. Its items are not fanned out on write;
+    readers pull them into their timeline instead (see timeline.fanout). Rows are added and removed by the
+    fan-out worker whenever the account publishes, and rebuilt by `manage.py backfill_timelines`.
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='high_follower_account')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} (fanned out on read)"
+
+
+class TimelineFanoutJob(models.Model):
+    """
+    A unit of work for the fan-out worker (`manage.py run_fanout_worker`): a published post or video to insert
+    into the timelines of its author's followers.
+
+    Jobs are written in the transaction that publishes the item, so publishing never waits for the fan-out
+    and no item is lost. Like VideoIngestJob, workers claim jobs with a conditional UPDATE and retry failures
+    with exponential backoff until TIMELINE_FANOUT_MAX_ATTEMPTS is reached.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'run_after']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['post'], name='unique_fanout_post'),
+            models.UniqueConstraint(fields=['video'], name='unique_fanout_video'),
+        ]
+
+    def __str__(self):
+        return f"fan out {'post' if self.post_id else 'video'} {self.post_id or self.video_id} ({self.state})"
+
+    @property
+    def item(self):
+        return self.post or self.video
+
+    @classmethod
+    def claim_next(cls):
+        """
+        Claim the oldest runnable job and return it, or None when the queue is empty.
+
+        Jobs left `running` by a worker that died are put back in the queue once their lock is
+        older than TIMELINE_FANOUT_LOCK_TIMEOUT.
+        """
+        now = timezone.now()
+        stale = now - timezone.timedelta(seconds=settings.TIMELINE_FANOUT_LOCK_TIMEOUT)
+        cls.objects.filter(state=cls.RUNNING, locked_at__lt=stale).update(state=cls.PENDING, locked_at=None)
+
+        candidates = cls.objects.filter(state=cls.PENDING, run_after__lte=now).order_by('run_after', 'id')
+        for job_id in candidates.values_list('id', flat=True)[:10]:
+            # Only one worker can move a given row from pending to running
+            if cls.objects.filter(id=job_id, state=cls.PENDING).update(state=cls.RUNNING, locked_at=now):
+                return cls.objects.select_related('post', 'video').get(id=job_id)
+        return None
+
+    def run(self):
+        """
+        Fan the item out and record the outcome of this attempt.
+        """
+        from .fanout import fan_out
+
+        self.attempts += 1
+        try:
+            fan_out(self.item)
+        except Exception as e:
+            logger.exception('Fan-out of %s failed (attempt %s)', self, self.attempts)
+            if self.attempts >= settings.TIMELINE_FANOUT_MAX_ATTEMPTS:
+                self.fail(repr(e))
+            else:
+                self.state = self.PENDING
+                self.last_error = repr(e)
+                self.run_after = timezone.now() + timezone.timedelta(
+                    seconds=settings.TIMELINE_FANOUT_RETRY_DELAY * 2 ** (self.attempts - 1)
+                )
+                self.locked_at = None
+                self.save(update_fields=['state', 'attempts', 'last_error', 'run_after', 'locked_at', 'updated_at'])
+        else:
+            self.state = self.DONE
+            self.locked_at = None
+            self.save(update_fields=['state', 'attempts', 'locked_at', 'updated_at'])
+
+    def fail(self, error):
+        self.state = self.FAILED
+        self.last_error = error
+        self.locked_at = None
+        self.save(update_fields=['state', 'attempts', 'last_error', 'locked_at', 'updated_at'])
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        TimelineFanoutJob.objects.bulk_create([TimelineFanoutJob(post=instance)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Video)
+def fan_out_video(sender, instance, update_fields=None, **kwargs):
+    # Videos are published once the ingest worker marks them ready
+    if instance.status == Video.READY and update_fields and 'status' in update_fields:
+        TimelineFanoutJob.objects.bulk_create([TimelineFanoutJob(video=instance)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_on_follow(sender, instance, created, **kwargs):
+    from .fanout import backfill
+    if created and instance.follower_id and instance.following_id:
+        transaction.on_commit(lambda: backfill(instance.follower_id, instance.following_id))
+
+
+@receiver(post_delete, sender=Follow)
+def drop_on_unfollow(sender, instance, **kwargs):
+    if instance.follower_id and instance.following_id:
+        TimelineEntry.objects.filter(owner_id=instance.follower_id, author_id=instance.following_id).delete()
@@ -0,0 +1,40 @@
+from rest_framework import serializers
+from media_app.serializers import prime_renditions
+from post.serializers import PostSerializer
+from vlog.serializers import VideoSerializer
+from .models import TimelineEntry
+
+
+class TimelineListSerializer(serializers.ListSerializer):
+    '''
+    Resolves the renditions of every post and video on the page in one lookup, and hands the
+    `post_liked` / `video_liked` annotations of the entries to the nested serializers.
+    '''
+
+    def to_representation(self, data):
+        entries = list(data)
+        posts, videos = [], []
+        for entry in entries:
+            if entry.post is not None:
+                entry.post.liked = getattr(entry, 'post_liked', False)
+                posts.append(entry.post)
+            if entry.video is not None:
+                entry.video.liked = getattr(entry, 'video_liked', False)
+                videos.append(entry.video)
+        prime_renditions(self.child.fields['post'], posts)
+        prime_renditions(self.child.fields['video'], videos)
+        return super().to_representation(entries)
+
+
+class TimelineEntrySerializer(serializers.ModelSerializer):
+    type = serializers.SerializerMethodField()
+    post = PostSerializer(read_only=True)
+    video = VideoSerializer(read_only=True)
+
+    class Meta:
+        model = TimelineEntry
+        fields = ('id', 'type', 'created_at', 'post', 'video')
+        list_serializer_class = TimelineListSerializer
+
+    def get_type(self, obj):
+        return 'post' if obj.post_id else 'video'
@@ -0,0 +1,130 @@
+import io
+from unittest import mock
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from post.models import Post
+from post.tests import LOCAL_STORAGES
+from profile_app.models import Follow
+from .fanout import trim
+from .models import HighFollowerAccount, TimelineEntry, TimelineFanoutJob
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class TimelineFanoutTests(TestCase):
+    '''
+    Published items reach the timelines of followers through the fan-out worker, or on read for
+    high-follower accounts.
+    '''
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user('author@example.com', 'pass1234', username='author')
+        self.followers = [
+            CustomUser.objects.create_user(f'follower{i}@example.com', 'pass1234', username=f'follower{i}') for i in range(3)
+        ]
+        for follower in self.followers:
+            Follow.objects.create(follower=follower, following=self.author)
+
+    def publish(self, content='post'):
+        return Post.objects.create(user=self.author, image='images/post.jpg', content=content)
+
+    def fan_out(self):
+        # TestCase runs in one transaction, which the worker's close_old_connections() would end
+        with mock.patch('timeline.management.commands.run_fanout_worker.close_old_connections'):
+            call_command('run_fanout_worker', '--once', stdout=io.StringIO())
+
+    def owners(self, post):
+        return set(TimelineEntry.objects.filter(post=post).values_list('owner_id', flat=True))
+
+    def timeline(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return [item['post']['id'] for item in client.get('/timeline/').data['results']]
+
+    def test_publishing_queues_the_fan_out(self):
+        post = self.publish()
+        self.assertEqual(self.owners(post), set())
+        self.assertEqual(TimelineFanoutJob.objects.get().post, post)
+
+        self.fan_out()
+        self.assertEqual(self.owners(post), {self.author.pk, *(follower.pk for follower in self.followers)})
+        self.assertEqual(TimelineFanoutJob.objects.get().state, TimelineFanoutJob.DONE)
+        self.assertEqual(self.timeline(self.followers[0]), [post.id])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=2)
+    def test_high_follower_accounts_are_pulled_on_read(self):
+        post = self.publish()
+        self.fan_out()
+        self.assertTrue(HighFollowerAccount.objects.filter(user=self.author).exists())
+        self.assertEqual(self.owners(post), {self.author.pk})
+
+        self.assertEqual(self.timeline(self.followers[0]), [post.id])
+        self.assertEqual(self.owners(post), {self.author.pk, self.followers[0].pk})
+
+        # Back under the limit, the next item is fanned out on write again
+        Follow.objects.filter(follower=self.followers[2]).delete()
+        later = self.publish('later')
+        self.fan_out()
+        self.assertFalse(HighFollowerAccount.objects.filter(user=self.author).exists())
+        self.assertEqual(self.owners(later), {self.author.pk, self.followers[0].pk, self.followers[1].pk})
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=2)
+    def test_following_a_high_follower_account_brings_its_older_items(self):
+        other = CustomUser.objects.create_user('other@example.com', 'pass1234', username='other')
+        for follower in (*self.followers[1:], self.author):
+            Follow.objects.create(follower=follower, following=other)
+        older = Post.objects.create(user=other, image='images/post.jpg', content='older')
+        newer = self.publish('newer')
+        self.fan_out()
+        self.assertEqual(HighFollowerAccount.objects.count(), 2)
+        reader = self.followers[0]
+        self.assertEqual(self.timeline(reader), [newer.id])
+
+        # `older` predates everything already pulled into the reader's timeline
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=reader, following=other)
+        self.assertEqual(self.timeline(reader), [newer.id, older.id])
+
+        latest = Post.objects.create(user=other, image='images/post.jpg', content='latest')
+        self.assertEqual(self.timeline(reader), [latest.id, newer.id, older.id])
+
+    @override_settings(TIMELINE_MAX_ENTRIES=2)
+    def test_worker_trims_timelines(self):
+        posts = [self.publish(f'post {i}') for i in range(3)]
+        self.fan_out()
+        self.assertEqual(self.timeline(self.followers[0]), [posts[2].id, posts[1].id])
+
+    def test_following_backfills_and_unfollowing_drops(self):
+        posts = [self.publish(f'post {i}') for i in range(3)]
+        reader = CustomUser.objects.create_user('reader@example.com', 'pass1234', username='reader')
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=reader, following=self.author)
+        self.assertEqual(sorted(self.timeline(reader)), sorted(post.id for post in posts))
+
+        Follow.objects.filter(follower=reader).delete()
+        self.assertEqual(self.timeline(reader), [])
+
+    @override_settings(TIMELINE_MAX_ENTRIES=3)
+    def test_trim_keeps_the_newest_entries_of_each_owner(self):
+        now = timezone.now()
+        posts = [self.publish(f'post {i}') for i in range(5)]
+        # Two entries share the created_at at the cut; the one with the higher id is the newer
+        times = [now - timedelta(minutes=3), now - timedelta(minutes=2), now - timedelta(minutes=1), now - timedelta(minutes=1), now]
+        for owner in (self.followers[0], self.followers[1]):
+            TimelineEntry.objects.bulk_create(
+                TimelineEntry(owner=owner, author=self.author, post=post, created_at=created_at) for post, created_at in zip(posts, times)
+            )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(trim([self.followers[0].pk]), 2)
+        kept = TimelineEntry.objects.filter(owner=self.followers[0]).order_by('-created_at', '-id')
+        self.assertEqual([entry.post_id for entry in kept], [posts[4].id, posts[3].id, posts[2].id])
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.followers[1]).count(), 5)
+
+        self.assertEqual(trim(), 2)
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.followers[1]).count(), 3)
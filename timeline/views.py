@@ -0,0 +1,34 @@
+from django.db.models import Exists, OuterRef
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
+from authentication.blocking import exclude_blocked
+from authentication.pagination import CreatedAtCursorPagination
+from post.hidden import exclude_hidden
+from post.models import LikePost
+from trend.instrumentation import TimedSerializationMixin
+from vlog.models import VlogLike
+from .fanout import pull_high_follower_items
+from .models import TimelineEntry
+from .serializers import TimelineEntrySerializer
+
+
+class TimelineView(TimedSerializationMixin, generics.ListAPIView):
+    """
+    API view to retrieve the home timeline of the authenticated user: their own posts and videos and those of the
+    accounts they follow, newest first. Pages are read from the materialized TimelineEntry table with keyset pagination.
+    """
+    serializer_class = TimelineEntrySerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        pull_high_follower_items(user)
+        queryset = TimelineEntry.objects.filter(owner_id=user.pk).select_related(
+            'post__user__profile', 'post__like_counter', 'post__comment_counter',
+            'video__author__profile', 'video__like_counter', 'video__comment_counter',
+        ).annotate(
+            post_liked=Exists(LikePost.objects.filter(post=OuterRef('post'), user_id=user.pk)),
+            video_liked=Exists(VlogLike.objects.filter(video=OuterRef('video'), user_id=user.pk)),
+        )
+        return exclude_hidden(exclude_blocked(queryset, user, field='author'), user, field='post')
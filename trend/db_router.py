@@ -1,12 +1,115 @@
+'''
+Read Replica Router
+
+Sends reads to the read replicas in DATABASE_REPLICAS ({alias: weight}) and writes to `default`.
+
+Reads stay on the primary whenever a replica could return stale data:
+    - inside a transaction on the primary,
+    - for the rest of the request (or task) once it has written anything,
+    - for REPLICA_PIN_SECONDS after a client's last write, on its following requests (see ReplicaPinningMiddleware),
+    - when no replica is healthy, i.e. reachable and at most REPLICA_MAX_LAG_SECONDS behind the primary.
+
+Usage:
+    DATABASES['replica_1'] = {..., 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS = {'replica_1': 1}
+    DATABASE_ROUTERS = ['trend.db_router.DbRouter']
+'''
+
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.core import signing
+from django.db import DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+# Postgres standbys report how far their replay is behind; 0 when they have replayed everything they received
+POSTGRES_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+'''
+
+_pinned = ContextVar('db_pinned_to_primary', default=False)
+_wrote = ContextVar('db_wrote', default=False)
+_health = {}
+_health_lock = threading.Lock()
+_pin_signer = signing.TimestampSigner(salt='trend.db_router.pin')
+
+
+def pin_token():
+    '''
+    A signed, timestamped token that pins the client holding it to the primary for REPLICA_PIN_SECONDS.
+
+    The pin travels with the client rather than living in a cache, so every process of every server honours it.
+    '''
+    return _pin_signer.sign('primary')
+
+
+def is_pinned(token):
+    if not token:
+        return False
+    try:
+        _pin_signer.unsign(token, max_age=settings.REPLICA_PIN_SECONDS)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _check_replica(alias):
+    try:
+        with connections[alias].cursor() as cursor:
+            if connections[alias].vendor == 'postgresql':
+                cursor.execute(POSTGRES_LAG_SQL)
+                lag = cursor.fetchone()[0] or 0
+                if lag > settings.REPLICA_MAX_LAG_SECONDS:
+                    logger.warning('Replica %s is %.1fs behind, reading from the primary', alias, lag)
+                    return False
+            else:
+                cursor.execute('SELECT 1')
+        return True
+    except DatabaseError:
+        logger.warning('Replica %s is unavailable, reading from the primary', alias, exc_info=True)
+        return False
+
+
+def replica_is_healthy(alias):
+    '''
+    Return the last health check of a replica, re-checking it every REPLICA_HEALTH_CHECK_INTERVAL seconds.
+    '''
+    now = time.monotonic()
+    checked_at, healthy = _health.get(alias, (None, True))
+    if checked_at is not None and now - checked_at < settings.REPLICA_HEALTH_CHECK_INTERVAL:
+        return healthy
+    with _health_lock:
+        checked_at, healthy = _health.get(alias, (None, True))
+        if checked_at is None or now - checked_at >= settings.REPLICA_HEALTH_CHECK_INTERVAL:
+            healthy = _check_replica(alias)
+            _health[alias] = (time.monotonic(), healthy)
+    return healthy
+
+
 class DbRouter:
     def db_for_read(self, model, **hints):
-        # Reads go to the standby node or pool
-        return 'read_replica'
- 
+        # Reads go to a healthy replica unless they must see this request's writes
+        if _pinned.get() or _wrote.get() or connections['default'].in_atomic_block:
+            return 'default'
+        replicas = [(alias, weight) for alias, weight in settings.DATABASE_REPLICAS.items() if replica_is_healthy(alias)]
+        if not replicas:
+            return 'default'
+        aliases, weights = zip(*replicas)
+        return random.choices(aliases, weights=weights)[0]
+
     def db_for_write(self, model, **hints):
-        # Writes always go to the primary node.
+        # Writes always go to the primary node, and pin the rest of the request to it
+        _wrote.set(True)
         return 'default'
- 
+
     def allow_relation(self, obj1, obj2, **hints):
         # We have a fully replicated cluster, so we can allow
         # relationships between objects from different databases
@@ -14,4 +117,4 @@ class DbRouter:
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
         # Only allow migrations on the primary
-        return db == 'default'
\ No newline at end of file
+        return db == 'default'
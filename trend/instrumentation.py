@@ -0,0 +1,217 @@
+'''
+Request Instrumentation
+
+Measures where each request spends its time, with InstrumentationMiddleware (trend.middleware):
+    - SQL: queries and their total time, on every database connection (a connection execute wrapper),
+    - duplicates: queries run INSTRUMENTATION_DUPLICATE_QUERIES times or more with only their parameters changed,
+      the usual sign of an N+1,
+    - serializer: time spent producing serializer.data in the views using TimedSerializationMixin,
+    - storage: time spent in file storage calls, signing URLs included (media_app.storage).
+
+Every response gets a Server-Timing header, every request a JSON line on the `trend.instrumentation` logger,
+and the timings are added to in-process histograms covering the last INSTRUMENTATION_WINDOW seconds.
+The histograms are served in the Prometheus text format at /metrics/ to staff users. They are per process
+and windowed, so read them as they are (e.g. histogram_quantile) rather than with rate().
+
+Usage:
+    with timed('storage'):
+        ...
+
+    class PostList(TimedSerializationMixin, generics.ListCreateAPIView):
+        ...
+'''
+
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from rest_framework.response import Response
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    '''
+    What one request spent, filled in while it runs.
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.fingerprints = Counter()
+        self.durations = {'sql': 0.0, 'serializer': 0.0, 'storage': 0.0}
+        self.active = set()
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.fingerprints.items() if count >= settings.INSTRUMENTATION_DUPLICATE_QUERIES}
+
+
+def fingerprint(sql):
+    '''
+    The shape of a query: parameters are already placeholders, so only collapse IN lists and whitespace.
+    '''
+    sql = re.sub(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)', 'IN (...)', sql)
+    return ' '.join(sql.split())
+
+
+def start():
+    return _stats.set(RequestStats())
+
+
+def finish(token):
+    stats = _stats.get()
+    _stats.reset(token)
+    return stats
+
+
+@contextmanager
+def timed(kind):
+    '''
+    Add the time spent in the block to `kind` of the current request; nested blocks of the same kind count once.
+    '''
+    stats = _stats.get()
+    if stats is None or kind in stats.active:
+        yield
+        return
+    stats.active.add(kind)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.durations[kind] += time.perf_counter() - started
+        stats.active.discard(kind)
+
+
+def record_query(execute, sql, params, many, context):
+    '''
+    Connection execute wrapper counting and timing the queries of the current request.
+    '''
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.durations['sql'] += time.perf_counter() - started
+        stats.queries += 1
+        stats.fingerprints[fingerprint(sql)] += 1
+
+
+class TimedSerializationMixin:
+    '''
+    Generic view mixin timing serializer.data of list() and retrieve() into the request's serializer time.
+
+    The two actions are those of DRF's ListModelMixin and RetrieveModelMixin, with the serialization timed.
+    '''
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(queryset if page is None else page, many=True)
+        with timed('serializer'):
+            data = serializer.data
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        with timed('serializer'):
+            data = serializer.data
+        return Response(data)
+
+
+class RollingHistogram:
+    '''
+    A labelled histogram of the observations of the last `window` seconds, kept in slots of a tenth of the window.
+    '''
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._slots = deque()
+        self._lock = threading.Lock()
+
+    def _slot_seconds(self):
+        return max(settings.INSTRUMENTATION_WINDOW / 10, 1)
+
+    def _expire(self, now):
+        while self._slots and self._slots[0][0] <= now - settings.INSTRUMENTATION_WINDOW:
+            self._slots.popleft()
+
+    def observe(self, labels, value):
+        now = time.time()
+        slot_start = now - now % self._slot_seconds()
+        with self._lock:
+            self._expire(now)
+            if not self._slots or self._slots[-1][0] != slot_start:
+                self._slots.append((slot_start, {}))
+            # counts per bucket, then +Inf, sum
+            series = self._slots[-1][1].setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        merged = {}
+        with self._lock:
+            self._expire(time.time())
+            for _, slot in self._slots:
+                for labels, series in slot.items():
+                    total = merged.setdefault(labels, [0] * len(series))
+                    for i, value in enumerate(series):
+                        total[i] += value
+        return merged
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self.snapshot().items()):
+            label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+            for bound, count in zip([*self.buckets, '+Inf'], series):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {series[-2]}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+HISTOGRAMS = {
+    'duration': RollingHistogram('trend_request_duration_seconds', 'Time to respond to a request.', SECONDS_BUCKETS),
+    'queries': RollingHistogram('trend_request_queries', 'SQL queries run by a request.', COUNT_BUCKETS),
+    'duplicates': RollingHistogram('trend_request_duplicate_queries', 'Queries of a request repeating an earlier one with other parameters.', COUNT_BUCKETS),
+    'sql': RollingHistogram('trend_request_sql_seconds', 'Time a request spent in SQL queries.', SECONDS_BUCKETS),
+    'serializer': RollingHistogram('trend_request_serializer_seconds', 'Time a request spent producing serializer data.', SECONDS_BUCKETS),
+    'storage': RollingHistogram('trend_request_storage_seconds', 'Time a request spent in file storage calls.', SECONDS_BUCKETS),
+}
+
+
+def observe(labels, stats, duration):
+    labels = tuple(sorted(labels.items()))
+    HISTOGRAMS['duration'].observe(labels, duration)
+    HISTOGRAMS['queries'].observe(labels, stats.queries)
+    HISTOGRAMS['duplicates'].observe(labels, sum(stats.fingerprints.values()) - len(stats.fingerprints))
+    for kind, seconds in stats.durations.items():
+        HISTOGRAMS[kind].observe(labels, seconds)
+
+
+def exposition():
+    '''
+    All histograms in the Prometheus text format.
+    '''
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines += histogram.exposition()
+    return '\n'.join(lines) + '\n'
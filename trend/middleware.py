@@ -0,0 +1,98 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from . import instrumentation
+from .db_router import _pinned, _wrote, is_pinned, pin_token
+
+logger = logging.getLogger('trend.instrumentation')
+
+
+class ReplicaPinningMiddleware:
+    """
+    Gives users read-your-writes consistency across requests when reads go to replicas (see trend.db_router).
+
+    A request by an authenticated user that writes hands the client a signed pin, valid for REPLICA_PIN_SECONDS,
+    in the PIN_COOKIE cookie and the PIN_HEADER response header. Requests that carry it back, in the cookie or
+    the same request header (for API clients that don't keep cookies), read from the primary. Checking the pin
+    costs no query and no cache lookup; the user is the one DRF authenticated for the view.
+    """
+    PIN_COOKIE = 'replica_pin'
+    PIN_HEADER = 'X-Replica-Pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.COOKIES.get(self.PIN_COOKIE) or request.headers.get(self.PIN_HEADER)
+        pinned = _pinned.set(is_pinned(token))
+        wrote = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            # DRF sets the authenticated user on the underlying request
+            user = getattr(request, 'user', None)
+            if _wrote.get() and user is not None and user.is_authenticated:
+                token = pin_token()
+                response.set_cookie(
+                    self.PIN_COOKIE, token, max_age=settings.REPLICA_PIN_SECONDS,
+                    secure=request.is_secure(), httponly=True, samesite='Lax',
+                )
+                response[self.PIN_HEADER] = token
+        finally:
+            _pinned.reset(pinned)
+            _wrote.reset(wrote)
+        return response
+
+
+class InstrumentationMiddleware:
+    """
+    Records the queries, SQL time, duplicate queries, serializer time and storage time of every request
+    (see trend.instrumentation), and reports them in a Server-Timing header, a JSON log line and the /metrics/ histograms.
+
+    Goes first in MIDDLEWARE, so that the total covers the other middleware too.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = instrumentation.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(instrumentation.record_query))
+                response = self.get_response(request)
+        finally:
+            stats = instrumentation.finish(token)
+        duration = time.perf_counter() - stats.started
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.durations["sql"] * 1000:.1f};desc="{stats.queries} queries"',
+            f'serializer;dur={stats.durations["serializer"] * 1000:.1f}',
+            f'storage;dur={stats.durations["storage"] * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ])
+        match = request.resolver_match
+        route = match.route if match else 'unmatched'
+        instrumentation.observe({'method': request.method, 'route': route}, stats, duration)
+
+        duplicates = stats.duplicates()
+        log = logger.warning if duplicates else logger.info
+        log(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'queries': stats.queries,
+            'sql_ms': round(stats.durations['sql'] * 1000, 1),
+            'serializer_ms': round(stats.durations['serializer'] * 1000, 1),
+            'storage_ms': round(stats.durations['storage'] * 1000, 1),
+            'duplicate_queries': [{'sql': sql[:500], 'count': count} for sql, count in duplicates.items()],
+        }))
+        return response
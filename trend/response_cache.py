@@ -0,0 +1,92 @@
+'''
+Anonymous Response Cache
+
+Caches the serialized responses of public read endpoints for logged-out visitors, in the `responses` cache
+(an in-process LRU by default, memcached when RESPONSE_CACHE_MEMCACHED is set).
+
+Entries live for RESPONSE_CACHE_TIMEOUT seconds at most. Every entry is keyed on the versions of the data scopes
+its view reads (`cache_scopes`), and writes to Post, Video, Profile and Follow bump those versions through signals,
+so a write makes every page that showed the old data unreachable at once. With the in-process backend each worker
+keeps its own entries and versions, so other workers may serve the old page until the timeout.
+
+Responses carry an ETag; a request whose If-None-Match matches gets an empty 304.
+
+Usage:
+    class PostList(AnonymousResponseCacheMixin, generics.ListAPIView):
+        cache_scopes = ('posts', 'profiles')
+'''
+
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def _cache():
+    return caches['responses']
+
+
+def _version_key(scope):
+    return f'responses:version:{scope}'
+
+
+def invalidate_scopes(*scopes):
+    '''
+    Make every cached response that read one of `scopes` stale.
+    '''
+    cache = _cache()
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.set(_version_key(scope), 2, timeout=None)
+
+
+def _versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    versions = _cache().get_many(keys)
+    return [str(versions.get(key, 1)) for key in keys]
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Serves GET requests of anonymous users from the response cache, with ETag / If-None-Match support.
+    Authenticated users always get a fresh response, since blocks, hidden posts and liked state depend on them.
+    """
+    cache_scopes = ()
+
+    def get_response_cache_key(self, request):
+        # Rendition URLs depend on the Accept header and absolute URLs on the host
+        webp = 'image/webp' in request.META.get('HTTP_ACCEPT', '')
+        variant = f'{request.get_host()}|{request.get_full_path()}|{webp}|{request.accepted_renderer.format}'
+        versions = '.'.join(_versions(self.cache_scopes))
+        return f'responses:{self.__class__.__name__}:{versions}:{hashlib.md5(variant.encode()).hexdigest()}'
+
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        cache = _cache()
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            body = json.dumps(response.data, cls=JSONEncoder, sort_keys=True)
+            cached = (json.loads(body), f'"{hashlib.md5(body.encode()).hexdigest()}"')
+            cache.set(key, cached, settings.RESPONSE_CACHE_TIMEOUT)
+
+        data, etag = cached
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={settings.RESPONSE_CACHE_TIMEOUT}'
+        patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+        return response
@@ -0,0 +1,166 @@
+import contextvars
+import json
+import os
+import tempfile
+from unittest import mock
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from post.tests import LOCAL_STORAGES
+from .db_router import DbRouter, is_pinned, pin_token
+from .instrumentation import HISTOGRAMS
+from .middleware import InstrumentationMiddleware, ReplicaPinningMiddleware
+
+REPLICAS = {'replica_1': 3, 'replica_2': 1}
+
+
+def isolated(func, *args):
+    # every request or task runs in its own context
+    return contextvars.Context().run(func, *args)
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS, REPLICA_PIN_SECONDS=5)
+@mock.patch('trend.db_router.replica_is_healthy', return_value=True)
+class DbRouterTests(SimpleTestCase):
+    router = DbRouter()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reads_are_spread_over_replicas_by_weight(self, healthy):
+        with mock.patch('trend.db_router.random.choices', side_effect=lambda aliases, weights: [aliases[0]]) as choices:
+            self.assertEqual(isolated(self.router.db_for_read, CustomUser), 'replica_1')
+        self.assertEqual(choices.call_args.kwargs['weights'], (3, 1))
+
+    def test_reads_after_a_write_go_to_the_primary(self, healthy):
+        def write_then_read():
+            self.assertEqual(self.router.db_for_write(CustomUser), 'default')
+            return self.router.db_for_read(CustomUser)
+
+        self.assertEqual(isolated(write_then_read), 'default')
+        self.assertIn(isolated(self.router.db_for_read, CustomUser), REPLICAS)
+
+    def test_unhealthy_replicas_are_skipped(self, healthy):
+        healthy.side_effect = lambda alias: alias == 'replica_2'
+        self.assertEqual(isolated(self.router.db_for_read, CustomUser), 'replica_2')
+        healthy.side_effect = None
+        healthy.return_value = False
+        self.assertEqual(isolated(self.router.db_for_read, CustomUser), 'default')
+
+    def test_pins_expire_and_must_be_signed(self, healthy):
+        token = pin_token()
+        self.assertTrue(is_pinned(token))
+        self.assertFalse(is_pinned(token[:-1] + ('A' if token[-1] != 'A' else 'B')))
+        self.assertFalse(is_pinned(None))
+        with self.settings(REPLICA_PIN_SECONDS=-1):
+            self.assertFalse(is_pinned(token))
+
+
+@override_settings(DATABASE_REPLICAS={'replica_1': 1}, DATABASE_ROUTERS=['trend.db_router.DbRouter'], REPLICA_PIN_SECONDS=5)
+class ReplicaPinningTests(TransactionTestCase):
+    '''
+    Against a real second database that lags behind the primary: after writing, a client reads its writes
+    from the primary on its following requests, wherever they are served, and other clients keep using the replica.
+    '''
+    databases = '__all__'  # replica_1 is added in setUpClass, after the test runner has set the databases up
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        replica = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')}
+        connections.settings['replica_1'] = connections.configure_settings({
+            'default': connections.settings['default'], 'replica_1': replica,
+        })['replica_1']
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica_1'].close()
+        del connections['replica_1']
+        del connections.settings['replica_1']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        with connections['replica_1'].schema_editor() as editor:
+            editor.create_model(CustomUser)
+        self.addCleanup(self.drop_replica_table)
+        # The replica has the user, but not the writes made on the primary from now on
+        self.user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='old')
+        CustomUser.objects.using('replica_1').bulk_create([CustomUser.objects.get(pk=self.user.pk)])
+
+    def drop_replica_table(self):
+        with connections['replica_1'].schema_editor() as editor:
+            editor.delete_model(CustomUser)
+
+    def request(self, view, **kwargs):
+        request = RequestFactory().get('/', **kwargs)
+        request.user = self.user  # set by DRF's authentication in the view
+        return isolated(ReplicaPinningMiddleware(view), request)
+
+    def rename(self, request):
+        CustomUser.objects.filter(pk=self.user.pk).update(username='new')
+        return HttpResponse()
+
+    def read_username(self, request):
+        return HttpResponse(CustomUser.objects.get(pk=self.user.pk).username)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.assertEqual(self.request(self.read_username).content, b'old')
+        response = self.request(self.rename)
+        cookie, header = response.cookies['replica_pin'], response['X-Replica-Pin']
+        self.assertEqual((cookie.value, cookie['max-age']), (header, 5))
+
+        # Pinned through the cookie or the header, not pinned without either
+        self.assertEqual(self.request(self.read_username, HTTP_COOKIE=f'replica_pin={cookie.value}').content, b'new')
+        self.assertEqual(self.request(self.read_username, HTTP_X_REPLICA_PIN=header).content, b'new')
+        self.assertEqual(self.request(self.read_username).content, b'old')
+        self.assertEqual(self.request(self.read_username, HTTP_X_REPLICA_PIN='forged').content, b'old')
+
+    def test_reads_do_not_pin(self):
+        response = self.request(self.read_username)
+        self.assertNotIn('replica_pin', response.cookies)
+        self.assertFalse(response.has_header('X-Replica-Pin'))
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class InstrumentationTests(TestCase):
+    '''
+    Every request reports its queries and timings, and repeated query shapes are logged as an N+1.
+    '''
+
+    def test_repeated_queries_are_reported(self):
+        def view(request):
+            for i in range(4):
+                list(CustomUser.objects.filter(pk=i))
+            return HttpResponse()
+
+        request = RequestFactory().get('/post/')
+        request.resolver_match = None
+        with self.assertLogs('trend.instrumentation', 'WARNING') as logs:
+            response = InstrumentationMiddleware(view)(request)
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="4 queries", serializer;dur=0\.0, storage;dur=0\.0, total;dur=')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['queries'], 4)
+        self.assertEqual(line['duplicate_queries'][0]['count'], 4)
+
+    def test_metrics_are_staff_only(self):
+        user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='alice')
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.assertLogs('trend.instrumentation', 'INFO'):
+            self.assertEqual(client.get('/metrics/').status_code, 403)
+
+        CustomUser.objects.filter(pk=user.pk).update(is_staff=True)
+        user.refresh_from_db()
+        client.force_authenticate(user)
+        with self.assertLogs('trend.instrumentation', 'INFO'):
+            response = client.get('/post/')
+            self.assertGreater(HISTOGRAMS['serializer'].snapshot()[(('method', 'GET'), ('route', 'post/'))][-1], 0)
+            response = client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('trend_request_queries_bucket{method="GET",route="post/",le="+Inf"}', response.content.decode())
@@ -21,6 +21,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from .swagger import urlpatterns as swagger_urls
+from .views import MetricsView
 
 
 urlpatterns = [
@@ -30,6 +31,9 @@ urlpatterns = [
     path('', include('post.urls')),
     path('', include('profile_app.urls')),
     path('', include('vlog.urls')),
+    path('', include('media_app.urls')),
+    path('', include('timeline.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 
 
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,14 @@
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+from . import instrumentation
+
+
+class MetricsView(APIView):
+    """
+    The request histograms of this process (see trend.instrumentation), in the Prometheus text format. Staff only.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(instrumentation.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,7 +1,16 @@
 from django.contrib import admin
-from .models import Video
+from .models import Video, VideoIngestJob
 
 class VideoAdmin(admin.ModelAdmin):
-    list_display = ('author', 'title', 'description', 'video', 'duration', 'created_at', 'updated_at')
+    list_display = ('author', 'title', 'description', 'video', 'duration', 'status', 'created_at', 'updated_at')
+    list_filter = ('status',)
 
 admin.site.register(Video, VideoAdmin)
+
+
+class VideoIngestJobAdmin(admin.ModelAdmin):
+    list_display = ('video', 'state', 'attempts', 'run_after', 'last_error', 'updated_at')
+    list_filter = ('state',)
+    readonly_fields = ('created_at', 'updated_at')
+
+admin.site.register(VideoIngestJob, VideoIngestJobAdmin)
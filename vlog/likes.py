@@ -0,0 +1,5 @@
+from post.likes import LikedIds
+from .models import VlogLike, VlogLikeCounter
+
+
+video_likes = LikedIds('video', VlogLike, 'video', VlogLikeCounter)
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def remove_duplicate_counters(apps, schema_editor):
+    # Counters used to be plain foreign keys; keep only the newest row per video before adding the unique constraint.
+    # Any drift is repaired afterwards by `manage.py reconcile_counters`.
+    for model_name in ('VlogLikeCounter', 'VlogCommentCounter'):
+        model = apps.get_model('vlog', model_name)
+        keep_ids = model.objects.values('video').annotate(keep_id=models.Max('id')).values('keep_id')
+        model.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlog', '0004_video_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_counters, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vlogcommentcounter',
+            name='video',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='comment_counter', to='vlog.video'),
+        ),
+        migrations.AlterField(
+            model_name='vloglikecounter',
+            name='video',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='like_counter', to='vlog.video'),
+        ),
+    ]
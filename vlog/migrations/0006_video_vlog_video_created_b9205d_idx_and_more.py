@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlog', '0005_alter_vlogcommentcounter_video_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['created_at', 'id'], name='vlog_video_created_b9205d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vlogcomment',
+            index=models.Index(fields=['video', 'created_at', 'id'], name='vlog_vlogco_video_i_58df48_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_existing_videos_ready(apps, schema_editor):
+    # Videos uploaded before the ingest queue were processed synchronously
+    Video = apps.get_model('vlog', 'Video')
+    Video.objects.update(status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlog', '0006_video_vlog_video_created_b9205d_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='status',
+            field=models.CharField(choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='processing', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='VideoIngestJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingest_jobs', to='vlog.video')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'run_after'], name='vlog_videoi_state_4904bc_idx')],
+            },
+        ),
+        migrations.RunPython(mark_existing_videos_ready, migrations.RunPython.noop),
+    ]
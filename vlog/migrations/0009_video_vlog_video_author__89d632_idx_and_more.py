@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlog', '0008_video_codec_video_height_video_width'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['author', 'created_at'], name='vlog_video_author__89d632_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vloglike',
+            index=models.Index(fields=['video', 'created_at'], name='vlog_vlogli_video_i_21e0f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vloglike',
+            index=models.Index(fields=['user', 'created_at'], name='vlog_vlogli_user_id_96a36d_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 01:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlog', '0009_video_vlog_video_author__89d632_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='vloglike',
+            name='vlog_vlogli_video_i_21e0f2_idx',
+        ),
+        migrations.AddIndex(
+            model_name='vloglike',
+            index=models.Index(fields=['video', 'created_at', 'id'], name='vlog_vlogli_video_i_e10161_idx'),
+        ),
+    ]
@@ -3,13 +3,24 @@ from django.conf import settings
 from authentication.models import CustomUser
 from django.core.validators import FileExtensionValidator
 from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.core.files import File
-from PIL import Image
-from moviepy.editor import VideoFileClip
+from imageio_ffmpeg import get_ffmpeg_exe
+from .probe import probe_path
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from trend.response_cache import invalidate_scopes
+from post.counters import counter_buffer
 import tempfile
-import requests
+import shutil
+import subprocess
+import logging
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
 
 
 def validate_video_size(file):
@@ -42,14 +53,50 @@ def validate_video_duration(duration):
         raise ValidationError(f"Video duration should not exceed {max_duration}.")
 
 
-def generate_thumbnail(video_path, thumbnail_path):
+def generate_thumbnail(video_path, thumbnail_path, at=1):
+    """
+    Extract the frame at `at` seconds as a JPEG.
 
+    ffmpeg seeks to the nearest keyframe before opening the input and decodes a single frame,
+    so the cost doesn't grow with the length of the video.
+    """
     os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
-    clip = VideoFileClip(video_path)
-    frame = clip.get_frame(1)  # Extract frame at 1 second
-    image = Image.fromarray(frame)
-    # image.save(os.path.join(settings.MEDIA_ROOT, thumbnail_path))  # locally
-    image.save(thumbnail_path) # with S3
+    subprocess.run(
+        [get_ffmpeg_exe(), '-v', 'error', '-y', '-ss', f'{at:.3f}', '-i', video_path,
+         '-frames:v', '1', '-q:v', '2', thumbnail_path],
+        check=True, capture_output=True, timeout=60,
+    )
+    if not os.path.exists(thumbnail_path):
+        raise ValueError(f"No frame at {at}s in {video_path}.")
+
+
+@contextmanager
+def local_video_copy(video_file):
+    """
+    Yield a local filesystem path for a stored video file.
+
+    Storages that keep files on local disk are read in place. Remote storages (S3) are streamed
+    chunk by chunk into a temporary file that is removed on exit.
+    """
+    try:
+        path = video_file.path
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(video_file.name)[1]) as temp_video:
+        video_file.open('rb')
+        try:
+            shutil.copyfileobj(video_file, temp_video, length=1024 * 1024)
+        finally:
+            video_file.close()
+        temp_video_path = temp_video.name
+    try:
+        yield temp_video_path
+    finally:
+        os.remove(temp_video_path)
 
 
 class Video(models.Model):
@@ -62,6 +109,9 @@ class Video(models.Model):
         description (TextField): The description of the video.
         video (FileField): The uploaded video file.
         duration (DurationField): The duration of the video.
+        width, height (PositiveIntegerField): The frame size read from the container header.
+        codec (CharField): The video codec read from the container header.
+        status (CharField): Where the upload is in the ingest pipeline (processing, ready or failed).
         created_at (DateTimeField): The date and time when the video was created.
         updated_at (DateTimeField): The date and time when the video was last updated.
     """
@@ -80,52 +130,90 @@ class Video(models.Model):
         blank=True,
         validators=[validate_video_duration]
     )
+    width = models.PositiveIntegerField(blank=True, null=True)
+    height = models.PositiveIntegerField(blank=True, null=True)
+    codec = models.CharField(max_length=16, blank=True, null=True)
     thumbnail = models.ImageField(upload_to='video_thumbnails/', blank=True, null=True)
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PROCESSING)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),  # keyset pagination of the video feed
+            models.Index(fields=['author', 'created_at']),  # a user's videos, newest first
+        ]
+
     def save(self, *args, **kwargs):
         """
-        Save the video instance and calculate its duration using moviepy.
+        Save the video instance and queue it for ingest.
 
-        If a video file is uploaded, the method saves the file, calculates its duration using moviepy,
-        sets the duration field, validates the duration, and saves the model instance.
+        Probing the duration and generating the thumbnail are slow, so a new upload is only stored
+        here, left in the `processing` status and handed to the ingest worker (see VideoIngestJob).
+        The job row is written in the same transaction as the video, so no upload can be lost between them.
 
         If no video file is uploaded, the method saves the model instance without any video processing.
         """
         is_new = not self.pk  # Check if the video is being created for the first time
         with transaction.atomic():
             super().save(*args, **kwargs)  # Save the video instance to generate the pk
+            if self.video and is_new:
+                VideoIngestJob.objects.create(video=self)
 
-        if self.video and is_new:
-            # video_path = os.path.join(settings.MEDIA_ROOT, self.video.name)  # locally
-            # Download the video file from S3
-            video_url = self.video.url
-            with tempfile.NamedTemporaryFile(delete=False) as temp_video:
-                temp_video.write(requests.get(video_url).content)
-                temp_video_path = temp_video.name
+    def apply_probe(self, probe):
+        """
+        Copy a ProbeResult (see vlog.probe) onto the instance.
+        """
+        self.duration = timezone.timedelta(seconds=probe.duration)
+        self.width = probe.width
+        self.height = probe.height
+        self.codec = probe.codec
 
-            video = VideoFileClip(temp_video_path)
-            duration_seconds = video.duration
-            self.duration = timezone.timedelta(seconds=duration_seconds)
-            validate_video_duration(self.duration)
+    def process_upload(self):
+        """
+        Generate the thumbnail of the uploaded file.
+
+        Uploads coming through VideoSerializer were already probed from the request's temp file, so only
+        videos created some other way (admin, shell) are probed here. Runs in the ingest worker, never inside a request.
+        """
+        with local_video_copy(self.video) as video_path:
+            if self.duration is None:
+                self.apply_probe(probe_path(video_path))
+                validate_video_duration(self.duration)
 
             # Generate thumbnail
             thumbnail_path = os.path.join(settings.MEDIA_ROOT, 'video_thumbnails', f'{self.pk}.jpg')
-            generate_thumbnail(temp_video_path, thumbnail_path)
-            self.thumbnail.save(f'{self.pk}.jpg', File(open(thumbnail_path, 'rb')))
-            video.close()
+            generate_thumbnail(video_path, thumbnail_path, at=min(1, self.duration.total_seconds() / 2))
+            with open(thumbnail_path, 'rb') as thumbnail:
+                self.thumbnail.save(f'{self.pk}.jpg', File(thumbnail), save=False)
 
-            # Remove the temporary video file
-            os.remove(temp_video_path)
-            # Save the model instance with the updated duration and thumbnail
-            super().save(update_fields=['duration', 'thumbnail'])
+        self.status = self.READY
+        # Save the model instance with the updated duration and thumbnail
+        super().save(update_fields=['duration', 'width', 'height', 'codec', 'thumbnail', 'status', 'updated_at'])
 
     def like_count(self):
-        return self.likes.count()
+        # Read the denormalized like counter (select_related('like_counter') avoids a query per video)
+        # plus the likes still buffered by this process (LIKE_COUNTER_WRITE_BEHIND, see post.counters)
+        pending = counter_buffer.pending(VlogLikeCounter, self.pk)
+        try:
+            return self.like_counter.count + pending
+        except VlogLikeCounter.DoesNotExist:
+            return pending
 
     def comment_count(self):
-        return self.comments.count()
+        # Read the denormalized comment counter (select_related('comment_counter') avoids a query per video)
+        try:
+            return self.comment_counter.count
+        except VlogCommentCounter.DoesNotExist:
+            return 0
 
     def __str__(self):
         return self.title
@@ -138,6 +226,11 @@ class VlogComment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['video', 'created_at', 'id']),  # keyset pagination of a video's comments
+        ]
+
     def __str__(self):
         return f"{self.user.username}: {self.content[:20]}..."
 
@@ -149,16 +242,166 @@ class VlogLike(models.Model):
 
     class Meta:
         unique_together = ('video', 'user')
+        indexes = [
+            models.Index(fields=['video', 'created_at', 'id']),  # keyset pagination of a video's likers
+            models.Index(fields=['user', 'created_at']),  # a user's latest likes (vlog.likes)
+        ]
 
     def __str__(self):
         return f"{self.user.username} liked video {self.video.id}"
 
 
-class VlogLikeCounter(models.Model):
-    video = models.ForeignKey(Video, on_delete=models.CASCADE)
+class VideoCounter(models.Model):
+    '''
+    Base class for the one-to-one counter tables of a video.
+
+    `source` names the related manager on Video whose rows are being counted. Counters are only ever
+    changed with `adjust`, inside the same transaction as the row that was added or removed.
+    '''
+    source = None
+    related_name = None
     count = models.IntegerField(default=0)
 
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def adjust(cls, video, delta):
+        '''
+        Apply `delta` with a single `UPDATE ... SET count = count + delta`.
+
+        The counter row is created on first use, seeded from an exact count of the already written rows.
+        '''
+        if cls.objects.filter(video=video).update(count=F('count') + delta):
+            return
+        counter, created = cls.objects.get_or_create(
+            video=video, defaults={'count': getattr(video, cls.source).count()}
+        )
+        if not created:
+            # Another request created the row between our UPDATE and INSERT
+            cls.objects.filter(pk=counter.pk).update(count=F('count') + delta)
+
+    @classmethod
+    def reconcile(cls):
+        '''
+        Rewrite every counter of this type from the source rows. Returns the number of counters repaired.
+        '''
+        repaired = 0
+        videos = Video.objects.annotate(actual=models.Count(cls.source)).select_related(cls.related_name)
+        for video in videos.iterator():
+            counter = getattr(video, cls.related_name, None)
+            if counter is None:
+                cls.objects.create(video=video, count=video.actual)
+                repaired += 1
+            elif counter.count != video.actual:
+                cls.objects.filter(pk=counter.pk).update(count=video.actual)
+                repaired += 1
+        return repaired
+
+
+class VlogLikeCounter(VideoCounter):
+    source = 'likes'
+    related_name = 'like_counter'
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name=related_name)
+
+
+class VlogCommentCounter(VideoCounter):
+    source = 'comments'
+    related_name = 'comment_counter'
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name=related_name)
+
+
+class VideoIngestJob(models.Model):
+    """
+    A unit of work for the video ingest worker (`manage.py run_ingest_worker`).
 
-class VlogCommentCounter(models.Model):
-    video = models.ForeignKey(Video, on_delete=models.CASCADE)
-    count = models.IntegerField(default=0)
+    The queue lives in the database so no external broker is needed. Workers claim a job with a
+    conditional UPDATE, which is safe to run from several processes at once. Failed jobs are retried
+    with exponential backoff until VIDEO_INGEST_MAX_ATTEMPTS is reached, then the video is marked failed.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='ingest_jobs')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"ingest video {self.video_id} ({self.state})"
+
+    @classmethod
+    def claim_next(cls):
+        """
+        Claim the oldest runnable job and return it, or None when the queue is empty.
+
+        Jobs left `running` by a worker that died are put back in the queue once their lock is
+        older than VIDEO_INGEST_LOCK_TIMEOUT.
+        """
+        now = timezone.now()
+        stale = now - timezone.timedelta(seconds=settings.VIDEO_INGEST_LOCK_TIMEOUT)
+        cls.objects.filter(state=cls.RUNNING, locked_at__lt=stale).update(state=cls.PENDING, locked_at=None)
+
+        candidates = cls.objects.filter(state=cls.PENDING, run_after__lte=now).order_by('run_after', 'id')
+        for job_id in candidates.values_list('id', flat=True)[:10]:
+            # Only one worker can move a given row from pending to running
+            if cls.objects.filter(id=job_id, state=cls.PENDING).update(state=cls.RUNNING, locked_at=now):
+                return cls.objects.select_related('video').get(id=job_id)
+        return None
+
+    def run(self):
+        """
+        Process the video and record the outcome of this attempt.
+        """
+        self.attempts += 1
+        try:
+            self.video.process_upload()
+        except ValidationError as e:
+            # The upload itself is invalid, retrying can't help
+            self.fail(' '.join(e.messages))
+        except Exception as e:
+            logger.exception('Ingest of video %s failed (attempt %s)', self.video_id, self.attempts)
+            if self.attempts >= settings.VIDEO_INGEST_MAX_ATTEMPTS:
+                self.fail(repr(e))
+            else:
+                self.state = self.PENDING
+                self.last_error = repr(e)
+                self.run_after = timezone.now() + timezone.timedelta(
+                    seconds=settings.VIDEO_INGEST_RETRY_DELAY * 2 ** (self.attempts - 1)
+                )
+                self.locked_at = None
+                self.save(update_fields=['state', 'attempts', 'last_error', 'run_after', 'locked_at', 'updated_at'])
+        else:
+            self.state = self.DONE
+            self.locked_at = None
+            self.save(update_fields=['state', 'attempts', 'locked_at', 'updated_at'])
+
+    def fail(self, error):
+        with transaction.atomic():
+            self.state = self.FAILED
+            self.last_error = error
+            self.locked_at = None
+            self.save(update_fields=['state', 'attempts', 'last_error', 'locked_at', 'updated_at'])
+            Video.objects.filter(pk=self.video_id).update(status=Video.FAILED)
+
+
+@receiver([post_save, post_delete], sender=Video)
+def invalidate_cached_video_responses(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_scopes('videos'))
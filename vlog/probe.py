@@ -0,0 +1,244 @@
+'''
+Video Probe
+
+Reads container metadata (duration, dimensions, codec) without decoding any frame.
+
+MP4/MOV files are probed by walking their ISO base media boxes (moov > mvhd / trak > tkhd, stsd) and AVI files
+by reading the RIFF header lists (avih / strh). Only the headers are read, seeking over the media data, so the
+cost does not depend on the file size. Anything the header parser can't handle falls back to `ffprobe` when it
+is installed, and finally to the ffmpeg binary bundled with moviepy.
+
+Usage:
+    with open(path, 'rb') as f:
+        probe = probe_file(f)
+    probe.duration  # seconds (float)
+'''
+
+import json
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from collections import namedtuple
+
+
+ProbeResult = namedtuple('ProbeResult', ['duration', 'width', 'height', 'codec'])
+
+
+class ProbeError(ValueError):
+    pass
+
+
+def _read_box_header(f, end):
+    '''
+    Read an ISO BMFF box header at the current position and return (type, payload_start, box_end).
+    '''
+    start = f.tell()
+    if end - start < 8:
+        return None
+    header = f.read(8)
+    if len(header) < 8:
+        return None
+    size, box_type = struct.unpack('>I4s', header)
+    if size == 1:
+        size = struct.unpack('>Q', f.read(8))[0]
+    elif size == 0:
+        size = end - start
+    if size < 8 or start + size > end:
+        raise ProbeError('Malformed MP4 box.')
+    return box_type, f.tell(), start + size
+
+
+def _iter_boxes(f, start, end):
+    f.seek(start)
+    while True:
+        box = _read_box_header(f, end)
+        if box is None:
+            return
+        yield box
+        f.seek(box[2])
+
+
+def _find_box(f, start, end, box_type):
+    for found_type, payload_start, box_end in _iter_boxes(f, start, end):
+        if found_type == box_type:
+            return payload_start, box_end
+    return None
+
+
+def _probe_mp4(f, file_size):
+    moov = _find_box(f, 0, file_size, b'moov')
+    if moov is None:
+        raise ProbeError('No moov box found.')
+
+    duration = width = height = codec = None
+    for box_type, payload_start, box_end in list(_iter_boxes(f, *moov)):
+        if box_type == b'mvhd':
+            f.seek(payload_start)
+            version = f.read(1)[0]
+            f.seek(3, os.SEEK_CUR)  # flags
+            if version == 1:
+                _created, _modified, timescale, units = struct.unpack('>QQIQ', f.read(28))
+            else:
+                _created, _modified, timescale, units = struct.unpack('>IIII', f.read(16))
+            if timescale:
+                duration = units / timescale
+        elif box_type == b'trak' and codec is None:
+            track = _probe_mp4_track(f, payload_start, box_end)
+            if track is not None:
+                width, height, codec = track
+
+    if duration is None:
+        raise ProbeError('No mvhd box found.')
+    return ProbeResult(duration, width, height, codec)
+
+
+def _probe_mp4_track(f, start, end):
+    '''
+    Return (width, height, codec) for a video track, None for any other track.
+    '''
+    tkhd = _find_box(f, start, end, b'tkhd')
+    mdia = _find_box(f, start, end, b'mdia')
+    if tkhd is None or mdia is None:
+        return None
+    hdlr = _find_box(f, *mdia, b'hdlr')
+    if hdlr is None:
+        return None
+    f.seek(hdlr[0] + 8)  # version/flags + pre_defined
+    if f.read(4) != b'vide':
+        return None
+
+    # width and height are the last two 16.16 fixed point fields of tkhd
+    f.seek(tkhd[1] - 8)
+    width, height = (value >> 16 for value in struct.unpack('>II', f.read(8)))
+
+    codec = None
+    box = mdia
+    for box_type in (b'minf', b'stbl', b'stsd'):
+        box = _find_box(f, *box, box_type)
+        if box is None:
+            break
+    else:
+        f.seek(box[0] + 8)  # version/flags + entry_count
+        entry = _read_box_header(f, box[1])
+        if entry is not None:
+            codec = entry[0].decode('latin-1').strip()
+    return width, height, codec
+
+
+def _probe_avi(f, file_size):
+    f.seek(12)
+    duration = width = height = codec = None
+    stack = [(12, file_size)]
+    while stack:
+        start, end = stack.pop()
+        f.seek(start)
+        while f.tell() + 8 <= end:
+            chunk_id, size = struct.unpack('<4sI', f.read(8))
+            payload_start = f.tell()
+            if chunk_id == b'LIST':
+                list_type = f.read(4)
+                if list_type in (b'hdrl', b'strl'):
+                    stack.append((payload_start + 4, payload_start + size))
+            elif chunk_id == b'avih':
+                us_per_frame, _max_bytes, _padding, _flags, total_frames = struct.unpack('<5I', f.read(20))
+                f.seek(payload_start + 32)
+                width, height = struct.unpack('<II', f.read(8))
+                duration = us_per_frame * total_frames / 1_000_000
+            elif chunk_id == b'strh' and codec is None:
+                stream_type, handler = struct.unpack('<4s4s', f.read(8))
+                if stream_type == b'vids':
+                    codec = handler.decode('latin-1').strip('\x00 ') or None
+            f.seek(payload_start + size + (size & 1))  # chunks are word aligned
+
+    if duration is None:
+        raise ProbeError('No avih header found.')
+    return ProbeResult(duration, width, height, codec)
+
+
+def probe_file(f):
+    '''
+    Probe an open, seekable binary file by parsing its container headers.
+    '''
+    position = f.tell()
+    try:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        f.seek(0)
+        head = f.read(12)
+        try:
+            if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+                return _probe_avi(f, file_size)
+            if head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'):
+                return _probe_mp4(f, file_size)
+        except (struct.error, IndexError) as e:
+            raise ProbeError(f'Malformed video header: {e}')
+        raise ProbeError('Unrecognised video container.')
+    finally:
+        f.seek(position)
+
+
+def ffprobe(path):
+    '''
+    Probe a file with ffprobe, or with moviepy's ffmpeg wrapper when ffprobe is not installed.
+    Neither decodes frames, they only read the stream headers.
+    '''
+    ffprobe_bin = shutil.which('ffprobe')
+    if ffprobe_bin:
+        try:
+            output = subprocess.run(
+                [ffprobe_bin, '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+                 'format=duration:stream=width,height,codec_name', '-of', 'json', path],
+                capture_output=True, check=True, timeout=30,
+            ).stdout
+            info = json.loads(output)
+        except (subprocess.SubprocessError, ValueError) as e:
+            raise ProbeError(f'ffprobe failed: {e}')
+        stream = (info.get('streams') or [{}])[0]
+        duration = info.get('format', {}).get('duration')
+        if duration is None:
+            raise ProbeError('ffprobe could not read the duration.')
+        return ProbeResult(float(duration), stream.get('width'), stream.get('height'), stream.get('codec_name'))
+
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+    try:
+        info = ffmpeg_parse_infos(path)
+    except (IOError, IndexError) as e:
+        raise ProbeError(str(e))
+    width, height = info.get('video_size') or (None, None)
+    return ProbeResult(info['duration'], width, height, None)
+
+
+def probe_path(path):
+    '''
+    Probe a local file: header parse first, ffprobe as a fallback.
+    '''
+    with open(path, 'rb') as f:
+        try:
+            return probe_file(f)
+        except ProbeError:
+            pass
+    return ffprobe(path)
+
+
+def probe_upload(upload):
+    '''
+    Probe an UploadedFile without copying it when possible.
+
+    The headers are parsed straight from the upload. The ffprobe fallback needs a path: uploads Django already
+    spooled to disk (TemporaryUploadedFile) are probed in place, small in-memory ones are written out once.
+    '''
+    try:
+        return probe_file(upload)
+    except ProbeError:
+        pass
+
+    if hasattr(upload, 'temporary_file_path'):
+        return ffprobe(upload.temporary_file_path())
+
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(upload.name)[1]) as temp_video:
+        for chunk in upload.chunks():
+            temp_video.write(chunk)
+        temp_video.flush()
+        return ffprobe(temp_video.name)
@@ -1,77 +1,117 @@
-import os
 from rest_framework import serializers
+from .likes import video_likes
 from .models import Video, VlogComment
-import tempfile
-from moviepy.editor import VideoFileClip
+from .probe import ProbeError, probe_path, probe_upload
+from django.db import models, transaction
 from rest_framework.exceptions import ValidationError
-from profile_app.serializers import ProfileSerializer
-from authentication.models import CustomUser
+from media_app.models import UploadSession
+from media_app.serializers import RenditionField, RenditionListSerializer, UploadSessionField
+
+
+class VideoListSerializer(RenditionListSerializer):
+    '''
+    Resolves the viewer's liked state for the whole page with one lookup (see post.likes).
+    '''
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if not all(hasattr(item, 'liked') for item in items):
+            request = self.context.get('request')
+            self.context['liked_videos'] = video_likes.liked_ids(getattr(request, 'user', None), items)
+        return super().to_representation(items)
 
 
 class VideoSerializer(serializers.ModelSerializer):
     custom_user_id = serializers.ReadOnlyField(source='author.id')
     profile_id = serializers.ReadOnlyField(source='author.profile.id')
-    avatar = serializers.ImageField(source='author.avatar', read_only=True)
+    avatar = RenditionField(source='author.avatar', width=96, read_only=True)
     like_count = serializers.IntegerField(read_only=True)
     comment_count = serializers.IntegerField(read_only=True)
     username = serializers.CharField(source='author.username', read_only=True)
     liked = serializers.SerializerMethodField()
-    video_thumb = serializers.SerializerMethodField()
+    video_thumb = RenditionField(source='thumbnail', width=640, read_only=True)
+    upload_id = UploadSessionField(kind=UploadSession.VIDEO)
 
     class Meta:
         model = Video
-        fields = ['id', 'custom_user_id', 'profile_id', 'username', 'avatar', 'description', 'video', 'duration', 'created_at', 'updated_at', 'like_count', 'comment_count', 'liked', 'video_thumb']
+        fields = ['id', 'custom_user_id', 'profile_id', 'username', 'avatar', 'description', 'video', 'upload_id', 'duration', 'width', 'height', 'status', 'created_at', 'updated_at', 'like_count', 'comment_count', 'liked', 'video_thumb']
+        read_only_fields = ['duration', 'width', 'height', 'status']
+        extra_kwargs = {'video': {'required': False}}
+        list_serializer_class = VideoListSerializer
 
     def get_liked(self, obj):
-        request = self.context.get('request')
-        if request and hasattr(request, 'user') and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
+        # Set by querysets that annotate it, e.g. the home timeline
+        if hasattr(obj, 'liked'):
+            return obj.liked
+        if 'liked_videos' in self.context:
+            return obj.pk in self.context['liked_videos']
 
-    def get_video_thumb(self, obj):
         request = self.context.get('request')
-        if obj.thumbnail:
-            return request.build_absolute_uri(obj.thumbnail.url)
-        return None
-    
-    def validate_video(self, video):
-        with tempfile.NamedTemporaryFile(delete=False) as temp_video:
-            for chunk in video.chunks():
-                temp_video.write(chunk)
-            temp_video_path = temp_video.name
+        return obj.pk in video_likes.liked_ids(getattr(request, 'user', None), [obj])
 
-        try:
-            video_clip = VideoFileClip(temp_video_path)
-            duration_seconds = video_clip.duration
-            if duration_seconds > 15:
-                raise ValidationError("Video duration exceeds the maximum allowed duration of 15 seconds.")
-        finally:
-            video_clip.close()
-            os.remove(temp_video_path)
+    def _check_probe(self, probe):
+        if probe.duration > 15:
+            raise ValidationError("Video duration exceeds the maximum allowed duration of 15 seconds.")
 
+    def validate_video(self, video):
+        # Only the container headers are read, the probe is kept on the upload for create()
+        try:
+            video.probe = probe_upload(video)
+        except ProbeError:
+            raise ValidationError("Unable to read the video file.")
+        self._check_probe(video.probe)
         return video
 
+    def validate(self, attrs):
+        """
+        Accept either a `video` file or the `upload_id` of a complete chunked upload.
+        Uploads on local storage are probed here; on remote storage the ingest worker probes them.
+        """
+        upload = attrs.pop('upload_id', None)
+        if upload is not None:
+            if attrs.get('video'):
+                raise ValidationError("Send either a video file or an upload_id, not both.")
+            try:
+                path = Video._meta.get_field('video').storage.path(upload.key)
+            except NotImplementedError:
+                path = None
+            if path:
+                try:
+                    self.upload_probe = probe_path(path)
+                except ProbeError:
+                    raise ValidationError({'upload_id': "Unable to read the video file."})
+                self._check_probe(self.upload_probe)
+            self.upload = upload
+            attrs['video'] = upload.key
+        elif self.instance is None and not attrs.get('video'):
+            raise ValidationError({'video': "Either a video file or an upload_id is required."})
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        upload = getattr(self, 'upload', None)
+        if upload is not None and not upload.attach():
+            raise ValidationError({'upload_id': "This upload is already attached."})
+        instance = Video(**validated_data)
+        probe = getattr(validated_data.get('video'), 'probe', None) or getattr(self, 'upload_probe', None)
+        if probe is not None:
+            instance.apply_probe(probe)
+        instance.save()
+        return instance
+
 
 class VlogCommentSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     custom_user_id = serializers.ReadOnlyField(source='user.id')
     profile_id = serializers.ReadOnlyField(source='user.profile.id')
-    avatar = serializers.ImageField(source='user.avatar', read_only=True)
+    avatar = RenditionField(source='user.avatar', width=96, read_only=True)
 
     class Meta:
         model = VlogComment
         fields = ('id', 'custom_user_id', 'profile_id', 'username','avatar', 'content', 'created_at', 'updated_at')
         read_only_fields = ('id', 'custom_user_id', 'created_at', 'updated_at')
+        list_serializer_class = RenditionListSerializer
 
 
 class VlogLikeToggleSerializer(serializers.Serializer):
     video_id = serializers.PrimaryKeyRelatedField(queryset=Video.objects.all())
-
-
-
-class VideoLikersSerializer(serializers.ModelSerializer):
-    profile = ProfileSerializer(read_only=True)
-
-    class Meta:
-        model = CustomUser
-        fields = ('profile',)
\ No newline at end of file
@@ -1,3 +1,239 @@
-from django.test import TestCase
+import io
+import os
+import struct
+import subprocess
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from imageio_ffmpeg import get_ffmpeg_exe
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from .models import Video, VideoIngestJob, VlogLike, local_video_copy
+from .probe import ProbeError, ProbeResult, probe_file, probe_path
 
-# Create your tests here.
+LOCAL_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class VideoFeedLikedStateTests(TestCase):
+    '''
+    The viewer's liked state of a whole video page comes from one query, not one per video, and sees every like.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user('viewer@example.com', 'pass1234', username='viewer')
+        cls.videos = [Video.objects.create(author=cls.viewer, description=f'video {i}', status=Video.READY) for i in range(10)]
+        for video in cls.videos[::2]:
+            VlogLike.objects.create(video=video, user=cls.viewer)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def liked(self):
+        return {video['id']: video['liked'] for video in self.client.get('/videos/').data['results']}
+
+    def test_liked_state_is_batched(self):
+        # the page, the viewer's likes among it, the renditions of the page
+        with self.assertNumQueries(3):
+            response = self.client.get('/videos/')
+        liked = {video['id']: video['liked'] for video in response.data['results']}
+        self.assertEqual(liked, {video.id: i % 2 == 0 for i, video in enumerate(self.videos)})
+
+    def test_likes_written_elsewhere_are_seen(self):
+        self.assertFalse(self.liked()[self.videos[1].id])
+        # e.g. by another process, or by the admin
+        VlogLike.objects.create(video=self.videos[1], user=self.viewer)
+        self.assertTrue(self.liked()[self.videos[1].id])
+        self.assertTrue(self.client.get(f'/videos/{self.videos[1].id}/').data['liked'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/videos/toggle-like/', {'video_id': self.videos[1].id}, format='json')
+        self.assertFalse(self.liked()[self.videos[1].id])
+
+
+def _clip(seconds=2):
+    '''
+    Encode a tiny test pattern clip with the bundled ffmpeg and return its bytes.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'clip.mp4')
+        subprocess.run(
+            [get_ffmpeg_exe(), '-v', 'error', '-y', '-f', 'lavfi', '-i', f'testsrc=duration={seconds}:size=64x48:rate=10',
+             '-pix_fmt', 'yuv420p', path],
+            check=True, capture_output=True, timeout=60,
+        )
+        with open(path, 'rb') as clip:
+            return clip.read()
+
+
+class VideoIngestTests(TestCase):
+    '''
+    Ingest jobs are claimed once, retried with exponential backoff and processed by the worker command.
+    '''
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storage = override_settings(STORAGES=LOCAL_STORAGES, MEDIA_ROOT=media.name)
+        storage.enable()
+        self.addCleanup(storage.disable)
+        self.user = CustomUser.objects.create_user('alice@example.com', 'pass1234', username='alice')
+
+    def job(self, **fields):
+        video = Video.objects.create(author=self.user, title='video')
+        return VideoIngestJob.objects.create(video=video, **fields)
+
+    def test_claim_next_takes_the_oldest_runnable_job_once(self):
+        later = self.job(run_after=timezone.now() + timedelta(minutes=5))
+        first = self.job(run_after=timezone.now() - timedelta(minutes=2))
+        second = self.job(run_after=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(VideoIngestJob.claim_next(), first)
+        self.assertEqual(VideoIngestJob.claim_next(), second)
+        self.assertIsNone(VideoIngestJob.claim_next())
+        later.refresh_from_db()
+        self.assertEqual(later.state, VideoIngestJob.PENDING)
+
+    def test_jobs_of_dead_workers_are_claimed_again(self):
+        stale = timezone.now() - timedelta(seconds=settings.VIDEO_INGEST_LOCK_TIMEOUT + 1)
+        job = self.job(state=VideoIngestJob.RUNNING, locked_at=stale)
+        self.job(state=VideoIngestJob.RUNNING, locked_at=timezone.now())
+        self.assertEqual(VideoIngestJob.claim_next(), job)
+        self.assertIsNone(VideoIngestJob.claim_next())
+
+    @mock.patch.object(Video, 'process_upload', side_effect=OSError('storage unavailable'))
+    def test_failures_back_off_exponentially_then_fail_the_video(self, process_upload):
+        job = self.job()
+        for attempt in range(1, settings.VIDEO_INGEST_MAX_ATTEMPTS):
+            started = timezone.now()
+            with self.assertLogs('vlog.models', 'ERROR'):
+                job.run()
+            job.refresh_from_db()
+            self.assertEqual((job.state, job.attempts), (VideoIngestJob.PENDING, attempt))
+            self.assertIsNone(job.locked_at)
+            delay = timedelta(seconds=settings.VIDEO_INGEST_RETRY_DELAY * 2 ** (attempt - 1))
+            self.assertTrue(started + delay <= job.run_after <= timezone.now() + delay)
+
+        with self.assertLogs('vlog.models', 'ERROR'):
+            job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.state, VideoIngestJob.FAILED)
+        self.assertIn('storage unavailable', job.last_error)
+        self.assertEqual(Video.objects.get(pk=job.video_id).status, Video.FAILED)
+
+    @mock.patch.object(Video, 'process_upload', side_effect=ValidationError('Video duration should not exceed 0:00:15.'))
+    def test_invalid_uploads_fail_without_retry(self, process_upload):
+        job = self.job()
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (VideoIngestJob.FAILED, 1))
+        self.assertEqual(Video.objects.get(pk=job.video_id).status, Video.FAILED)
+
+    def test_worker_probes_and_thumbnails_new_uploads(self):
+        video = Video.objects.create(author=self.user, title='video', video=ContentFile(_clip(), name='clip.mp4'))
+        # TestCase runs in one transaction, which the worker's close_old_connections() would end
+        with mock.patch('vlog.management.commands.run_ingest_worker.close_old_connections'):
+            call_command('run_ingest_worker', '--once', stdout=io.StringIO())
+
+        video.refresh_from_db()
+        self.assertEqual(video.status, Video.READY)
+        self.assertAlmostEqual(video.duration.total_seconds(), 2, places=1)
+        self.assertEqual((video.width, video.height), (64, 48))
+        self.assertTrue(video.thumbnail.name.endswith('.jpg'))
+        self.assertEqual(VideoIngestJob.objects.get(video=video).state, VideoIngestJob.DONE)
+
+    def test_local_video_copy_lets_errors_of_the_caller_through(self):
+        video = Video.objects.create(author=self.user, title='video', video=ContentFile(b'data', name='clip.mp4'))
+        with self.assertRaises(NotImplementedError):
+            with local_video_copy(video.video):
+                raise NotImplementedError
+
+        # a storage without local paths is copied to a temporary file, removed on exit
+        stored = video.video.path
+        with mock.patch.object(type(video.video), 'path', new_callable=mock.PropertyMock, side_effect=NotImplementedError):
+            with local_video_copy(video.video) as path:
+                with open(path, 'rb') as copy:
+                    self.assertEqual(copy.read(), b'data')
+        self.assertNotEqual(path, stored)
+        self.assertFalse(os.path.exists(path))
+
+
+def _box(box_type, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _mp4(timescale=1000, units=2500, width=640, height=360, codec=b'avc1'):
+    '''
+    The smallest MP4 header the probe reads: mvhd, and a video track with tkhd, hdlr and one stsd entry.
+    '''
+    mvhd = _box(b'mvhd', bytes(4) + struct.pack('>IIII', 0, 0, timescale, units) + bytes(80))
+    tkhd = _box(b'tkhd', bytes(76) + struct.pack('>II', width << 16, height << 16))
+    hdlr = _box(b'hdlr', bytes(8) + b'vide' + bytes(12))
+    stsd = _box(b'stsd', bytes(4) + struct.pack('>I', 1) + _box(codec, bytes(8)))
+    mdia = _box(b'mdia', hdlr + _box(b'minf', _box(b'stbl', stsd)))
+    return _box(b'ftyp', b'isom' + bytes(4)) + _box(b'moov', mvhd + _box(b'trak', tkhd + mdia)) + _box(b'mdat', bytes(64))
+
+
+def _chunk(chunk_id, payload):
+    return struct.pack('<4sI', chunk_id, len(payload)) + payload + bytes(len(payload) & 1)
+
+
+def _avi(us_per_frame=40000, frames=75, width=320, height=240, handler=b'H264'):
+    avih = _chunk(b'avih', struct.pack('<10I', us_per_frame, 0, 0, 0, frames, 0, 1, 0, width, height) + bytes(16))
+    strh = _chunk(b'strh', b'vids' + handler + bytes(48))
+    strl = _chunk(b'LIST', b'strl' + strh)
+    hdrl = _chunk(b'LIST', b'hdrl' + avih + strl)
+    body = b'AVI ' + hdrl + _chunk(b'LIST', b'movi')
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+class VideoProbeTests(TestCase):
+    '''
+    Container headers are parsed without ffmpeg; anything else goes to ffprobe.
+    '''
+
+    def test_mp4_header(self):
+        self.assertEqual(probe_file(io.BytesIO(_mp4())), ProbeResult(2.5, 640, 360, 'avc1'))
+
+    def test_avi_header(self):
+        self.assertEqual(probe_file(io.BytesIO(_avi())), ProbeResult(3.0, 320, 240, 'H264'))
+
+    def test_probe_leaves_the_file_position_alone(self):
+        upload = io.BytesIO(_mp4())
+        upload.seek(10)
+        probe_file(upload)
+        self.assertEqual(upload.tell(), 10)
+
+    def test_malformed_headers_raise_probe_error(self):
+        truncated = _mp4()[:60]
+        for data in (truncated, _avi()[:40], b'RIFF', b'not a video at all', _box(b'ftyp', b'isom') + _box(b'mdat')):
+            with self.subTest(data=data[:12]), self.assertRaises(ProbeError):
+                probe_file(io.BytesIO(data))
+
+    def test_unparsed_files_fall_back_to_ffprobe(self):
+        output = b'{"streams": [{"width": 64, "height": 48, "codec_name": "vp9"}], "format": {"duration": "1.5"}}'
+        with tempfile.NamedTemporaryFile(suffix='.webm') as video:
+            video.write(b'\x1aE\xdf\xa3 matroska')
+            video.flush()
+            with mock.patch('vlog.probe.shutil.which', return_value='/usr/bin/ffprobe'), \
+                    mock.patch('vlog.probe.subprocess.run', return_value=subprocess.CompletedProcess([], 0, output)) as run:
+                self.assertEqual(probe_path(video.name), ProbeResult(1.5, 64, 48, 'vp9'))
+            self.assertEqual(run.call_args.args[0][-1], video.name)
+
+            with mock.patch('vlog.probe.shutil.which', return_value='/usr/bin/ffprobe'), \
+                    mock.patch('vlog.probe.subprocess.run', side_effect=subprocess.CalledProcessError(1, 'ffprobe')):
+                with self.assertRaises(ProbeError):
+                    probe_path(video.name)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import VideoDetailView, VlogCommentList, VideoComments, VlogLikeToggleView, VideoLikersList, VideoListView, VideoCreateView
+from .views import VideoDetailView, VlogCommentList, VideoComments, VlogLikeToggleView, VideoLikeView, VideoLikersList, VideoListView, VideoCreateView
 
 urlpatterns = [
     # URL pattern for listing all videos / creating a new video
@@ -14,5 +14,6 @@ urlpatterns = [
    
     # Like endpoints
     path('videos/<int:pk>/likers/', VideoLikersList.as_view(), name='video-likers-list'),
+    path('videos/<int:pk>/like/', VideoLikeView.as_view(), name='video-like'),
     path('videos/toggle-like/', VlogLikeToggleView.as_view(), name='toggle-like'),
 ]
@@ -1,34 +1,37 @@
 from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Video, VlogLike, VlogCommentCounter, VlogLikeCounter
-from authentication.pagination import CustomPageNumberPagination
-from .serializers import VideoSerializer, VlogComment, VlogCommentSerializer, VlogLikeToggleSerializer, VideoLikersSerializer
-from authentication.models import Block, CustomUser
+from .models import Video, VlogCommentCounter
+from authentication.pagination import CustomPageNumberPagination, CreatedAtCursorPagination
+from .serializers import VideoSerializer, VlogComment, VlogCommentSerializer, VlogLikeToggleSerializer
+from authentication.blocking import exclude_blocked
+from trend.instrumentation import TimedSerializationMixin
+from trend.response_cache import AnonymousResponseCacheMixin
+from post.serializers import LikerSerializer
+from .likes import video_likes
 
 
-class VideoListView(generics.ListAPIView):
+class VideoListView(AnonymousResponseCacheMixin, TimedSerializationMixin, generics.ListAPIView):
     """
     API view to retrieve list of videos.
     """
-    queryset = Video.objects.all().order_by('-created_at')
+    queryset = Video.objects.select_related('author__profile', 'like_counter', 'comment_counter').order_by('-created_at')
     serializer_class = VideoSerializer
     # permission_classes = [IsAuthenticated]
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
+    cache_scopes = ('videos', 'profiles')
 
     def get_queryset(self):
         """
         Optionally restricts the returned videos to those not blocked by the author.
+        Videos still in the ingest pipeline are not listed.
         """
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().filter(status=Video.READY)
         user = self.request.user
-        if user.is_authenticated:
-            blocked_users = Block.objects.filter(blocker=user).values_list('blocked', flat=True)
-            blocked_by_users = Block.objects.filter(blocked=user).values_list('blocker', flat=True)
-            users_to_exclude = list(set(blocked_users).union(set(blocked_by_users)))
-            queryset = Video.objects.exclude(author__in=users_to_exclude)
+        queryset = exclude_blocked(queryset, user, field='author')
         return queryset.order_by('-created_at')
 
 
@@ -43,20 +46,21 @@ class VideoCreateView(generics.CreateAPIView):
     def perform_create(self, serializer):
         """
         Set the author of the video to the currently authenticated user.
+        The response is returned right away with the `processing` status; the ingest worker finishes the upload.
         """
         serializer.save(author=self.request.user)
 
 
-class VideoDetailView(generics.RetrieveUpdateDestroyAPIView):
+class VideoDetailView(TimedSerializationMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     API view to retrieve, update, or delete a video instance.
     """
-    queryset = Video.objects.all()
+    queryset = Video.objects.select_related('author__profile', 'like_counter', 'comment_counter')
     serializer_class = VideoSerializer
     permission_classes = [IsAuthenticated]  
 
 
-class VlogCommentList(generics.ListCreateAPIView):
+class VlogCommentList(TimedSerializationMixin, generics.ListCreateAPIView):
     """
 
     API view to create comments for a video,
@@ -66,7 +70,7 @@ class VlogCommentList(generics.ListCreateAPIView):
         "content" : "new comment from rania1"
     }
     """
-    queryset = VlogComment.objects.all()
+    queryset = VlogComment.objects.select_related('user__profile')
     serializer_class = VlogCommentSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPageNumberPagination
@@ -74,68 +78,63 @@ class VlogCommentList(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         video_id = self.request.data.get('video_id')
         video = Video.objects.get(id=video_id)
-        serializer.save(user=self.request.user, video=video)
-        # Update comment counter
-        comment_counter, created = VlogCommentCounter.objects.get_or_create(video=video)
-        comment_counter.count = video.comment_count()
-        comment_counter.save()
+        with transaction.atomic():
+            serializer.save(user=self.request.user, video=video)
+            # Update comment counter
+            VlogCommentCounter.adjust(video, 1)
 
 
 class VlogLikeToggleView(APIView):
+    """
+        Like a video, or remove the like when there is one, as the authenticated user.
+        Prefer PUT / DELETE on videos/<pk>/like/, which are idempotent.
+    """
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
         serializer = VlogLikeToggleSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        validated_data = serializer.validated_data
-
-        video = validated_data['video_id']
-
-        # user = validated_data['user']
-
-        try:
-            # Check if the user has already liked the video
-            like = VlogLike.objects.get(video=video, user=request.user)
-            # If the user has already liked the video, unlike it
-            like.delete()
-            # message = "Video unliked successfully."
-            liked = False
-        except VlogLike.DoesNotExist:
-            # If the user has not liked the video, like it
-            VlogLike.objects.create(video=video, user=request.user)
-            # message = "Video liked successfully."
-            liked = True
-
-        # Update like counter (increase/decrease)
-        like_counter, created = VlogLikeCounter.objects.get_or_create(video=video)
-        like_counter.count = video.like_count()
-        like_counter.save()
-
+        liked = video_likes.toggle(request.user, serializer.validated_data['video_id'])
         return Response({"liked": liked}, status=status.HTTP_200_OK)
 
 
-class VideoLikersList(generics.ListAPIView):
+class VideoLikeView(APIView):
     """
-        List all post Likers.
+        PUT likes the video and DELETE removes the like, as the authenticated user.
+        Both are idempotent: repeating one changes nothing and returns the same response.
+
+        Endpoint: videos/<pk>/like/
+        Example response: {"liked": true}
     """
-    serializer_class = VideoLikersSerializer
-    pagination_class = CustomPageNumberPagination
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self):
+        return get_object_or_404(Video.objects.only('id', 'created_at'), pk=self.kwargs['pk'])
+
+    def put(self, request, *args, **kwargs):
+        video_likes.like(request.user, self.get_object())
+        return Response({"liked": True}, status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        video_likes.unlike(request.user, self.get_object())
+        return Response({"liked": False}, status=status.HTTP_200_OK)
+
+
+class VideoLikersList(TimedSerializationMixin, generics.ListAPIView):
+    """
+        List the likers of a video, latest like first.
+    """
+    serializer_class = LikerSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        video_id = self.kwargs.get('pk')
-        request_user = self.request.user
-        # Get list of blocked user IDs
-        blocked_users = Block.objects.filter(blocker=request_user).values_list('blocked', flat=True)
-        blocked_by_users = Block.objects.filter(blocked=request_user).values_list('blocker', flat=True)
-        users_to_exclude = list(set(blocked_users).union(set(blocked_by_users)))
-        likers_ids = VlogLike.objects.filter(video_id=video_id).values_list('user_id', flat=True).order_by('-created_at')
-        return CustomUser.objects.filter(id__in=likers_ids).exclude(id__in=users_to_exclude)
+        return video_likes.likers(self.kwargs.get('pk'), self.request.user)
 
 
-class VideoComments(generics.ListAPIView):
+class VideoComments(TimedSerializationMixin, generics.ListAPIView):
     serializer_class = VlogCommentSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         video_id = self.kwargs['pk']  # Get the video ID from the URL parameter
@@ -145,8 +144,5 @@ class VideoComments(generics.ListAPIView):
         if not request_user.is_authenticated:
             # Handle case when user is not authenticated
             return VlogComment.objects.none()
-        # Get list of blocked user IDs
-        blocked_users = Block.objects.filter(blocker=request_user).values_list('blocked', flat=True)
-        blocked_by_users = Block.objects.filter(blocked=request_user).values_list('blocker', flat=True)
-        users_to_exclude = list(set(blocked_users).union(set(blocked_by_users)))
-        return VlogComment.objects.filter(video=video).exclude(user__in=users_to_exclude).order_by('-created_at')
\ No newline at end of file
+        # Exclude comments from blocked users
+        return exclude_blocked(VlogComment.objects.filter(video=video).select_related('user__profile'), request_user).order_by('-created_at')
\ No newline at end of file